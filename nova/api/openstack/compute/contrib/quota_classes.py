@@ -80,6 +80,7 @@ class QuotaClassSetsController(object):
                     db.quota_class_create(context, quota_class, key, value)
                 except exception.AdminRequired:
                     raise webob.exc.HTTPForbidden()
+                quota.invalidate_cache(quota_class=quota_class)
         return {'quota_class_set': QUOTAS.get_class_quotas(context,
                                                            quota_class)}
 
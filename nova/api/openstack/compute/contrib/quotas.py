@@ -202,6 +202,7 @@ class QuotaSetsController(object):
                                 user_id=user_id)
             except exception.AdminRequired:
                 raise webob.exc.HTTPForbidden()
+            quota.invalidate_cache(project_id=project_id, user_id=user_id)
         return {'quota_set': self._get_quotas(context, id, user_id=user_id)}
 
     @wsgi.serializers(xml=QuotaTemplate)
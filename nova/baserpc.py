@@ -21,6 +21,7 @@ Base RPC client and server common to all services.
 from oslo.config import cfg
 
 from nova.openstack.common import jsonutils
+from nova.openstack.common.rpc import stats as rpc_stats
 from nova import rpcclient
 
 
@@ -40,6 +41,7 @@ class BaseAPI(rpcclient.RpcProxy):
 
         1.0 - Initial version.
         1.1 - Add get_backdoor_port
+        1.2 - Add get_rpc_stats
     """
 
     #
@@ -74,12 +76,16 @@ class BaseAPI(rpcclient.RpcProxy):
         cctxt = self.client.prepare(server=host, version='1.1')
         return cctxt.call(context, 'get_backdoor_port')
 
+    def get_rpc_stats(self, context, host):
+        cctxt = self.client.prepare(server=host, version='1.2')
+        return cctxt.call(context, 'get_rpc_stats')
+
 
 class BaseRPCAPI(object):
     """Server side of the base RPC API."""
 
     RPC_API_NAMESPACE = _NAMESPACE
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
 
     def __init__(self, service_name, backdoor_port):
         self.service_name = service_name
@@ -91,3 +97,7 @@ class BaseRPCAPI(object):
 
     def get_backdoor_port(self, context):
         return self.backdoor_port
+
+    def get_rpc_stats(self, context):
+        """Dump the rpc latency histograms of this service."""
+        return rpc_stats.get_stats()
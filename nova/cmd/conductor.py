@@ -38,5 +38,6 @@ def main():
     server = service.Service.create(binary='nova-conductor',
                                     topic=CONF.conductor.topic,
                                     manager=CONF.conductor.manager)
-    service.serve(server, workers=CONF.conductor.workers)
+    service.serve(server, workers=CONF.conductor.workers,
+                  rolling_restart=True)
     service.wait()
@@ -81,6 +81,8 @@ from nova import servicegroup
 from nova import version
 
 CONF = cfg.CONF
+CONF.import_opt('instance_scan_batch_size', 'nova.compute.manager')
+CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
 CONF.import_opt('network_manager', 'nova.service')
 CONF.import_opt('service_down_time', 'nova.service')
 CONF.import_opt('flat_network_bridge', 'nova.network.manager')
@@ -233,17 +235,17 @@ class ProjectCommands(object):
 
         ctxt = context.get_admin_context()
         if user_id:
-            quota = QUOTAS.get_user_quotas(ctxt, project_id, user_id)
+            quotas = QUOTAS.get_user_quotas(ctxt, project_id, user_id)
         else:
             user_id = None
-            quota = QUOTAS.get_project_quotas(ctxt, project_id)
+            quotas = QUOTAS.get_project_quotas(ctxt, project_id)
         # if key is None, that means we need to show the quotas instead
         # of updating them
         if key:
             settable_quotas = QUOTAS.get_settable_quotas(ctxt,
                                                          project_id,
                                                          user_id=user_id)
-            if key in quota:
+            if key in quotas:
                 minimum = settable_quotas[key]['minimum']
                 maximum = settable_quotas[key]['maximum']
                 if value.lower() == 'unlimited':
@@ -264,10 +266,12 @@ class ProjectCommands(object):
                 except exception.QuotaExists:
                     db.quota_update(ctxt, project_id, key, value,
                                     user_id=user_id)
+                quota.invalidate_cache(project_id=project_id,
+                                       user_id=user_id)
             else:
                 print(_('%(key)s is not a valid quota key. Valid options are: '
                         '%(options)s.') % {'key': key,
-                                           'options': ', '.join(quota)})
+                                           'options': ', '.join(quotas)})
                 return(2)
         print_format = "%-36s %-10s %-10s %-10s"
         print(print_format % (
@@ -277,15 +281,22 @@ class ProjectCommands(object):
                     _('Reserved')))
         # Retrieve the quota after update
         if user_id:
-            quota = QUOTAS.get_user_quotas(ctxt, project_id, user_id)
+            quotas = QUOTAS.get_user_quotas(ctxt, project_id, user_id)
         else:
-            quota = QUOTAS.get_project_quotas(ctxt, project_id)
-        for key, value in quota.iteritems():
+            quotas = QUOTAS.get_project_quotas(ctxt, project_id)
+        for key, value in quotas.iteritems():
             if value['limit'] < 0 or value['limit'] is None:
                 value['limit'] = 'unlimited'
             print(print_format % (key, value['limit'], value['in_use'],
                                   value['reserved']))
 
+    def flush_quota_cache(self):
+        """Drops the cached quota limits of all projects."""
+        quota.flush_cache()
+        if not CONF.memcached_servers:
+            print(_('Quota limits are cached by each service process and '
+                    'expire there after %d seconds.') % CONF.quota_cache_ttl)
+
     @args('--project', dest='project_id', metavar='<Project name>',
             help='Project name')
     def scrub(self, project_id):
@@ -632,6 +643,26 @@ class NetworkCommands(object):
 class VmCommands(object):
     """Class for mangaging VM instances."""
 
+    _list_columns = ['display_name', 'host', 'vm_state', 'launched_at',
+                     'image_ref', 'kernel_id', 'ramdisk_id', 'project_id',
+                     'user_id', 'availability_zone', 'launch_index',
+                     'system_metadata']
+
+    def _iter_instances(self, ctxt, filters):
+        """Yield the listed columns of the instances matching filters,
+        one page of instance_scan_batch_size instances at a time.
+        """
+        batch_size = CONF.instance_scan_batch_size
+        marker = None
+        while True:
+            instances = db.instance_get_columns_by_filters(ctxt, filters,
+                    self._list_columns, limit=batch_size, marker=marker)
+            for instance in instances:
+                yield instance
+            if len(instances) < batch_size:
+                return
+            marker = instances[-1]['uuid']
+
     @args('--host', metavar='<host>', help='Host')
     def list(self, host=None):
         """Show a list of all instances."""
@@ -650,13 +681,11 @@ class VmCommands(object):
                                              _('zone'),
                                              _('index'))))
 
-        if host is None:
-            instances = db.instance_get_all(context.get_admin_context())
-        else:
-            instances = db.instance_get_all_by_host(
-                           context.get_admin_context(), host)
-
-        for instance in instances:
+        filters = {'deleted': False, 'soft_deleted': True}
+        if host is not None:
+            filters['host'] = host
+        for instance in self._iter_instances(context.get_admin_context(),
+                                             filters):
             instance_type = flavors.extract_flavor(instance)
             print(("%-10s %-15s %-10s %-10s %-26s %-9s %-9s %-9s"
                    " %-10s %-10s %-10s %-5d" % (instance['display_name'],
@@ -1621,7 +1621,8 @@ class API(base.Base):
     def get_active_by_window(self, context, begin, end=None, project_id=None):
         """Get instances that were continuously active over a window."""
         return self.db.instance_get_active_by_window_joined(context, begin,
-                                                     end, project_id)
+                                                     end, project_id,
+                                                     use_slave=True)
 
     #NOTE(bcwaldon): this doesn't really belong in this class
     def get_instance_type(self, context, instance_type_id):
@@ -36,6 +36,7 @@ import time
 import traceback
 import uuid
 
+from eventlet import greenpool
 from eventlet import greenthread
 from oslo.config import cfg
 
@@ -113,6 +114,11 @@ compute_opts = [
     cfg.IntOpt('network_allocate_retries',
                default=0,
                help="Number of times to retry network allocation on failures"),
+    cfg.IntOpt('instance_scan_batch_size',
+               default=1000,
+               help='Number of instances fetched from the database at a time '
+                    'by the periodic tasks that go through all the '
+                    'instances of the host'),
     ]
 
 interval_opts = [
@@ -127,6 +133,14 @@ interval_opts = [
                default=60,
                help="Number of seconds between instance info_cache self "
                         "healing updates"),
+    cfg.IntOpt('heal_instance_info_cache_batch_size',
+               default=10,
+               help='Maximum number of instances whose info_cache is '
+                    'refreshed by each self healing update'),
+    cfg.IntOpt('heal_instance_info_cache_concurrency',
+               default=4,
+               help='Number of info_cache refreshes a self healing update '
+                    'runs against the network API at the same time'),
     cfg.IntOpt('host_state_interval',
                default=120,
                help='Interval in seconds for querying the host status'),
@@ -419,7 +433,7 @@ class ComputeVirtAPI(virtapi.VirtAPI):
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
 
-    RPC_API_VERSION = '2.47'
+    RPC_API_VERSION = '2.48'
 
     def __init__(self, compute_driver=None, *args, **kwargs):
         """Load configuration options and connect to the hypervisor."""
@@ -430,6 +444,9 @@ class ComputeManager(manager.SchedulerDependentManager):
         self._last_bw_usage_poll = 0
         self._last_vol_usage_poll = 0
         self._last_info_cache_heal = 0
+        self._info_cache_invalidated = set()
+        # { instance uuid : when its info cache was last healed here }
+        self._info_cache_healed_at = {}
         self._last_bw_usage_cell_update = 0
         self.compute_api = compute.API()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
@@ -471,13 +488,16 @@ class ComputeManager(manager.SchedulerDependentManager):
         instance_ref = self.conductor_api.instance_update(context,
                                                           instance_uuid,
                                                           **kwargs)
-        if (instance_ref['host'] == self.host and
-                self.driver.node_is_available(instance_ref['node'])):
-            rt = self._get_resource_tracker(instance_ref.get('node'))
-            rt.update_usage(context, instance_ref)
-
+        self._update_resource_tracker(context, instance_ref)
         return instance_ref
 
+    def _update_resource_tracker(self, context, instance):
+        """Let the resource tracker know about a change of an instance."""
+        if (instance['host'] == self.host and
+                self.driver.node_is_available(instance['node'])):
+            rt = self._get_resource_tracker(instance.get('node'))
+            rt.update_usage(context, instance)
+
     def _set_instance_error_state(self, context, instance_uuid):
         try:
             self._instance_update(context, instance_uuid,
@@ -1747,6 +1767,9 @@ class ComputeManager(manager.SchedulerDependentManager):
             instance.task_state = None
             instance.terminated_at = timeutils.utcnow()
             instance.save()
+            # Give back the resources of the instance right away rather
+            # than at the next audit of the resource tracker.
+            self._update_resource_tracker(context, instance)
             system_meta = utils.instance_sys_meta(instance)
             self.conductor_api.instance_destroy(
                 context, obj_base.obj_to_primitive(instance))
@@ -3004,10 +3027,12 @@ class ComputeManager(manager.SchedulerDependentManager):
             network_info = self._get_instance_nw_info(context, instance)
 
             migration.status = 'migrating'
-            migration.save(context.elevated())
-
             instance.task_state = task_states.RESIZE_MIGRATING
-            instance.save(expected_task_state=task_states.RESIZE_PREP)
+            with self.conductor_api.batch() as batch:
+                batch.object_action(migration, 'save', context.elevated())
+                batch.object_action(
+                        instance, 'save',
+                        expected_task_state=task_states.RESIZE_PREP)
 
             self._notify_about_instance_usage(
                 context, instance, "resize.start", network_info=network_info)
@@ -3024,17 +3049,17 @@ class ComputeManager(manager.SchedulerDependentManager):
 
             migration_p = obj_base.obj_to_primitive(migration)
             instance_p = obj_base.obj_to_primitive(instance)
-            self.conductor_api.network_migrate_instance_start(context,
-                                                              instance_p,
-                                                              migration_p)
-
             migration.status = 'post-migrating'
-            migration.save(context.elevated())
-
             instance.host = migration.dest_compute
             instance.node = migration.dest_node
             instance.task_state = task_states.RESIZE_MIGRATED
-            instance.save(expected_task_state=task_states.RESIZE_MIGRATING)
+            with self.conductor_api.batch() as batch:
+                batch.network_migrate_instance_start(context, instance_p,
+                                                     migration_p)
+                batch.object_action(migration, 'save', context.elevated())
+                batch.object_action(
+                        instance, 'save',
+                        expected_task_state=task_states.RESIZE_MIGRATING)
 
             self.compute_rpcapi.finish_resize(context, instance,
                     migration, image, disk_info,
@@ -4290,17 +4315,57 @@ class ComputeManager(manager.SchedulerDependentManager):
                         context, instance, "live_migration.rollback.dest.end",
                         network_info=network_info)
 
+    @wrap_exception()
+    def invalidate_instance_info_cache(self, context, instance):
+        """Mark the info_cache of an instance as stale.
+
+        Called when a network event has made the cached network
+        information of the instance out of date.  The instance is healed
+        ahead of all others, on the next run of _heal_instance_info_cache.
+        """
+        self._info_cache_invalidated.add(instance['uuid'])
+        # Do not wait out heal_instance_info_cache_interval.
+        self._last_info_cache_heal = 0
+
+    @staticmethod
+    def _info_cache_updated_at(info_cache):
+        """Return when an info cache was last refreshed, or None if that
+        is not known.
+        """
+        for field in ('updated_at', 'created_at'):
+            value = info_cache.get(field)
+            if value:
+                if isinstance(value, basestring):
+                    value = timeutils.parse_strtime(value)
+                return timeutils.normalize_time(value)
+        return None
+
+    def _heal_one_instance_info_cache(self, context, instance):
+        try:
+            # Call to network API to get instance info.. this will
+            # force an update to the instance's info_cache
+            self._get_instance_nw_info(context, instance)
+            LOG.debug(_('Updated the info_cache for instance'),
+                      instance=instance)
+        except Exception:
+            # We don't care about any failures, the instance will
+            # come around again once the others have been healed.
+            pass
+
+    @manager.independent_task
     @periodic_task.periodic_task
     def _heal_instance_info_cache(self, context):
-        """Called periodically.  On every call, try to update the
-        info_cache's network information for another instance by
-        calling to the network manager.
-
-        This is implemented by keeping a cache of uuids of instances
-        that live on this host.  On each call, we pop one off of a
-        list, pull the DB record, and try the call to the network API.
-        If anything errors, we don't care.  It's possible the instance
-        has been deleted, etc.
+        """Called periodically.  On every call, refresh the info_cache's
+        network information for a batch of the instances that live on
+        this host by calling to the network API.
+
+        Instances are healed stalest first, going by when their info_cache
+        was last refreshed or last tried here, except that instances whose
+        info_cache was invalidated by invalidate_instance_info_cache() go
+        ahead of all others.  Only the refresh times are listed to pick
+        the batch; the instances themselves are loaded for the batch only.
+        Up to heal_instance_info_cache_batch_size instances are healed per
+        call, heal_instance_info_cache_concurrency at a time.
         """
         heal_interval = CONF.heal_instance_info_cache_interval
         if not heal_interval:
@@ -4310,39 +4375,65 @@ class ComputeManager(manager.SchedulerDependentManager):
             return
         self._last_info_cache_heal = curr_time
 
-        instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
-        instance = None
+        info_caches = (
+            self.conductor_api.instance_info_cache_get_updated_at_by_host(
+                context, self.host, use_slave=True))
+        uuids = set(info_cache['instance_uuid'] for info_cache in info_caches)
+        # Forget about instances that have been deleted or moved away.
+        invalidated = self._info_cache_invalidated
+        invalidated.intersection_update(uuids)
+        healed_at = self._info_cache_healed_at
+        for uuid in set(healed_at) - uuids:
+            del healed_at[uuid]
+        if not info_caches:
+            return
 
-        while not instance or instance['host'] != self.host:
-            if instance_uuids:
-                try:
-                    instance = instance_obj.Instance.get_by_uuid(
-                        context, instance_uuids.pop(0),
-                        expected_attrs=['system_metadata'])
-                except exception.InstanceNotFound:
-                    # Instance is gone.  Try to grab another.
-                    continue
-            else:
-                # No more in our copy of uuids.  Pull from the DB.
-                db_instances = instance_obj.InstanceList.get_by_host(
-                    context, self.host, expected_attrs=[])
-                if not db_instances:
-                    # None.. just return.
-                    return
-                instance = db_instances[0]
-                instance_uuids = [inst['uuid'] for inst in db_instances[1:]]
-                self._instance_uuids_to_heal = instance_uuids
+        now = timeutils.utcnow()
+        ages = []
+        candidates = []
+        for info_cache in info_caches:
+            uuid = info_cache['instance_uuid']
+            updated_at = self._info_cache_updated_at(info_cache)
+            if updated_at is not None:
+                ages.append(timeutils.delta_seconds(updated_at, now))
+            # A heal that failed does not refresh the cache, but should not
+            # keep the instance ahead of the others either.
+            tried_at = healed_at.get(uuid)
+            if tried_at is not None and (updated_at is None or
+                                         tried_at > updated_at):
+                updated_at = tried_at
+            # Invalidated first, then never refreshed, then oldest.
+            candidates.append(((uuid not in invalidated,
+                                updated_at is not None, updated_at), uuid))
+        candidates.sort()
+        batch = [uuid for _key, uuid in
+                 candidates[:max(CONF.heal_instance_info_cache_batch_size,
+                                 1)]]
+
+        LOG.debug(_("Info cache age on this host: oldest %(oldest)ds, "
+                    "mean %(mean)ds, %(unknown)d of %(count)d never "
+                    "refreshed, %(invalidated)d invalidated; healing "
+                    "%(batch)d"),
+                  {'oldest': max(ages) if ages else 0,
+                   'mean': sum(ages) / len(ages) if ages else 0,
+                   'unknown': len(info_caches) - len(ages),
+                   'count': len(info_caches),
+                   'invalidated': len(invalidated),
+                   'batch': len(batch)})
 
-        # We have an instance now and it's ours
-        try:
-            # Call to network API to get instance info.. this will
-            # force an update to the instance's info_cache
-            self._get_instance_nw_info(context, instance)
-            LOG.debug(_('Updated the info_cache for instance'),
-                      instance=instance)
-        except Exception:
-            # We don't care about any failures
-            pass
+        instances = instance_obj.InstanceList.get_by_filters(
+            context, {'uuid': batch, 'host': self.host, 'deleted': False,
+                      'soft_deleted': True},
+            expected_attrs=['system_metadata'], use_slave=True)
+        for uuid in batch:
+            invalidated.discard(uuid)
+            healed_at[uuid] = now
+        pool = greenpool.GreenPool(
+            max(CONF.heal_instance_info_cache_concurrency, 1))
+        for instance in instances:
+            pool.spawn_n(self._heal_one_instance_info_cache, context,
+                         instance)
+        pool.waitall()
 
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
@@ -4350,7 +4441,7 @@ class ComputeManager(manager.SchedulerDependentManager):
             filters = {'task_state': task_states.REBOOTING,
                        'host': self.host}
             rebooting = instance_obj.InstanceList.get_by_filters(
-                context, filters, expected_attrs=[])
+                context, filters, expected_attrs=[], use_slave=True)
 
             to_poll = []
             for instance in rebooting:
@@ -4465,6 +4556,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                 LOG.exception(_('Periodic task failed to offload instance.'),
                         instance=instance)
 
+    @manager.independent_task
     @periodic_task.periodic_task
     def _instance_usage_audit(self, context):
         if not CONF.instance_usage_audit:
@@ -4481,7 +4573,6 @@ class ComputeManager(manager.SchedulerDependentManager):
             context, begin, end, host=self.host)
         num_instances = len(instances)
         errors = 0
-        successes = 0
         LOG.info(_("Running instance usage audit for"
                    " host %(host)s from %(begin_time)s to "
                    "%(end_time)s. %(number_instances)s"
@@ -4495,18 +4586,18 @@ class ComputeManager(manager.SchedulerDependentManager):
                                       self.conductor_api,
                                       begin, end,
                                       self.host, num_instances)
-        for instance in instances:
+        # NOTE: the notifications are generated by the conductor, one
+        # call per instance_scan_batch_size instances.
+        batch_size = max(CONF.instance_scan_batch_size, 1)
+        for i in xrange(0, num_instances, batch_size):
+            batch = instances[i:i + batch_size]
             try:
-                self.conductor_api.notify_usage_exists(
-                    context, instance,
-                    ignore_missing_network_data=False)
-                successes += 1
+                errors += len(self.conductor_api.notify_usage_exists_bulk(
+                    context, batch, ignore_missing_network_data=False))
             except Exception:
-                LOG.exception(_('Failed to generate usage '
-                                'audit for instance '
-                                'on host %s') % self.host,
-                              instance=instance)
-                errors += 1
+                LOG.exception(_('Failed to generate usage audit for '
+                                'instances on host %s') % self.host)
+                errors += len(batch)
         compute_utils.finish_instance_usage_audit(context,
                                       self.conductor_api,
                                       begin, end,
@@ -4518,6 +4609,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                                       num_instances,
                                       time.time() - start_time))
 
+    @manager.independent_task
     @periodic_task.periodic_task
     def _poll_bandwidth_usage(self, context):
         prev_time, start_time = utils.last_completed_audit_period()
@@ -4620,6 +4712,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                                                 usage['wr_bytes'],
                                                 usage['instance'])
 
+    @manager.independent_task
     @periodic_task.periodic_task
     def _poll_volume_usage(self, context, start_time=None):
         if CONF.volume_usage_poll_interval == 0:
@@ -4647,46 +4740,89 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         self._update_volume_usage_cache(context, vol_usages)
 
+    @manager.independent_task
     @periodic_task.periodic_task(spacing=CONF.sync_power_state_interval,
                                  run_immediately=True)
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
-        To sync power state data we make a DB call to get the number of
-        virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        The power states of all the virtual machines are fetched from the
+        hypervisor in one call, and the instances of the host are fetched
+        from the database in batches of CONF.instance_scan_batch_size.
+        Only the instances whose power state or vm_state disagree with the
+        hypervisor are looked at more closely.  Drivers that cannot list
+        the power states are asked about one instance at a time.  Once
+        done, the number of instances seen is compared to the number of
+        virtual machines known by the hypervisor.
         """
-        db_instances = instance_obj.InstanceList.get_by_host(context,
-                                                             self.host)
+        db_instances = instance_obj.InstanceList.iter_by_host(context,
+                self.host, CONF.instance_scan_batch_size, use_slave=True)
 
-        num_vm_instances = self.driver.get_num_instances()
-        num_db_instances = len(db_instances)
-
-        if num_vm_instances != num_db_instances:
-            LOG.warn(_("Found %(num_db_instances)s in the database and "
-                       "%(num_vm_instances)s on the hypervisor."),
-                     {'num_db_instances': num_db_instances,
-                      'num_vm_instances': num_vm_instances})
+        try:
+            vm_power_states = self.driver.get_all_power_states()
+            num_vm_instances = len(vm_power_states)
+        except NotImplementedError:
+            vm_power_states = None
+            num_vm_instances = self.driver.get_num_instances()
+        num_db_instances = 0
 
         for db_instance in db_instances:
+            num_db_instances += 1
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
                 continue
             # No pending tasks. Now try to figure out the real vm_power_state.
-            try:
-                vm_instance = self.driver.get_info(db_instance)
-                vm_power_state = vm_instance['state']
-            except exception.InstanceNotFound:
-                vm_power_state = power_state.NOSTATE
+            if vm_power_states is not None:
+                vm_power_state = vm_power_states.get(db_instance['uuid'],
+                                                     power_state.NOSTATE)
+                if self._power_state_in_sync(db_instance, vm_power_state):
+                    continue
+            else:
+                try:
+                    vm_instance = self.driver.get_info(db_instance)
+                    vm_power_state = vm_instance['state']
+                except exception.InstanceNotFound:
+                    vm_power_state = power_state.NOSTATE
             # Note(maoy): the above get_info call might take a long time,
             # for example, because of a broken libvirt driver.
             self._sync_instance_power_state(context,
                                             db_instance,
                                             vm_power_state)
 
+        if num_vm_instances != num_db_instances:
+            LOG.warn(_("Found %(num_db_instances)s in the database and "
+                       "%(num_vm_instances)s on the hypervisor."),
+                     {'num_db_instances': num_db_instances,
+                      'num_vm_instances': num_vm_instances})
+
+    @staticmethod
+    def _power_state_in_sync(db_instance, vm_power_state):
+        """Tell whether _sync_instance_power_state() has nothing to do.
+
+        This mirrors the checks of _sync_instance_power_state() on the
+        record read from the database, so that instances which agree with
+        the hypervisor do not cost a refresh.
+        """
+        if db_instance['power_state'] != vm_power_state:
+            return False
+        vm_state = db_instance['vm_state']
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state not in (power_state.SHUTDOWN,
+                                          power_state.CRASHED,
+                                          power_state.SUSPENDED,
+                                          power_state.PAUSED,
+                                          power_state.NOSTATE)
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+        elif vm_state in (vm_states.SOFT_DELETED,
+                          vm_states.DELETED):
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN)
+        return True
+
     def _sync_instance_power_state(self, context, db_instance, vm_power_state):
         """Align instance power state between the database and hypervisor.
 
@@ -5017,6 +5153,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                                     aggregate, host,
                                     isinstance(e, exception.AggregateError))
 
+    @manager.independent_task
     @periodic_task.periodic_task(spacing=CONF.image_cache_manager_interval,
                                  external_process_ok=True)
     def _run_image_cache_manager_pass(self, context):
@@ -45,7 +45,13 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.IntOpt('resource_tracker_audit_interval', default=1,
+               help='Number of update_available_resource runs between full '
+                    'recalculations of the resource usage of a node from its '
+                    'instances and migrations.  In between, the usage kept '
+                    'up to date by resource claims and instance updates is '
+                    'trusted and only the hypervisor view is refreshed'),
 ]
 
 CONF = cfg.CONF
@@ -55,6 +61,13 @@ LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
 CONF.import_opt('my_ip', 'nova.netconf')
+CONF.import_opt('scheduler_optimistic_claims',
+                'nova.scheduler.filter_scheduler')
+
+# The compute node columns that the tracker derives from the instances and
+# migrations of the node rather than from the hypervisor.
+_USAGE_KEYS = ('memory_mb_used', 'local_gb_used', 'vcpus_used',
+               'current_workload', 'running_vms')
 
 
 class ResourceTracker(object):
@@ -72,6 +85,11 @@ class ResourceTracker(object):
         self.tracked_instances = {}
         self.tracked_migrations = {}
         self.conductor_api = conductor.API()
+        # What the compute node record holds, as far as we know, so that
+        # only the changes need writing.
+        self._written = None
+        self._written_stats = None
+        self._runs_since_audit = None
 
     @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def instance_claim(self, context, instance_ref, limits=None):
@@ -291,6 +309,15 @@ class ResourceTracker(object):
             self.pci_tracker.set_hvdevs(jsonutils.loads(resources.pop(
                 'pci_passthrough_devices')))
 
+        interval = max(CONF.resource_tracker_audit_interval, 1)
+        if (self.compute_node and self._runs_since_audit is not None and
+                self._runs_since_audit + 1 < interval):
+            self._runs_since_audit += 1
+            self._update_hypervisor_view(context, resources)
+            return
+        self._runs_since_audit = 0
+        tracked_usage = self._get_tracked_usage()
+
         # Grab all instances assigned to this node:
         instances = instance_obj.InstanceList.get_by_host_and_node(
             context, self.host, self.nodename)
@@ -322,8 +349,48 @@ class ResourceTracker(object):
 
         self._report_final_resource_view(resources)
 
+        if interval > 1 and tracked_usage:
+            self._verify_tracked_usage(tracked_usage, resources)
+
         self._sync_compute_node(context, resources)
 
+    def _update_hypervisor_view(self, context, resources):
+        """Refresh the hypervisor's view of the node, keeping the usage
+        tracked since the last audit.
+        """
+        for key in _USAGE_KEYS:
+            if key in self.compute_node:
+                resources[key] = self.compute_node[key]
+        resources['free_ram_mb'] = (resources['memory_mb'] -
+                                    resources['memory_mb_used'])
+        resources['free_disk_gb'] = (resources['local_gb'] -
+                                     resources['local_gb_used'])
+        resources['stats'] = self.stats
+        if self.pci_tracker:
+            resources['pci_stats'] = jsonutils.dumps(self.pci_tracker.stats)
+        else:
+            resources['pci_stats'] = jsonutils.dumps({})
+        self._update(context, resources)
+
+    def _get_tracked_usage(self):
+        if not self.compute_node:
+            return None
+        return dict((key, self.compute_node.get(key)) for key in _USAGE_KEYS)
+
+    def _verify_tracked_usage(self, tracked_usage, resources):
+        """Compare the usage tracked since the last audit with the usage
+        just recalculated from the instances and migrations.
+        """
+        drift = dict((key, (value, resources.get(key)))
+                     for key, value in tracked_usage.iteritems()
+                     if value != resources.get(key))
+        if drift:
+            LOG.warn(_("Tracked resource usage of %(host)s:%(node)s drifted "
+                       "from the instances and migrations, (tracked, actual): "
+                       "%(drift)s"),
+                     {'host': self.host, 'node': self.nodename,
+                      'drift': drift})
+
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
         if not self.compute_node:
@@ -341,6 +408,11 @@ class ResourceTracker(object):
                         if self.pci_tracker:
                             self.pci_tracker.set_compute_node_id(cn['id'])
                         break
+        elif CONF.scheduler_optimistic_claims:
+            # Compare with what the record holds now, as the claims of the
+            # schedulers change it behind our back.  Otherwise, it holds
+            # what our last write returned.
+            self._written = self._get_compute_node_record(context)
 
         if not self.compute_node:
             # Need to create the ComputeNode record:
@@ -360,8 +432,18 @@ class ResourceTracker(object):
     def _create(self, context, values):
         """Create the compute node in the DB."""
         # initialize load stats from existing instances:
+        stats = values.get('stats')
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
+        self._remember_written(stats, prune_stats=True)
+
+    def _get_compute_node_record(self, context):
+        service = self._get_service(context)
+        if service:
+            for cn in service['compute_node'] or []:
+                if cn['id'] == self.compute_node['id']:
+                    return dict(cn)
+        return None
 
     def _get_service(self, context):
         try:
@@ -421,14 +503,60 @@ class ResourceTracker(object):
             LOG.audit(_("Free PCI devices: %s") % resources['pci_devices'])
 
     def _update(self, context, values, prune_stats=False):
-        """Persist the compute node updates to the DB."""
+        """Persist the compute node updates to the DB.
+
+        Only the columns and stats that changed since the last write are
+        sent. The record is written even if none did, so that its
+        updated_at moves on and the schedulers drop the resources they
+        consumed on their copy of it.
+        """
         if "service" in self.compute_node:
             del self.compute_node['service']
+        changes, prune_stats = self._get_changes(values, prune_stats)
+        stats = changes.get('stats')
         self.compute_node = self.conductor_api.compute_node_update(
-            context, self.compute_node, values, prune_stats)
+            context, self.compute_node, changes, prune_stats)
+        self._remember_written(stats, prune_stats)
         if self.pci_tracker:
             self.pci_tracker.save(context)
 
+    def _get_changes(self, values, prune_stats):
+        """Return the values that differ from the compute node record,
+        and whether stats need pruning.
+        """
+        if self._written is None or self._written_stats is None:
+            return dict(values), prune_stats
+
+        changes = dict((key, value) for key, value in values.iteritems()
+                       if key != 'stats' and (key not in self._written or
+                                              self._written[key] != value))
+        stats = values.get('stats')
+        if stats is not None:
+            old_stats = self._written_stats
+            if prune_stats and set(old_stats) - set(stats):
+                # Pruning needs all of the stats to keep.
+                changes['stats'] = dict(stats)
+                return changes, True
+            changed_stats = dict(
+                (key, value) for key, value in stats.iteritems()
+                if key not in old_stats or
+                   old_stats[key] != unicode(value))
+            if changed_stats:
+                changes['stats'] = changed_stats
+        return changes, False
+
+    def _remember_written(self, stats, prune_stats):
+        record = dict(self.compute_node)
+        record.pop('service', None)
+        record_stats = record.pop('stats', None)
+        if self._written_stats is None or prune_stats:
+            self._written_stats = dict((stat['key'], stat['value'])
+                                       for stat in record_stats or []
+                                       if not prune_stats)
+        self._written_stats.update((key, unicode(value))
+                                   for key, value in (stats or {}).iteritems())
+        self._written = record
+
     def _update_usage(self, resources, usage, sign=1):
         mem_usage = usage['memory_mb']
 
@@ -202,6 +202,7 @@ class ComputeAPI(rpcclient.RpcProxy):
         2.45 - Made resize_instance() take new-world objects
         2.46 - Made finish_resize() take new-world objects
         2.47 - Made finish_revert_resize() take new-world objects
+        2.48 - Add invalidate_instance_info_cache()
     '''
 
     #
@@ -445,6 +446,11 @@ class ComputeAPI(rpcclient.RpcProxy):
                                     version=version)
         cctxt.cast(ctxt, 'inject_network_info', instance=instance)
 
+    def invalidate_instance_info_cache(self, ctxt, instance):
+        cctxt = self.client.prepare(server=_compute_host(None, instance),
+                                    version='2.48')
+        cctxt.cast(ctxt, 'invalidate_instance_info_cache', instance=instance)
+
     def live_migration(self, ctxt, instance, dest, block_migration, host,
                        migrate_data=None):
         instance_p = jsonutils.to_primitive(instance)
@@ -278,6 +278,43 @@ def notify_usage_exists(notifier, context, instance_ref, current_period=False,
     bw = notifications.bandwidth_usage(instance_ref, audit_start,
             ignore_missing_network_data)
 
+    _notify_exists(notifier, context, instance_ref, audit_start, audit_end,
+                   bw, system_metadata, extra_usage_info)
+
+
+def notify_usage_exists_bulk(notifier, context, instances,
+                             current_period=False,
+                             ignore_missing_network_data=True):
+    """Generates 'exists' notifications for many instances at once.
+
+    Works like notify_usage_exists(), but fetches the bandwidth usage of
+    all the instances with a single query.  A failure to notify about one
+    instance is logged and does not stop the others.
+
+    :returns: a list of the uuids of the instances that could not be
+        notified about.
+    """
+    audit_start, audit_end = notifications.audit_period_bounds(current_period)
+    bw_usages = notifications.bandwidth_usages_by_uuid(
+        [instance['uuid'] for instance in instances], audit_start)
+
+    failed = []
+    for instance in instances:
+        try:
+            bw = notifications.bandwidth_usage(
+                instance, audit_start, ignore_missing_network_data,
+                bw_usages=bw_usages[instance['uuid']])
+            _notify_exists(notifier, context, instance, audit_start,
+                           audit_end, bw)
+        except Exception:
+            LOG.exception(_('Failed to generate usage audit for instance'),
+                          instance=instance)
+            failed.append(instance['uuid'])
+    return failed
+
+
+def _notify_exists(notifier, context, instance_ref, audit_start, audit_end,
+                   bw, system_metadata=None, extra_usage_info=None):
     if system_metadata is None:
         system_metadata = utils.instance_sys_meta(instance_ref)
 
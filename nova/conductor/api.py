@@ -14,11 +14,14 @@
 
 """Handles all requests to the conductor service."""
 
+import copy
+
 from oslo.config import cfg
 
 from nova import baserpc
 from nova.conductor import manager
 from nova.conductor import rpcapi
+from nova.objects import base as objects_base
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
@@ -35,7 +38,18 @@ conductor_opts = [
                default='nova.conductor.manager.ConductorManager',
                help='full class name for the Manager for conductor'),
     cfg.IntOpt('workers',
-               help='Number of workers for OpenStack Conductor service')
+               help='Number of workers for OpenStack Conductor service. '
+                    'When set, the workers are restarted one at a time on '
+                    'SIGHUP, each one after finishing the requests it is '
+                    'running. The new workers are forked from the running '
+                    'service, so they run the code and the configuration '
+                    'it was started with'),
+    cfg.BoolOpt('compact_object_actions',
+                default=False,
+                help='Leave the unchanged lists, dicts and nested objects '
+                     'out of an instance saved through nova-conductor, and '
+                     'get back only the fields that differ. All conductors '
+                     'must understand conductor RPC API version 1.60'),
 ]
 conductor_group = cfg.OptGroup(name='conductor',
                                title='Conductor Options')
@@ -46,6 +60,99 @@ CONF.register_opts(conductor_opts, conductor_group)
 LOG = logging.getLogger(__name__)
 
 
+class LocalBatch(object):
+    """Queues calls to the conductor to make them together.
+
+    Methods of the conductor API called on a batch are queued instead of
+    being made, and so are the remotable object methods passed to
+    object_action(). run() makes the queued calls in order and returns
+    their results. A batch is also a context manager, which runs it on
+    exit unless an exception was raised.
+
+    The calls can depend on each other's side effects, but not on each
+    other's results, which are only known once the batch has run.
+
+    This version makes the calls one after the other.
+    """
+
+    def __init__(self, api):
+        self._api = api
+        self._calls = []
+
+    def __getattr__(self, name):
+        # NOTE: Fail on unknown methods now, not when running the batch
+        getattr(self._api, name)
+
+        def queue(*args, **kwargs):
+            self._calls.append((name, None, args, kwargs))
+        return queue
+
+    def object_action(self, objinst, objmethod, *args, **kwargs):
+        """Queue a call of objinst.objmethod(*args, **kwargs)."""
+        self._calls.append((objmethod, objinst, args, kwargs))
+
+    def _call(self, method, objinst, args, kwargs):
+        target = self._api if objinst is None else objinst
+        return getattr(target, method)(*args, **kwargs)
+
+    def run(self):
+        calls, self._calls = self._calls, []
+        return [self._call(*call) for call in calls]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+
+
+class Batch(LocalBatch):
+    """Queues calls to the conductor to make them in one round trip.
+
+    If one of the calls raises, the objects of the calls before it are
+    saved, but not updated with what the conductor returned for them.
+    Conductors too old to take a batch get the calls one at a time, and
+    so do batches with a method which does not make exactly one rpc call.
+    """
+
+    def run(self):
+        conductor_rpcapi = self._api._manager
+        if (not self._calls
+                or not conductor_rpcapi.client.can_send_version('1.61')):
+            return super(Batch, self).run()
+        calls, self._calls = self._calls, []
+
+        api = copy.copy(self._api)
+        api._manager = conductor_rpcapi.batched()
+        client = api._manager.client
+        for method, objinst, args, kwargs in calls:
+            recorded = len(client.calls)
+            if objinst is None:
+                getattr(api, method)(*args, **kwargs)
+            else:
+                ctxt, args = objects_base.obj_action_context(objinst, method,
+                                                             args)
+                api._manager.object_action(ctxt, objinst, method, args,
+                                           kwargs)
+            if len(client.calls) != recorded + 1:
+                # NOTE: The results of the batch are paired with the calls
+                # by index, so a method which makes no rpc call or several
+                # can't be batched. Nothing was sent yet.
+                self._calls = calls
+                return super(Batch, self).run()
+        results = conductor_rpcapi.batch(client.context, client.calls)
+        # A cast returns nothing, whatever the method returned.
+        for i in client.casts:
+            results[i] = None
+
+        for i, (method, objinst, args, kwargs) in enumerate(calls):
+            if objinst is not None:
+                updates, results[i] = results[i]
+                objinst.obj_apply_updates(updates)
+        return results
+
+
 class LocalAPI(object):
     """A local version of the conductor API that does database updates
     locally instead of via RPC.
@@ -60,6 +167,10 @@ class LocalAPI(object):
         # nothing to wait for in the local case.
         pass
 
+    def batch(self):
+        """Return a batch to queue calls to this API, see LocalBatch."""
+        return LocalBatch(self)
+
     def instance_update(self, context, instance_uuid, **updates):
         """Perform an instance update in the database."""
         return self._manager.instance_update(context, instance_uuid,
@@ -106,6 +217,11 @@ class LocalAPI(object):
     def instance_info_cache_delete(self, context, instance):
         return self._manager.instance_info_cache_delete(context, instance)
 
+    def instance_info_cache_get_updated_at_by_host(self, context, host,
+                                                   use_slave=False):
+        return self._manager.instance_info_cache_get_updated_at_by_host(
+            context, host, use_slave=use_slave)
+
     def instance_type_get(self, context, instance_type_id):
         return self._manager.instance_type_get(context, instance_type_id)
 
@@ -291,6 +407,12 @@ class LocalAPI(object):
             context, instance, current_period, ignore_missing_network_data,
             system_metadata, extra_usage_info)
 
+    def notify_usage_exists_bulk(self, context, instances,
+                                 current_period=False,
+                                 ignore_missing_network_data=True):
+        return self._manager.notify_usage_exists_bulk(
+            context, instances, current_period, ignore_missing_network_data)
+
     def security_groups_trigger_handler(self, context, event, *args):
         return self._manager.security_groups_trigger_handler(context,
                                                              event, args)
@@ -406,6 +528,10 @@ class API(LocalAPI):
                                 'Is it running? Or did this service start '
                                 'before nova-conductor?'))
 
+    def batch(self):
+        """Return a batch to queue calls to this API, see Batch."""
+        return Batch(self)
+
     def instance_update(self, context, instance_uuid, **updates):
         """Perform an instance update in the database."""
         return self._manager.instance_update(context, instance_uuid,
@@ -25,6 +25,7 @@ from nova.compute import task_states
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova.conductor.tasks import live_migrate
+from nova import context as nova_context
 from nova.db import base
 from nova import exception
 from nova.image import glance
@@ -76,7 +77,7 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    RPC_API_VERSION = '1.58'
+    RPC_API_VERSION = '1.62'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -374,6 +375,12 @@ class ConductorManager(manager.Manager):
         self.db.instance_info_cache_update(context, instance['uuid'],
                                            values)
 
+    def instance_info_cache_get_updated_at_by_host(self, context, host,
+                                                   use_slave=False):
+        result = self.db.instance_info_cache_get_updated_at_by_host(
+            context, host, use_slave=use_slave)
+        return jsonutils.to_primitive(result)
+
     def instance_type_get(self, context, instance_type_id):
         result = self.db.flavor_get(context, instance_type_id)
         return jsonutils.to_primitive(result)
@@ -487,6 +494,13 @@ class ConductorManager(manager.Manager):
                                           ignore_missing_network_data,
                                           system_metadata, extra_usage_info)
 
+    def notify_usage_exists_bulk(self, context, instances,
+                                 current_period=False,
+                                 ignore_missing_network_data=True):
+        return compute_utils.notify_usage_exists_bulk(
+            self.notifier, context, instances, current_period,
+            ignore_missing_network_data)
+
     def security_groups_trigger_handler(self, context, event, args):
         self.security_group_api.trigger_handler(event, context, *args)
 
@@ -572,9 +586,14 @@ class ConductorManager(manager.Manager):
             if not objinst.obj_attr_is_set(field):
                 # Avoid demand-loading anything
                 continue
-            if (not oldobj.obj_attr_is_set(field) or
-                    oldobj[field] != objinst[field]):
-                updates[field] = objinst._attr_to_primitive(field)
+            if (oldobj.obj_attr_is_set(field) and
+                    oldobj[field] == objinst[field]):
+                continue
+            primitive = objinst._attr_to_primitive(field)
+            # NOTE: A compact object carries digests of the fields it
+            # left out, don't send back values the caller already has.
+            if not objinst.obj_matches_remote(field, primitive):
+                updates[field] = primitive
         # This is safe since a field named this would conflict with the
         # method anyway
         updates['obj_what_changed'] = objinst.obj_what_changed()
@@ -585,6 +604,28 @@ class ConductorManager(manager.Manager):
     def compute_reboot(self, context, instance, reboot_type):
         self.compute_api.reboot(context, instance, reboot_type)
 
+    def batch(self, context, calls):
+        """Make a list of calls to this API in order.
+
+        Each call is a dict of the name of the method and of its arguments,
+        serialized as for a call of its own, with the context to use if it
+        is not the one of the batch. The results are returned in a list,
+        the calls stop at the first one that raises.
+        """
+        serializer = nova_object.NovaObjectSerializer()
+        results = []
+        for call in calls:
+            method = call['method']
+            if method.startswith('_') or method == 'batch':
+                raise AttributeError(_("No such RPC function '%s'") % method)
+            ctxt = context
+            if call.get('context'):
+                ctxt = nova_context.RequestContext.from_dict(call['context'])
+            args = dict((name, serializer.deserialize_entity(ctxt, arg))
+                        for name, arg in call['args'].iteritems())
+            results.append(getattr(self, method)(ctxt, **args))
+        return results
+
 
 class ComputeTaskManager(base.Base):
     """Namespace for compute methods.
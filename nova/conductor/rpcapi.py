@@ -14,6 +14,8 @@
 
 """Client side of the conductor RPC API."""
 
+import copy
+
 from oslo.config import cfg
 
 from nova.objects import base as objects_base
@@ -28,6 +30,44 @@ rpcapi_cap_opt = cfg.StrOpt('conductor',
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
 
 
+class _BatchClient(object):
+    """Stands in for the RPC client of a ConductorAPI, recording its calls.
+
+    The calls are kept in the format of ConductorAPI.batch(), which sends
+    them all at once. The context of the first call is the one of the
+    batch, the other calls only carry theirs if it is different. Casts
+    are recorded like calls, and their indexes kept in casts, since the
+    batch waits for them anyway.
+    """
+
+    def __init__(self, client, serializer):
+        self.client = client
+        self.serializer = serializer
+        self.context = None
+        self.calls = []
+        self.casts = []
+
+    def prepare(self, **kwargs):
+        return self
+
+    def can_send_version(self, version):
+        return self.client.can_send_version(version)
+
+    def call(self, ctxt, method, **kwargs):
+        args = dict((name, self.serializer.serialize_entity(ctxt, arg))
+                    for name, arg in kwargs.iteritems())
+        call = {'method': method, 'args': args}
+        if self.context is None:
+            self.context = ctxt
+        elif ctxt.to_dict() != self.context.to_dict():
+            call['context'] = ctxt.to_dict()
+        self.calls.append(call)
+
+    def cast(self, ctxt, method, **kwargs):
+        self.casts.append(len(self.calls))
+        self.call(ctxt, method, **kwargs)
+
+
 class ConductorAPI(rpcclient.RpcProxy):
     """Client side of the conductor RPC API
 
@@ -110,6 +150,10 @@ class ConductorAPI(rpcclient.RpcProxy):
                   migration_get_unconfirmed_by_dest_compute
     1.57 - Remove migration_create()
     1.58 - Remove migration_get()
+    1.59 - Added notify_usage_exists_bulk
+    1.60 - Accept compact objects in object_action
+    1.61 - Added batch
+    1.62 - Added instance_info_cache_get_updated_at_by_host
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -366,6 +410,13 @@ class ConductorAPI(rpcclient.RpcProxy):
         return cctxt.call(context, 'instance_info_cache_update',
                           instance=instance_p, values=values)
 
+    def instance_info_cache_get_updated_at_by_host(self, context, host,
+                                                   use_slave=False):
+        cctxt = self.client.prepare(version='1.62')
+        return cctxt.call(context,
+                          'instance_info_cache_get_updated_at_by_host',
+                          host=host, use_slave=use_slave)
+
     def service_create(self, context, values):
         cctxt = self.client.prepare(version='1.27')
         return cctxt.call(context, 'service_create', values=values)
@@ -432,6 +483,17 @@ class ConductorAPI(rpcclient.RpcProxy):
             system_metadata=system_metadata_p,
             extra_usage_info=extra_usage_info_p)
 
+    def notify_usage_exists_bulk(self, context, instances,
+                                 current_period=False,
+                                 ignore_missing_network_data=True):
+        instances_p = jsonutils.to_primitive(instances)
+        cctxt = self.client.prepare(version='1.59')
+        return cctxt.call(
+            context, 'notify_usage_exists_bulk',
+            instances=instances_p,
+            current_period=current_period,
+            ignore_missing_network_data=ignore_missing_network_data)
+
     def security_groups_trigger_handler(self, context, event, args):
         args_p = jsonutils.to_primitive(args)
         cctxt = self.client.prepare(version='1.40')
@@ -491,8 +553,30 @@ class ConductorAPI(rpcclient.RpcProxy):
                           objname=objname, objmethod=objmethod,
                           objver=objver, args=args, kwargs=kwargs)
 
+    def batched(self):
+        """Return a copy of this API which records calls for batch().
+
+        Its methods return nothing. The recorded calls are in the calls
+        attribute of its client, the indexes of those which are casts in
+        the casts attribute, and the context to send them with in the
+        context attribute.
+        """
+        api = copy.copy(self)
+        api.client = _BatchClient(self.client, self.serializer)
+        return api
+
+    def batch(self, context, calls):
+        cctxt = self.client.prepare(version='1.61')
+        return cctxt.call(context, 'batch', calls=calls)
+
     def object_action(self, context, objinst, objmethod, args, kwargs):
-        cctxt = self.client.prepare(version='1.50')
+        version = '1.50'
+        if (objmethod == 'save' and objinst.obj_compact_save
+                and CONF.conductor.compact_object_actions
+                and self.client.can_send_version('1.60')):
+            version = '1.60'
+            objinst = objinst.obj_to_compact_primitive()
+        cctxt = self.client.prepare(version=version)
         return cctxt.call(context, 'object_action', objinst=objinst,
                           objmethod=objmethod, args=args, kwargs=kwargs)
 
@@ -183,7 +183,8 @@ def compute_node_get_by_service_id(context, service_id):
     return IMPL.compute_node_get_by_service_id(context, service_id)
 
 
-def compute_node_get_all(context, no_date_fields=False):
+def compute_node_get_all(context, no_date_fields=False, updated_since=None,
+                         use_slave=False):
     """Get all computeNodes.
 
     :param context: The security context
@@ -191,11 +192,21 @@ def compute_node_get_all(context, no_date_fields=False):
                            'deteled_at' and 'deleted' fields from the output,
                            thus significantly reducing its size.
                            Set to False by default
+    :param updated_since: If set, only returns the compute nodes which were
+                          created, updated or deleted since this datetime.
+                          Changes of their services are not taken into
+                          account. Deleted compute nodes are included, with
+                          a non-zero 'deleted' field, and a deleted service
+                          is returned as None.
+    :param use_slave: If True, read from the slave database when one is
+                      configured.
 
     :returns: List of dictionaries each containing compute node properties,
               including corresponding service and stats
     """
-    return IMPL.compute_node_get_all(context, no_date_fields)
+    return IMPL.compute_node_get_all(context, no_date_fields,
+                                     updated_since=updated_since,
+                                     use_slave=use_slave)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -216,6 +227,18 @@ def compute_node_update(context, compute_id, values, prune_stats=False):
     return IMPL.compute_node_update(context, compute_id, values, prune_stats)
 
 
+def compute_node_claim(context, compute_id, generation, memory_mb, disk_gb,
+                       vcpus):
+    """Consume resources on a computeNode if it is still at generation.
+
+    Bumps the generation of the computeNode.  Raises
+    ComputeNodeClaimConflict if the computeNode was updated or claimed
+    since generation was read.
+    """
+    return IMPL.compute_node_claim(context, compute_id, generation,
+                                   memory_mb, disk_gb, vcpus)
+
+
 def compute_node_delete(context, compute_id):
     """Delete a computeNode from the database.
 
@@ -599,9 +622,10 @@ def instance_destroy(context, instance_uuid, constraint=None,
     return rv
 
 
-def instance_get_by_uuid(context, uuid, columns_to_join=None):
+def instance_get_by_uuid(context, uuid, columns_to_join=None, use_slave=False):
     """Get an instance or raise if it does not exist."""
-    return IMPL.instance_get_by_uuid(context, uuid, columns_to_join)
+    return IMPL.instance_get_by_uuid(context, uuid, columns_to_join,
+                                     use_slave=use_slave)
 
 
 def instance_get(context, instance_id, columns_to_join=None):
@@ -617,28 +641,48 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None):
+                                columns_to_join=None, use_slave=False):
     """Get all instances that match all filters."""
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
-                                            columns_to_join=columns_to_join)
+                                            columns_to_join=columns_to_join,
+                                            use_slave=use_slave)
+
+
+def instance_get_columns_by_filters(context, filters, columns,
+                                    sort_key='created_at', sort_dir='desc',
+                                    limit=None, marker=None, use_slave=False):
+    """Get a page of instances that match all filters, as dicts holding
+    only the requested columns.
+
+    marker is the uuid of the last instance of the previous page.
+    """
+    return IMPL.instance_get_columns_by_filters(context, filters, columns,
+                                                sort_key=sort_key,
+                                                sort_dir=sort_dir,
+                                                limit=limit, marker=marker,
+                                                use_slave=use_slave)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False):
     """Get instances and joins active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
     """
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              use_slave=use_slave)
 
 
-def instance_get_all_by_host(context, host, columns_to_join=None):
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             use_slave=False):
     """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host, columns_to_join)
+    return IMPL.instance_get_all_by_host(context, host, columns_to_join,
+                                         use_slave=use_slave)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -823,6 +867,17 @@ def instance_info_cache_get(context, instance_uuid):
     return IMPL.instance_info_cache_get(context, instance_uuid)
 
 
+def instance_info_cache_get_updated_at_by_host(context, host,
+                                               use_slave=False):
+    """Return when the info caches of the instances on a host were last
+    refreshed, without loading the caches themselves.
+
+    :param host: = host of the instances
+    """
+    return IMPL.instance_info_cache_get_updated_at_by_host(
+        context, host, use_slave=use_slave)
+
+
 def instance_info_cache_update(context, instance_uuid, values):
     """Update an instance info cache record in the table.
 
@@ -1082,6 +1137,18 @@ def quota_reserve(context, resources, quotas, user_quotas, deltas, expire,
                               project_id=project_id, user_id=user_id)
 
 
+def quota_reserve_optimistic(context, resources, quotas, user_quotas, deltas,
+                             expire, until_refresh, max_age, shards=1,
+                             project_id=None, user_id=None):
+    """Check quotas and create reservations without locking the usages."""
+    return IMPL.quota_reserve_optimistic(context, resources, quotas,
+                                         user_quotas, deltas, expire,
+                                         until_refresh, max_age,
+                                         shards=shards,
+                                         project_id=project_id,
+                                         user_id=user_id)
+
+
 def reservation_commit(context, reservations, project_id=None, user_id=None):
     """Commit quota reservations."""
     return IMPL.reservation_commit(context, reservations,
@@ -1096,6 +1163,22 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
                                      user_id=user_id)
 
 
+def reservation_commit_optimistic(context, reservations, project_id=None,
+                                  user_id=None):
+    """Commit quota reservations using atomic usage updates."""
+    return IMPL.reservation_commit_optimistic(context, reservations,
+                                              project_id=project_id,
+                                              user_id=user_id)
+
+
+def reservation_rollback_optimistic(context, reservations, project_id=None,
+                                    user_id=None):
+    """Roll back quota reservations using atomic usage updates."""
+    return IMPL.reservation_rollback_optimistic(context, reservations,
+                                                project_id=project_id,
+                                                user_id=user_id)
+
+
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     """Destroy all quotas associated with a given project and user."""
     return IMPL.quota_destroy_all_by_project_and_user(context,
@@ -1624,9 +1707,10 @@ def bw_usage_get(context, uuid, start_period, mac):
     return IMPL.bw_usage_get(context, uuid, start_period, mac)
 
 
-def bw_usage_get_by_uuids(context, uuids, start_period):
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
     """Return bw usages for instance(s) in a given audit period."""
-    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period)
+    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period,
+                                      use_slave=use_slave)
 
 
 def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
@@ -24,6 +24,8 @@ import copy
 import datetime
 import functools
 import itertools
+import operator
+import random
 import sys
 import time
 import uuid
@@ -78,11 +80,31 @@ CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
 CONF.import_opt('connection',
                 'nova.openstack.common.db.sqlalchemy.session',
                 group='database')
+CONF.import_opt('slave_connection',
+                'nova.openstack.common.db.sqlalchemy.session',
+                group='database')
 
 LOG = logging.getLogger(__name__)
 
-get_engine = db_session.get_engine
-get_session = db_session.get_session
+
+def _use_slave(use_slave):
+    """Only use the slave database if one is configured."""
+    return bool(use_slave) and CONF.database.slave_connection != ''
+
+
+def get_engine(use_slave=False):
+    """Return the engine of the database, or of the slave database if
+    use_slave is set and a slave_connection is configured.
+    """
+    return db_session.get_engine(slave_engine=_use_slave(use_slave))
+
+
+def get_session(use_slave=False, **kwargs):
+    """Return a session of the database, or of the slave database if
+    use_slave is set and a slave_connection is configured.
+    """
+    return db_session.get_session(slave_session=_use_slave(use_slave),
+                                  **kwargs)
 
 
 _SHADOW_TABLE_PREFIX = 'shadow_'
@@ -186,8 +208,12 @@ def model_query(context, model, *args, **kwargs):
             not a subclass of NovaBase, we should pass an extra base_model
             parameter that is a subclass of NovaBase and corresponds to the
             model parameter.
+    :param use_slave: if present and no session is given, query the slave
+            database when one is configured.  Only for read-only queries
+            that can cope with replication lag.
     """
-    session = kwargs.get('session') or get_session()
+    session = (kwargs.get('session') or
+               get_session(use_slave=kwargs.get('use_slave', False)))
     read_deleted = kwargs.get('read_deleted') or context.read_deleted
     project_only = kwargs.get('project_only', False)
 
@@ -517,13 +543,14 @@ def compute_node_get_by_service_id(context, service_id):
 
 
 @require_admin_context
-def compute_node_get_all(context, no_date_fields):
+def compute_node_get_all(context, no_date_fields, updated_since=None,
+                         use_slave=False):
 
     # NOTE(msdubov): Using lower-level 'select' queries and joining the tables
     #                manually here allows to gain 3x speed-up and to have 5x
     #                less network load / memory usage compared to the sqla ORM.
 
-    engine = get_engine()
+    engine = get_engine(use_slave=use_slave)
 
     # Retrieve ComputeNode, Service, Stat.
     compute_node = models.ComputeNode.__table__
@@ -537,20 +564,46 @@ def compute_node_get_all(context, no_date_fields):
         def filter_columns(table):
             return [c for c in table.c if c.name not in redundant_columns]
 
-        compute_node_query = select(filter_columns(compute_node)).\
-                                where(compute_node.c.deleted == 0).\
-                                order_by(compute_node.c.service_id)
+        if updated_since is None:
+            compute_node_query = select(filter_columns(compute_node)).\
+                                    where(compute_node.c.deleted == 0).\
+                                    order_by(compute_node.c.service_id)
+        else:
+            # NOTE: Return the nodes whose own row changed, including
+            # recently deleted nodes, so that the caller can drop them.
+            # Service rows are left out of the filter: their updated_at
+            # is bumped by every heartbeat, which would match every live
+            # node.
+            changed = or_(compute_node.c.created_at >= updated_since,
+                          compute_node.c.updated_at >= updated_since,
+                          compute_node.c.deleted_at >= updated_since)
+            not_deleted_before = or_(compute_node.c.deleted == 0,
+                                     compute_node.c.deleted_at >=
+                                         updated_since)
+            columns = filter_columns(compute_node)
+            if no_date_fields:
+                columns.append(compute_node.c.deleted)
+            compute_node_query = select(columns).\
+                    where(and_(changed, not_deleted_before)).\
+                    order_by(compute_node.c.service_id)
         compute_node_rows = conn.execute(compute_node_query).fetchall()
 
         service_query = select(filter_columns(service)).\
                             where((service.c.deleted == 0) &
                                   (service.c.binary == 'nova-compute')).\
                             order_by(service.c.id)
-        service_rows = conn.execute(service_query).fetchall()
-
         stat_query = select(filter_columns(stat)).\
                         where(stat.c.deleted == 0).\
                         order_by(stat.c.compute_node_id)
+        if updated_since is not None:
+            service_ids = set(row['service_id'] for row in compute_node_rows)
+            node_ids = set(row['id'] for row in compute_node_rows)
+            if not node_ids:
+                return []
+            service_query = service_query.where(service.c.id.in_(service_ids))
+            stat_query = stat_query.where(
+                    stat.c.compute_node_id.in_(node_ids))
+        service_rows = conn.execute(service_query).fetchall()
         stat_rows = conn.execute(stat_query).fetchall()
 
     # NOTE(msdubov): Transferring sqla.RowProxy objects to dicts.
@@ -670,11 +723,37 @@ def compute_node_update(context, compute_id, values, prune_stats=False):
         # changes in data.  This ensures that we invalidate the
         # scheduler cache of compute node data in case of races.
         values['updated_at'] = timeutils.utcnow()
+        values['generation'] = (compute_ref['generation'] or 0) + 1
         convert_datetimes(values, 'created_at', 'deleted_at', 'updated_at')
         compute_ref.update(values)
     return compute_ref
 
 
+@require_admin_context
+def compute_node_claim(context, compute_id, generation, memory_mb, disk_gb,
+                       vcpus):
+    """Consume resources on a ComputeNode if it is still at generation.
+
+    This is a compare and swap on the generation of the record, so that
+    schedulers working from stale data about the node can't both claim it.
+    """
+    cn = models.ComputeNode
+    result = model_query(context, cn, read_deleted="no").\
+             filter_by(id=compute_id).\
+             filter_by(generation=generation).\
+             update({'generation': cn.generation + 1,
+                     'free_ram_mb': cn.free_ram_mb - memory_mb,
+                     'memory_mb_used': cn.memory_mb_used + memory_mb,
+                     'free_disk_gb': cn.free_disk_gb - disk_gb,
+                     'local_gb_used': cn.local_gb_used + disk_gb,
+                     'vcpus_used': cn.vcpus_used + vcpus,
+                     'updated_at': timeutils.utcnow()},
+                    synchronize_session=False)
+    if not result:
+        raise exception.ComputeNodeClaimConflict(compute_id=compute_id,
+                                                 generation=generation)
+
+
 @require_admin_context
 def compute_node_delete(context, compute_id):
     """Delete a ComputeNode record and prune its stats."""
@@ -1673,14 +1752,16 @@ def instance_destroy(context, instance_uuid, constraint=None):
 
 
 @require_context
-def instance_get_by_uuid(context, uuid, columns_to_join=None):
+def instance_get_by_uuid(context, uuid, columns_to_join=None, use_slave=False):
     return _instance_get_by_uuid(context, uuid,
-            columns_to_join=columns_to_join)
+            columns_to_join=columns_to_join, use_slave=use_slave)
 
 
-def _instance_get_by_uuid(context, uuid, session=None, columns_to_join=None):
+def _instance_get_by_uuid(context, uuid, session=None, columns_to_join=None,
+                          use_slave=False):
     result = _build_instance_get(context, session=session,
-                                 columns_to_join=columns_to_join).\
+                                 columns_to_join=columns_to_join,
+                                 use_slave=use_slave).\
                 filter_by(uuid=uuid).\
                 first()
 
@@ -1708,9 +1789,10 @@ def instance_get(context, instance_id, columns_to_join=None):
         raise exception.InvalidID(id=instance_id)
 
 
-def _build_instance_get(context, session=None, columns_to_join=None):
+def _build_instance_get(context, session=None, columns_to_join=None,
+                        use_slave=False):
     query = model_query(context, models.Instance, session=session,
-                        project_only=True).\
+                        project_only=True, use_slave=use_slave).\
             options(joinedload_all('security_groups.rules')).\
             options(joinedload('info_cache'))
     if columns_to_join is None:
@@ -1727,7 +1809,8 @@ def _build_instance_get(context, session=None, columns_to_join=None):
     return query
 
 
-def _instances_fill_metadata(context, instances, manual_joins=None):
+def _instances_fill_metadata(context, instances, manual_joins=None,
+                             use_slave=False):
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
@@ -1736,6 +1819,8 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
     :param manual_joins: list of tables to manually join (can be any
                          combination of 'metadata' and 'system_metadata' or
                          None to take the default of both)
+    :param use_slave: read the metadata from the slave database, if one is
+                      configured
     """
     uuids = [inst['uuid'] for inst in instances]
 
@@ -1744,17 +1829,20 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
 
     meta = collections.defaultdict(list)
     if 'metadata' in manual_joins:
-        for row in _instance_metadata_get_multi(context, uuids):
+        for row in _instance_metadata_get_multi(context, uuids,
+                                                use_slave=use_slave):
             meta[row['instance_uuid']].append(row)
 
     sys_meta = collections.defaultdict(list)
     if 'system_metadata' in manual_joins:
-        for row in _instance_system_metadata_get_multi(context, uuids):
+        for row in _instance_system_metadata_get_multi(context, uuids,
+                                                       use_slave=use_slave):
             sys_meta[row['instance_uuid']].append(row)
 
     pcidevs = collections.defaultdict(list)
     if 'pci_devices' in manual_joins:
-        for row in _instance_pcidevs_get_multi(context, uuids):
+        for row in _instance_pcidevs_get_multi(context, uuids,
+                                               use_slave=use_slave):
             pcidevs[row['instance_uuid']].append(row)
 
     filled_instances = []
@@ -1800,7 +1888,8 @@ def instance_get_all(context, columns_to_join=None):
 
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None, columns_to_join=None):
+                                limit=None, marker=None, columns_to_join=None,
+                                use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1837,7 +1926,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
 
     sort_fn = {'desc': desc, 'asc': asc}
 
-    session = get_session()
+    session = get_session(use_slave=use_slave)
 
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
@@ -1852,6 +1941,133 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     query_prefix = query_prefix.order_by(sort_fn[sort_dir](
             getattr(models.Instance, sort_key)))
 
+    query_prefix = _instance_filters_query(context, query_prefix, filters)
+
+    # paginate query
+    if marker is not None:
+        # NOTE: the marker only gives the position to start from, it may
+        # have been deleted since the previous page was returned.
+        marker_uuid = marker
+        marker = model_query(context, models.Instance, session=session,
+                             project_only=True, read_deleted='yes').\
+                         filter_by(uuid=marker_uuid).\
+                         first()
+        if marker is None:
+            raise exception.MarkerNotFound(marker_uuid)
+    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
+                           models.Instance, limit,
+                           [sort_key, 'created_at', 'id'],
+                           marker=marker,
+                           sort_dir=sort_dir)
+
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins,
+                                    use_slave=use_slave)
+
+
+@require_context
+def instance_get_columns_by_filters(context, filters, columns,
+                                    sort_key='created_at', sort_dir='desc',
+                                    limit=None, marker=None, use_slave=False):
+    """Return a page of instances that match all filters, as plain dicts
+    holding only the requested columns.
+
+    Unlike instance_get_all_by_filters() no Instance rows are built and
+    nothing is joined: only the requested columns of the instances table
+    are selected.  'metadata' and 'system_metadata' may also be requested,
+    they are then fetched for the instances of the page only and returned
+    as dicts.  'uuid' is always returned.
+
+    Pages are walked with a keyset on (sort_key, uuid): marker is the uuid
+    of the last instance of the previous page and the next page starts
+    strictly after it, so every page costs an index range scan no matter
+    how deep into the listing it is.  Instances whose sort_key is NULL
+    come after all the others in either direction, ordered by uuid.
+    """
+    manual_joins = [column for column in ('metadata', 'system_metadata')
+                    if column in columns]
+    columns = [column for column in columns if column not in manual_joins]
+    if 'uuid' not in columns:
+        columns.insert(0, 'uuid')
+    instance_columns = models.Instance.__table__.columns
+    for column in columns:
+        if column not in instance_columns:
+            raise exception.InvalidInput(
+                reason=_("Unknown instance column %s") % column)
+    if sort_key not in instance_columns or sort_dir not in ('asc', 'desc'):
+        raise exception.InvalidSortKey()
+
+    session = get_session(use_slave=use_slave)
+    sort_column = getattr(models.Instance, sort_key)
+    sort_fn = {'desc': desc, 'asc': asc}[sort_dir]
+    after = {'desc': operator.lt, 'asc': operator.gt}[sort_dir]
+
+    query = session.query(*[getattr(models.Instance, column)
+                            for column in columns])
+    query = _instance_filters_query(context, query, filters)
+
+    marker_value = None
+    if marker is not None:
+        # NOTE: the marker row only gives the position to start from, so
+        # look it up regardless of read_deleted.
+        marker_row = model_query(context, sort_column,
+                                 base_model=models.Instance,
+                                 session=session, read_deleted='yes',
+                                 project_only=True).\
+                             filter(models.Instance.uuid == marker).\
+                             first()
+        if marker_row is None:
+            raise exception.MarkerNotFound(marker=marker)
+        marker_value = marker_row[0]
+
+    # NOTE: NULLs never compare equal and databases disagree on where
+    # they sort, so the instances with a NULL sort_key are paged in a
+    # pass of their own.  Both passes keep a plain ORDER BY and a range
+    # on (sort_key, uuid), which the indexes can serve.
+    rows = []
+    nullable = instance_columns[sort_key].nullable
+    if marker is None or marker_value is not None:
+        values_query = query
+        if nullable:
+            values_query = values_query.filter(sort_column != None)
+        if marker is not None:
+            values_query = values_query.filter(
+                    or_(after(sort_column, marker_value),
+                        and_(sort_column == marker_value,
+                             after(models.Instance.uuid, marker))))
+        values_query = values_query.order_by(sort_fn(sort_column),
+                                             sort_fn(models.Instance.uuid))
+        if limit is not None:
+            values_query = values_query.limit(limit)
+        rows = values_query.all()
+    if nullable and (limit is None or len(rows) < limit):
+        nulls_query = query.filter(sort_column == None)
+        if marker is not None and marker_value is None:
+            nulls_query = nulls_query.filter(
+                    after(models.Instance.uuid, marker))
+        nulls_query = nulls_query.order_by(sort_fn(models.Instance.uuid))
+        if limit is not None:
+            nulls_query = nulls_query.limit(limit - len(rows))
+        rows.extend(nulls_query.all())
+
+    instances = [dict(zip(columns, row)) for row in rows]
+
+    by_uuid = dict((instance['uuid'], instance) for instance in instances)
+    for column in manual_joins:
+        for instance in instances:
+            instance[column] = {}
+        get_multi = {'metadata': _instance_metadata_get_multi,
+                     'system_metadata': _instance_system_metadata_get_multi,
+                     }[column]
+        for row in get_multi(context, by_uuid.keys(), use_slave=use_slave):
+            by_uuid[row['instance_uuid']][column][row['key']] = row['value']
+    return instances
+
+
+def _instance_filters_query(context, query_prefix, filters):
+    """Apply the instance_get_all_by_filters() filters to query_prefix.
+
+    See instance_get_all_by_filters() for the supported filters.
+    """
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
@@ -1912,19 +2128,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               models.InstanceMetadata.instance_uuid,
                               filters)
 
-    # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
-
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return query_prefix
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2017,9 +2221,10 @@ def regex_filter(query, model, filters):
 
 @require_context
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False):
     """Return instances and joins that were active during window."""
-    session = get_session()
+    session = get_session(use_slave=use_slave)
     query = session.query(models.Instance)
 
     query = query.options(joinedload('info_cache')).\
@@ -2033,24 +2238,29 @@ def instance_get_active_by_window_joined(context, begin, end=None,
     if host:
         query = query.filter_by(host=host)
 
-    return _instances_fill_metadata(context, query.all())
+    return _instances_fill_metadata(context, query.all(), use_slave=use_slave)
 
 
-def _instance_get_all_query(context, project_only=False, joins=None):
+def _instance_get_all_query(context, project_only=False, joins=None,
+                            use_slave=False):
     if joins is None:
         joins = ['info_cache', 'security_groups']
 
-    query = model_query(context, models.Instance, project_only=project_only)
+    query = model_query(context, models.Instance, project_only=project_only,
+                        use_slave=use_slave)
     for join in joins:
         query = query.options(joinedload(join))
     return query
 
 
 @require_admin_context
-def instance_get_all_by_host(context, host, columns_to_join=None):
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             use_slave=False):
+    query = _instance_get_all_query(context, use_slave=use_slave)
     return _instances_fill_metadata(context,
-        _instance_get_all_query(context).filter_by(host=host).all(),
-                                manual_joins=columns_to_join)
+                                    query.filter_by(host=host).all(),
+                                    manual_joins=columns_to_join,
+                                    use_slave=use_slave)
 
 
 def _instance_get_all_uuids_by_host(context, host, session=None):
@@ -2292,6 +2502,30 @@ def instance_info_cache_get(context, instance_uuid):
                          first()
 
 
+@require_context
+def instance_info_cache_get_updated_at_by_host(context, host,
+                                               use_slave=False):
+    """Return when the info caches of the instances on a host were last
+    refreshed, without loading the caches themselves.
+
+    :param host: = host of the instances
+    :param use_slave: = query the slave database, if there is one
+    """
+    session = get_session(use_slave=use_slave)
+    query = session.query(models.Instance.uuid,
+                          models.InstanceInfoCache.created_at,
+                          models.InstanceInfoCache.updated_at).\
+                    outerjoin(models.InstanceInfoCache, and_(
+                        models.InstanceInfoCache.instance_uuid ==
+                        models.Instance.uuid,
+                        models.InstanceInfoCache.deleted == 0)).\
+                    filter(models.Instance.host == host).\
+                    filter(models.Instance.deleted == 0)
+    return [{'instance_uuid': uuid, 'created_at': created_at,
+             'updated_at': updated_at}
+            for uuid, created_at, updated_at in query.all()]
+
+
 @require_context
 def instance_info_cache_update(context, instance_uuid, values):
     """Update an instance info cache record in the table.
@@ -2314,6 +2548,10 @@ def instance_info_cache_update(context, instance_uuid, values):
             #                  cache entry, re-create it.
             info_cache = models.InstanceInfoCache()
             values['instance_uuid'] = instance_uuid
+        else:
+            # NOTE: bump updated_at even when network_info is unchanged, so
+            # that it records when the cache was last refreshed.
+            values['updated_at'] = timeutils.utcnow()
 
         try:
             info_cache.update(values)
@@ -2875,20 +3113,30 @@ def quota_class_update(context, class_name, resource, limit):
 
 @require_context
 def quota_usage_get(context, project_id, resource, user_id=None):
-    query = model_query(context, models.QuotaUsage, read_deleted="no").\
+    session = get_session()
+    query = model_query(context, models.QuotaUsage, read_deleted="no",
+                        session=session).\
                      filter_by(project_id=project_id).\
-                     filter_by(resource=resource)
+                     filter_by(resource=resource).\
+                     order_by(asc(models.QuotaUsage.id))
     if user_id:
         if resource not in PER_PROJECT_QUOTAS:
-            result = query.filter_by(user_id=user_id).first()
+            rows = query.filter_by(user_id=user_id).all()
         else:
-            result = query.filter_by(user_id=None).first()
+            rows = query.filter_by(user_id=None).all()
     else:
-        result = query.first()
+        rows = query.all()
 
-    if not result:
+    if not rows:
         raise exception.QuotaUsageNotFound(project_id=project_id)
 
+    # NOTE: The optimistic reservation engine may spread the usage over
+    # several rows, so return the first one holding their sum.
+    session.expunge_all()
+    result = rows[0]
+    for row in rows[1:]:
+        result.in_use += row.in_use
+        result.reserved += row.reserved
     return result
 
 
@@ -2949,15 +3197,28 @@ def quota_usage_update(context, project_id, user_id, resource, **kwargs):
         if key in kwargs:
             updates[key] = kwargs[key]
 
-    result = model_query(context, models.QuotaUsage, read_deleted="no").\
-                     filter_by(project_id=project_id).\
-                     filter_by(resource=resource).\
-                     filter(or_(models.QuotaUsage.user_id == user_id,
-                                models.QuotaUsage.user_id == None)).\
-                     update(updates)
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, models.QuotaUsage, read_deleted="no",
+                           session=session).\
+                       filter_by(project_id=project_id).\
+                       filter_by(resource=resource).\
+                       filter(or_(models.QuotaUsage.user_id == user_id,
+                                  models.QuotaUsage.user_id == None)).\
+                       order_by(asc(models.QuotaUsage.id)).\
+                       with_lockmode('update').\
+                       all()
 
-    if not result:
-        raise exception.QuotaUsageNotFound(project_id=project_id)
+        if not rows:
+            raise exception.QuotaUsageNotFound(project_id=project_id)
+
+        # NOTE: The optimistic reservation engine may spread the usage
+        # over several rows, so the counts are set on the first one and
+        # zeroed on the others.
+        rows[0].update(updates)
+        for row in rows[1:]:
+            row.update(dict((key, 0) for key in ('in_use', 'reserved')
+                            if key in updates))
 
 
 ###################
@@ -3012,9 +3273,22 @@ def _get_user_quota_usages(context, session, project_id, user_id):
                    filter_by(project_id=project_id).\
                    filter(or_(models.QuotaUsage.user_id == user_id,
                               models.QuotaUsage.user_id == None)).\
+                   order_by(asc(models.QuotaUsage.id)).\
                    with_lockmode('update').\
                    all()
-    return dict((row.resource, row) for row in rows)
+    usages = {}
+    for row in rows:
+        usage = usages.setdefault(row.resource, row)
+        if usage is not row and (row.in_use or row.reserved):
+            # NOTE: Fold the usage shards of the optimistic reservation
+            # engine into the first row, which is the only one updated
+            # here.  The shards are zeroed rather than deleted, so that
+            # atomic updates made to them by that engine still count.
+            usage.in_use += row.in_use
+            usage.reserved += row.reserved
+            row.in_use = 0
+            row.reserved = 0
+    return usages
 
 
 def _get_project_quota_usages(context, session, project_id):
@@ -3255,6 +3529,322 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
         reservation_query.soft_delete(synchronize_session=False)
 
 
+# NOTE: The optimistic reservation engine below never takes row locks
+# with SELECT ... FOR UPDATE.  Every change to quota_usages is a single
+# atomic UPDATE (reserved = reserved + delta) or a compare-and-swap
+# UPDATE guarded by the value that was read, so concurrent reservations
+# in the same project only contend for the instant of one statement.
+# The usage of a resource may be spread over several shard rows which
+# share the same project_id, user_id and resource.  Readers sum the rows,
+# and the locking engine folds them into the first row before using it.
+
+_QUOTA_REFRESH_ATTEMPTS = 5
+
+
+class _QuotaUsageChanged(Exception):
+    """A usage row was modified between the read and the CAS update."""
+    pass
+
+
+def _quota_usage_shards_query(context, project_id, user_id, resource,
+                              session=None):
+    if resource in PER_PROJECT_QUOTAS:
+        user_id = None
+    return model_query(context, models.QuotaUsage, read_deleted="no",
+                       session=session).\
+                   filter_by(project_id=project_id).\
+                   filter_by(resource=resource).\
+                   filter(or_(models.QuotaUsage.user_id == user_id,
+                              models.QuotaUsage.user_id == None)).\
+                   order_by(asc(models.QuotaUsage.id))
+
+
+def _quota_usage_shards(context, project_id, user_id, resource, shards,
+                        until_refresh):
+    """Return the usage rows of a resource, creating missing shards.
+
+    Returns a tuple of the rows and a flag telling whether the resource
+    had no usage row at all, in which case its usage must be refreshed.
+    Racing callers may both create shards; a few surplus rows are
+    harmless since usages are always summed.
+    """
+    rows = _quota_usage_shards_query(context, project_id, user_id,
+                                     resource).all()
+    created = not rows
+    if resource in PER_PROJECT_QUOTAS:
+        user_id = None
+    for i in xrange(len(rows), max(shards, 1)):
+        rows.append(_quota_usage_create(context, project_id, user_id,
+                                        resource, 0, 0,
+                                        until_refresh or None))
+    return rows, created
+
+
+def _quota_usage_refresh(context, resources, resource, project_id, user_id,
+                         until_refresh):
+    """Resync the in_use count of a resource from the database.
+
+    The synced count is written to the first shard and the other shards
+    are zeroed, all guarded by the in_use values read before syncing.
+    If a concurrent commit moved any of them the refresh is retried with
+    fresh values; refreshing is best effort, so giving up only leaves
+    the stale usage in place until the next refresh.  Returns the set
+    of refreshed resources.
+    """
+    sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
+    for attempt in xrange(_QUOTA_REFRESH_ATTEMPTS):
+        session = get_session()
+        try:
+            with session.begin():
+                usages = model_query(context, models.QuotaUsage,
+                                     read_deleted="no", session=session).\
+                               filter_by(project_id=project_id).\
+                               filter(or_(models.QuotaUsage.user_id == user_id,
+                                          models.QuotaUsage.user_id == None)).\
+                               order_by(asc(models.QuotaUsage.id)).\
+                               all()
+                updates = sync(context, project_id, user_id, session)
+                for res, in_use in updates.items():
+                    rows = [row for row in usages if row.resource == res and
+                            (res not in PER_PROJECT_QUOTAS or
+                             row.user_id is None)]
+                    if not rows:
+                        rows = [_quota_usage_create(
+                                context, project_id,
+                                None if res in PER_PROJECT_QUOTAS
+                                else user_id,
+                                res, 0, 0, until_refresh or None,
+                                session=session)]
+                    for i, row in enumerate(rows):
+                        result = model_query(context, models.QuotaUsage,
+                                             read_deleted="no",
+                                             session=session).\
+                                     filter_by(id=row.id).\
+                                     filter_by(in_use=row.in_use).\
+                                     update({'in_use': in_use if not i else 0,
+                                             'until_refresh':
+                                                 until_refresh or None},
+                                            synchronize_session=False)
+                        if not result:
+                            raise _QuotaUsageChanged()
+            return set(updates.keys())
+        except _QuotaUsageChanged:
+            continue
+        except db_exc.DBDeadlock:
+            time.sleep(0.05)
+            continue
+
+    LOG.warning(_("Unable to refresh the usage of %(resource)s for project "
+                  "%(project_id)s: usage keeps changing"),
+                {'resource': resource, 'project_id': project_id})
+    return set()
+
+
+def _quota_usage_needs_refresh(context, rows, max_age):
+    """Decide whether the usage described by the shard rows is stale.
+
+    until_refresh and updated_at are tracked on the first shard.  The
+    until_refresh countdown is decremented with a CAS so that concurrent
+    reservations each consume exactly one tick.
+    """
+    head = rows[0]
+    if sum(row.in_use for row in rows) < 0:
+        # Negative in_use count indicates a desync, so try to
+        # heal from that...
+        return True
+    if head.until_refresh is not None:
+        result = model_query(context, models.QuotaUsage,
+                             read_deleted="no").\
+                     filter_by(id=head.id).\
+                     filter_by(until_refresh=head.until_refresh).\
+                     update({'until_refresh': head.until_refresh - 1},
+                            synchronize_session=False)
+        return bool(result) and head.until_refresh - 1 <= 0
+    if max_age and head.updated_at and timeutils.delta_seconds(
+            head.updated_at, timeutils.utcnow()) >= max_age:
+        return True
+    return False
+
+
+@_retry_on_deadlock
+def _quota_reserve_one(context, usage_ids, project_id, user_id, resource,
+                       delta, expire):
+    """Reserve delta of a resource on one randomly chosen usage shard."""
+    usage_id = random.choice(usage_ids)
+    session = get_session()
+    with session.begin():
+        # NOTE(Vek): As in quota_reserve(), only positive increments
+        #            are added to the reserved quantity.
+        if delta > 0:
+            model_query(context, models.QuotaUsage, read_deleted="no",
+                        session=session).\
+                    filter_by(id=usage_id).\
+                    update({'reserved': models.QuotaUsage.reserved + delta},
+                           synchronize_session=False)
+        reservation = _reservation_create(context, str(uuid.uuid4()),
+                                          {'id': usage_id}, project_id,
+                                          user_id, resource, delta, expire,
+                                          session=session)
+    return reservation.uuid
+
+
+def _quota_usage_totals(context, project_id, user_id):
+    """Sum the usage shards of a project and of one of its users."""
+    rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+                   filter_by(project_id=project_id).\
+                   all()
+    project_usages = {}
+    user_usages = {}
+    for row in rows:
+        targets = [project_usages]
+        if row.user_id in (user_id, None):
+            targets.append(user_usages)
+        for usages in targets:
+            usage = usages.setdefault(row.resource,
+                                      dict(in_use=0, reserved=0))
+            usage['in_use'] += row.in_use
+            usage['reserved'] += row.reserved
+    return project_usages, user_usages
+
+
+@require_context
+def quota_reserve_optimistic(context, resources, project_quotas, user_quotas,
+                             deltas, expire, until_refresh, max_age,
+                             shards=1, project_id=None, user_id=None):
+    """Reserve quota without locking the usages of the whole project.
+
+    Behaves like quota_reserve() but each delta is added to the reserved
+    count of one of `shards` usage rows by an atomic update, and the
+    quotas are validated against the summed usages afterwards.  When a
+    quota is exceeded the reservations made by this call are rolled back
+    before OverQuota is raised, so the limits are never overshot; two
+    racing reservations that only fit one at a time may both be refused.
+    """
+    elevated = context.elevated()
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    # Make sure every resource has its usage shards, and refresh the
+    # stale ones
+    usage_ids = {}
+    work = set()
+    for resource in deltas:
+        rows, created = _quota_usage_shards(elevated, project_id, user_id,
+                                            resource, shards, until_refresh)
+        usage_ids[resource] = [row.id for row in rows]
+        if created or _quota_usage_needs_refresh(elevated, rows, max_age):
+            work.add(resource)
+    while work:
+        resource = work.pop()
+        refreshed = _quota_usage_refresh(elevated, resources, resource,
+                                         project_id, user_id, until_refresh)
+        # Because more than one resource may be refreshed by the call
+        # to the sync routine, and we don't want to double-sync, we make
+        # sure all refreshed resources are dropped from the work set.
+        work -= refreshed
+
+    reservations = []
+    try:
+        for res, delta in deltas.items():
+            reservations.append(_quota_reserve_one(elevated, usage_ids[res],
+                                                   project_id, user_id, res,
+                                                   delta, expire))
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            _reservation_settle(elevated, reservations, commit=False)
+
+    # Our own reservations are already part of the totals, so the
+    # quotas are compared with the usage as it would be after them.
+    project_usages, user_usages = _quota_usage_totals(elevated, project_id,
+                                                      user_id)
+    unders = [res for res, delta in deltas.items()
+              if delta < 0 and delta + user_usages[res]['in_use'] < 0]
+
+    # NOTE(Vek): We're only concerned about positive increments.
+    #            If a project has gone over quota, we want them to
+    #            be able to reduce their usage without any
+    #            problems.
+    def _total(usages, res):
+        return usages[res]['in_use'] + usages[res]['reserved']
+
+    overs = [res for res, delta in deltas.items()
+             if user_quotas[res] >= 0 and delta >= 0 and
+             (project_quotas[res] < _total(project_usages, res) or
+              user_quotas[res] < _total(user_usages, res))]
+
+    if unders:
+        LOG.warning(_("Change will make usage less than 0 for the following "
+                      "resources: %s"), unders)
+    if overs:
+        _reservation_settle(elevated, reservations, commit=False)
+        if project_quotas == user_quotas:
+            usages = project_usages
+        else:
+            usages = user_usages
+        for res, delta in deltas.items():
+            if delta > 0:
+                usages[res]['reserved'] -= delta
+        raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
+                                  usages=usages)
+
+    return reservations
+
+
+@_retry_on_deadlock
+def _reservation_settle(context, reservations, commit):
+    """Commit or roll back reservations with atomic usage updates.
+
+    Each reservation is claimed by soft deleting it only if it is still
+    live, and the usage is adjusted only when the claim succeeded, so a
+    reservation racing with another commit, rollback or expiry is never
+    applied twice.  Rows are visited in usage order to keep the lock
+    order stable between concurrent callers.
+    """
+    if not reservations:
+        return
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, models.Reservation, read_deleted="no",
+                           session=session).\
+                   filter(models.Reservation.uuid.in_(reservations)).\
+                   order_by(asc(models.Reservation.usage_id),
+                            asc(models.Reservation.id)).\
+                   all()
+        for reservation in rows:
+            claimed = model_query(context, models.Reservation,
+                                  read_deleted="no", session=session).\
+                          filter_by(id=reservation.id).\
+                          soft_delete(synchronize_session=False)
+            if not claimed:
+                continue
+            updates = {}
+            if reservation.delta >= 0:
+                updates['reserved'] = (models.QuotaUsage.reserved -
+                                       reservation.delta)
+            if commit:
+                updates['in_use'] = (models.QuotaUsage.in_use +
+                                     reservation.delta)
+            if updates:
+                model_query(context, models.QuotaUsage, read_deleted="no",
+                            session=session).\
+                        filter_by(id=reservation.usage_id).\
+                        update(updates, synchronize_session=False)
+
+
+@require_context
+def reservation_commit_optimistic(context, reservations, project_id=None,
+                                  user_id=None):
+    _reservation_settle(context, reservations, commit=True)
+
+
+@require_context
+def reservation_rollback_optimistic(context, reservations, project_id=None,
+                                    user_id=None):
+    _reservation_settle(context, reservations, commit=False)
+
+
 @require_admin_context
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     session = get_session()
@@ -3305,19 +3895,15 @@ def quota_destroy_all_by_project(context, project_id):
 
 @require_admin_context
 def reservation_expire(context):
-    session = get_session()
-    with session.begin():
-        current_time = timeutils.utcnow()
-        reservation_query = model_query(context, models.Reservation,
-                                        session=session, read_deleted="no").\
-                            filter(models.Reservation.expire < current_time)
-
-        for reservation in reservation_query.join(models.QuotaUsage).all():
-            if reservation.delta >= 0:
-                reservation.usage.reserved -= reservation.delta
-                session.add(reservation.usage)
-
-        reservation_query.soft_delete(synchronize_session=False)
+    # NOTE: Expired reservations are rolled back with atomic updates, as
+    #       they may race with reservations committed by the optimistic
+    #       engine, which does not lock the usages.
+    current_time = timeutils.utcnow()
+    rows = model_query(context, models.Reservation.uuid,
+                       base_model=models.Reservation, read_deleted="no").\
+                   filter(models.Reservation.expire < current_time).\
+                   all()
+    _reservation_settle(context, [row.uuid for row in rows], commit=False)
 
 
 ###################
@@ -4489,11 +5075,12 @@ def cell_get_all(context):
 ########################
 # User-provided metadata
 
-def _instance_metadata_get_multi(context, instance_uuids, session=None):
+def _instance_metadata_get_multi(context, instance_uuids, session=None,
+                                 use_slave=False):
     if not instance_uuids:
         return []
     return model_query(context, models.InstanceMetadata,
-                       session=session).\
+                       session=session, use_slave=use_slave).\
                     filter(
             models.InstanceMetadata.instance_uuid.in_(instance_uuids))
 
@@ -4553,11 +5140,12 @@ def instance_metadata_update(context, instance_uuid, metadata, delete):
 # System-owned metadata
 
 
-def _instance_system_metadata_get_multi(context, instance_uuids, session=None):
+def _instance_system_metadata_get_multi(context, instance_uuids, session=None,
+                                        use_slave=False):
     if not instance_uuids:
         return []
     return model_query(context, models.InstanceSystemMetadata,
-                       session=session).\
+                       session=session, use_slave=use_slave).\
                     filter(
             models.InstanceSystemMetadata.instance_uuid.in_(instance_uuids))
 
@@ -4669,8 +5257,9 @@ def bw_usage_get(context, uuid, start_period, mac):
 
 
 @require_context
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    return model_query(context, models.BandwidthUsage, read_deleted="yes").\
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    return model_query(context, models.BandwidthUsage, read_deleted="yes",
+                       use_slave=use_slave).\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
                    filter_by(start_period=start_period).\
                    all()
@@ -5943,8 +6532,10 @@ def pci_device_get_all_by_instance_uuid(context, instance_uuid):
                        all()
 
 
-def _instance_pcidevs_get_multi(context, instance_uuids, session=None):
-    return model_query(context, models.PciDevice, session=session).\
+def _instance_pcidevs_get_multi(context, instance_uuids, session=None,
+                                use_slave=False):
+    return model_query(context, models.PciDevice, session=session,
+                       use_slave=use_slave).\
         filter_by(status='allocated').\
         filter(models.PciDevice.instance_uuid.in_(instance_uuids))
 
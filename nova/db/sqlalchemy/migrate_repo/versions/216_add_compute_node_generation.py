@@ -0,0 +1,41 @@
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Integer, MetaData, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    compute_nodes = Table('compute_nodes', meta, autoload=True)
+    shadow_compute_nodes = Table('shadow_compute_nodes', meta, autoload=True)
+
+    generation = Column('generation', Integer, default=0)
+    compute_nodes.create_column(generation)
+    shadow_compute_nodes.create_column(generation.copy())
+
+    migrate_engine.execute(compute_nodes.update().values(generation=0))
+    migrate_engine.execute(shadow_compute_nodes.update().values(generation=0))
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    compute_nodes = Table('compute_nodes', meta, autoload=True)
+    compute_nodes.columns.generation.drop()
+
+    shadow_compute_nodes = Table('shadow_compute_nodes', meta, autoload=True)
+    shadow_compute_nodes.columns.generation.drop()
@@ -117,6 +117,10 @@ class ComputeNode(BASE, NovaBase):
     # '{"vendor_id":"8086", "product_id":"1234", "count":3 }'
     pci_stats = Column(Text)
 
+    # Bumped on every update of the record and on every scheduler claim,
+    # so schedulers can detect that their view of the node is stale.
+    generation = Column(Integer, default=0)
+
 
 class ComputeNodeStat(BASE, NovaBase):
     """Stats related to the current workload of a compute host that are
@@ -178,6 +182,10 @@ class Instance(BASE, NovaBase):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_deleted_created_at_uuid_idx',
+              'deleted', 'created_at', 'uuid'),
+        Index('instances_project_id_deleted_created_at_uuid_idx',
+              'project_id', 'deleted', 'created_at', 'uuid'),
     )
     injected_files = []
 
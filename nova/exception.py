@@ -738,6 +738,11 @@ class ComputeHostNotFound(HostNotFound):
     msg_fmt = _("Compute host %(host)s could not be found.")
 
 
+class ComputeNodeClaimConflict(NovaException):
+    msg_fmt = _("Compute node %(compute_id)s changed since generation "
+                "%(generation)s was read.")
+
+
 class HostBinaryNotFound(NotFound):
     msg_fmt = _("Could not find binary %(binary)s on host %(host)s.")
 
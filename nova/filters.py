@@ -17,6 +17,8 @@
 Filter support
 """
 
+import time
+
 from nova import loadables
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
@@ -57,32 +59,120 @@ class BaseFilter(object):
         else:
             return True
 
+    def run_filter_for_properties(self, filter_properties):
+        """Return True if the filter needs to be run for a request with
+        these filter properties.  Override this in a subclass if the filter
+        is known to pass every object for some requests, such as when the
+        scheduler hint it acts upon is missing, so that it can be skipped.
+        """
+        return True
 
-class BaseFilterHandler(loadables.BaseLoader):
-    """Base class to handle loading filter classes.
 
-    This class should be subclassed where one needs to use filters.
+class FilterPipeline(object):
+    """An ordered list of filters which is built once and reused for
+    every request filtering with the same filter classes.
+
+    The filter instances are long-lived, so filters must not keep
+    per-request state.  Counters of the time spent in each filter and of
+    the number of objects it eliminated are kept in 'stats'.
     """
 
-    def get_filtered_objects(self, filter_classes, objs,
-            filter_properties, index=0):
+    def __init__(self, filter_classes):
+        self.filters = [(filter_cls.__name__, filter_cls())
+                        for filter_cls in filter_classes]
+        self.stats = {}
+        for cls_name, filter in self.filters:
+            self.stats[cls_name] = {'runs': 0,
+                                    'skips': 0,
+                                    'time': 0.0,
+                                    'objs_in': 0,
+                                    'objs_out': 0}
+
+    def get_filtered_objects(self, objs, filter_properties, index=0,
+                             trace=None):
+        """Return the objects passing all the filters.
+
+        If trace is a list, a dict with the 'name' of each filter run, the
+        number of objects going in ('objs_in') and out ('objs_out') of it
+        and the 'time' it took is appended to it.
+        """
         list_objs = list(objs)
         LOG.debug(_("Starting with %d host(s)"), len(list_objs))
-        for filter_cls in filter_classes:
-            cls_name = filter_cls.__name__
-            filter = filter_cls()
-
-            if filter.run_filter_for_index(index):
-                objs = filter.filter_all(list_objs,
-                                               filter_properties)
-                if objs is None:
-                    LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
-                          {'cls_name': cls_name})
-                    return
+        for cls_name, filter in self.filters:
+            stats = self.stats[cls_name]
+
+            if not (filter.run_filter_for_index(index) and
+                    filter.run_filter_for_properties(filter_properties)):
+                stats['skips'] += 1
+                continue
+
+            objs_in = len(list_objs)
+            start = time.time()
+            objs = filter.filter_all(list_objs, filter_properties)
+            if objs is not None:
                 list_objs = list(objs)
-                LOG.debug(_("Filter %(cls_name)s returned "
-                            "%(obj_len)d host(s)"),
-                          {'cls_name': cls_name, 'obj_len': len(list_objs)})
-                if len(list_objs) == 0:
-                    break
+            elapsed = time.time() - start
+            stats['time'] += elapsed
+            stats['runs'] += 1
+            if trace is not None:
+                objs_out = len(list_objs) if objs is not None else 0
+                trace.append({'name': cls_name,
+                              'objs_in': objs_in,
+                              'objs_out': objs_out,
+                              'time': elapsed})
+            if objs is None:
+                LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
+                          {'cls_name': cls_name})
+                return
+            stats['objs_in'] += objs_in
+            stats['objs_out'] += len(list_objs)
+            LOG.debug(_("Filter %(cls_name)s returned "
+                        "%(obj_len)d host(s)"),
+                      {'cls_name': cls_name, 'obj_len': len(list_objs)})
+            if len(list_objs) == 0:
+                break
         return list_objs
+
+
+class BaseFilterHandler(loadables.BaseLoader):
+    """Base class to handle loading filter classes.
+
+    This class should be subclassed where one needs to use filters.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BaseFilterHandler, self).__init__(*args, **kwargs)
+        # { tuple of filter classes : FilterPipeline }
+        self._pipelines = {}
+
+    def get_pipeline(self, filter_classes):
+        """Return the cached FilterPipeline for a list of filter classes,
+        building it on first use.
+        """
+        key = tuple(filter_classes)
+        pipeline = self._pipelines.get(key)
+        if pipeline is None:
+            pipeline = FilterPipeline(filter_classes)
+            self._pipelines[key] = pipeline
+        return pipeline
+
+    def get_filter_stats(self):
+        """Return the counters of every filter, summed over all pipelines.
+
+        Returns a dict of filter class name -> dict of 'runs', 'skips',
+        'time' (in seconds), 'objs_in' and 'objs_out'.
+        """
+        filter_stats = {}
+        for pipeline in self._pipelines.values():
+            for cls_name, stats in pipeline.stats.iteritems():
+                totals = filter_stats.setdefault(cls_name,
+                                                 dict.fromkeys(stats, 0))
+                for key, value in stats.iteritems():
+                    totals[key] += value
+        return filter_stats
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0, trace=None):
+        pipeline = self.get_pipeline(filter_classes)
+        return pipeline.get_filtered_objects(objs, filter_properties, index,
+                                             trace=trace)
@@ -53,6 +53,12 @@ This module provides Manager, a base class for managers.
 
 """
 
+import datetime
+import hashlib
+import sys
+import time
+
+from eventlet import greenpool
 from oslo.config import cfg
 
 from nova import baserpc
@@ -63,14 +69,40 @@ from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
 from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
+from nova.openstack.common import timeutils
 from nova.scheduler import rpcapi as scheduler_rpcapi
 
 
+periodic_opts = [
+    cfg.IntOpt('periodic_task_concurrency',
+               default=1,
+               help='Number of periodic tasks marked as independent that '
+                    'may run at the same time.  With 1 every periodic task '
+                    'runs after the other'),
+    cfg.BoolOpt('periodic_task_jitter',
+                default=True,
+                help='Delay the first run of every periodic task that has a '
+                     'spacing by a fraction of that spacing that depends on '
+                     'the host, so that the hosts of a deployment do not '
+                     'all run the task at the same time'),
+    ]
+
 CONF = cfg.CONF
+CONF.register_opts(periodic_opts)
 CONF.import_opt('host', 'nova.netconf')
 LOG = logging.getLogger(__name__)
 
 
+def independent_task(f):
+    """Decorator to mark a periodic task as safe to run at the same time as
+    the other periodic tasks of its manager.
+
+    See the periodic_task_concurrency option.
+    """
+    f._periodic_independent = True
+    return f
+
+
 class Manager(base.Base, periodic_task.PeriodicTasks):
     # Set RPC API version to 1.0 by default.
     RPC_API_VERSION = '1.0'
@@ -83,6 +115,12 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         self.service_name = service_name
         self.notifier = notifier.get_notifier(self.service_name, self.host)
         super(Manager, self).__init__(db_driver)
+        # NOTE: the class keeps the schedule of the periodic tasks, give
+        # every manager its own copy.
+        self._periodic_last_run = self._periodic_last_run.copy()
+        self._periodic_stats = {}
+        if CONF.periodic_task_jitter:
+            self._jitter_periodic_tasks()
 
     def create_rpc_dispatcher(self, backdoor_port=None, additional_apis=None):
         '''Get the rpc dispatcher for this manager.
@@ -98,9 +136,114 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         serializer = objects_base.NovaObjectSerializer()
         return rpc_dispatcher.RpcDispatcher(apis, serializer)
 
+    def _jitter_periodic_tasks(self):
+        now = timeutils.utcnow()
+        for task_name, task in self._periodic_tasks:
+            spacing = self._periodic_spacing[task_name]
+            if not spacing or self._periodic_last_run[task_name] is None:
+                continue
+            digest = hashlib.md5('%s:%s' % (self.host, task_name)).hexdigest()
+            fraction = (int(digest, 16) % 1000) / 1000.0
+            self._periodic_last_run[task_name] = now + datetime.timedelta(
+                seconds=spacing * fraction)
+
     def periodic_tasks(self, context, raise_on_error=False):
-        """Tasks to be run at a periodic interval."""
-        return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
+        """Tasks to be run at a periodic interval.
+
+        Runs the periodic tasks that are due, one after the other.  Tasks
+        decorated with independent_task are run alongside the others, up
+        to periodic_task_concurrency at a time, when that is more than 1.
+        The runtime of every task is accounted for, see
+        periodic_task_stats().
+
+        Returns the number of seconds until the next task is due.
+        """
+        began = time.time()
+        idle_for = periodic_task.DEFAULT_INTERVAL
+        concurrency = CONF.periodic_task_concurrency
+        pool = greenpool.GreenPool(max(concurrency, 1))
+        errors = []
+
+        def _run_independent(task_name, task):
+            try:
+                self._run_periodic_task(context, task_name, task)
+            except Exception:
+                errors.append(sys.exc_info())
+
+        for task_name, task in self._periodic_tasks:
+            now = timeutils.utcnow()
+            spacing = self._periodic_spacing[task_name]
+            last_run = self._periodic_last_run[task_name]
+
+            # If a periodic task is _nearly_ due, then we'll run it early
+            if spacing is not None and last_run is not None:
+                due = last_run + datetime.timedelta(seconds=spacing)
+                if not timeutils.is_soon(due, 0.2):
+                    idle_for = min(idle_for, timeutils.delta_seconds(now, due))
+                    continue
+
+            if spacing is not None:
+                idle_for = min(idle_for, spacing)
+
+            self._periodic_last_run[task_name] = timeutils.utcnow()
+            if concurrency > 1 and getattr(task, '_periodic_independent',
+                                           False):
+                pool.spawn_n(_run_independent, task_name, task)
+                continue
+            try:
+                self._run_periodic_task(context, task_name, task)
+            except Exception:
+                if raise_on_error:
+                    raise
+            time.sleep(0)
+
+        pool.waitall()
+        if errors and raise_on_error:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        # NOTE: the time spent running the tasks already counts towards
+        # the wait for the next one.
+        return max(idle_for - (time.time() - began), 0)
+
+    def _run_periodic_task(self, context, task_name, task):
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        LOG.debug(_("Running periodic task %s"), full_task_name)
+        stats = self._periodic_stats.setdefault(
+            task_name, {'runs': 0, 'failures': 0, 'last_runtime': 0.0,
+                        'max_runtime': 0.0, 'total_runtime': 0.0})
+        began = time.time()
+        try:
+            task(self, context)
+        except Exception as e:
+            stats['failures'] += 1
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          {'full_task_name': full_task_name, 'e': e})
+            raise
+        finally:
+            runtime = time.time() - began
+            stats['runs'] += 1
+            stats['last_runtime'] = runtime
+            stats['max_runtime'] = max(stats['max_runtime'], runtime)
+            stats['total_runtime'] += runtime
+            spacing = self._periodic_spacing[task_name]
+            if spacing and runtime > spacing:
+                LOG.warn(_("Periodic task %(full_task_name)s took "
+                           "%(runtime).2f seconds, more than its spacing of "
+                           "%(spacing)d seconds"),
+                         {'full_task_name': full_task_name,
+                          'runtime': runtime, 'spacing': spacing})
+
+    def periodic_task_stats(self):
+        """Return the runtime accounting of the periodic tasks.
+
+        A dict keyed by task name, with the number of runs and failures,
+        and the last, maximum, mean and total runtime in seconds.
+        """
+        report = {}
+        for task_name, stats in self._periodic_stats.iteritems():
+            report[task_name] = dict(stats)
+            report[task_name]['mean_runtime'] = (
+                stats['total_runtime'] / stats['runs'])
+        return report
 
     def init_host(self):
         """Hook to do additional manager initialization when one requests
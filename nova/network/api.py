@@ -21,7 +21,9 @@
 import functools
 import inspect
 
+from nova.cells import opts as cells_opts
 from nova.compute import flavors
+from nova.compute import rpcapi as compute_rpcapi
 from nova.db import base
 from nova import exception
 from nova.network import floating_ips
@@ -81,6 +83,18 @@ def update_instance_cache_with_nw_info(api, context, instance, nw_info=None,
         ic.save(update_cells=update_cells)
     except Exception:
         LOG.exception(_('Failed storing info cache'), instance=instance)
+        invalidate_instance_info_cache(context, instance)
+
+
+def invalidate_instance_info_cache(context, instance):
+    """Ask the compute host of an instance to heal its info cache."""
+    if not instance.get('host') or cells_opts.get_cell_type() == 'api':
+        return
+    try:
+        compute_rpcapi.ComputeAPI().invalidate_instance_info_cache(context,
+                                                                   instance)
+    except Exception:
+        LOG.exception(_('Failed invalidating info cache'), instance=instance)
 
 
 def wrap_check_policy(func):
@@ -248,10 +248,24 @@ def audit_period_bounds(current_period=False):
     return (audit_start, audit_end)
 
 
+def bandwidth_usages_by_uuid(uuids, audit_start):
+    """Get the bandwidth usage records of many instances for the specified
+    audit period with a single query, as a dict keyed by instance uuid.
+    """
+    admin_context = nova.context.get_admin_context(read_deleted='yes')
+    bw_usages = dict((uuid, []) for uuid in uuids)
+    for b in db.bw_usage_get_by_uuids(admin_context, uuids, audit_start):
+        bw_usages.setdefault(b['uuid'], []).append(b)
+    return bw_usages
+
+
 def bandwidth_usage(instance_ref, audit_start,
-        ignore_missing_network_data=True):
+        ignore_missing_network_data=True, bw_usages=None):
     """Get bandwidth usage information for the instance for the
     specified audit period.
+
+    :param bw_usages: the bandwidth usage records of the instance for the
+        audit period, if already fetched (see bandwidth_usages_by_uuid).
     """
     admin_context = nova.context.get_admin_context(read_deleted='yes')
 
@@ -287,9 +301,10 @@ def bandwidth_usage(instance_ref, audit_start,
         nw_info = _get_nwinfo_old_skool()
 
     macs = [vif['address'] for vif in nw_info]
-    uuids = [instance_ref["uuid"]]
-
-    bw_usages = db.bw_usage_get_by_uuids(admin_context, uuids, audit_start)
+    if bw_usages is None:
+        uuids = [instance_ref["uuid"]]
+        bw_usages = db.bw_usage_get_by_uuids(admin_context, uuids,
+                                             audit_start)
     bw_usages = [b for b in bw_usages if b.mac in macs]
 
     bw = {}
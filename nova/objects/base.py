@@ -17,11 +17,13 @@
 import collections
 import copy
 import functools
+import hashlib
 
 from nova import context
 from nova import exception
 from nova.objects import utils as obj_utils
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
 import nova.openstack.common.rpc.serializer
@@ -121,32 +123,39 @@ def remotable(fn):
     """Decorator for remotable object methods."""
     @functools.wraps(fn)
     def wrapper(self, *args, **kwargs):
-        ctxt = self._context
-        try:
-            if isinstance(args[0], (context.RequestContext,
-                                    rpc_common.CommonRpcContext)):
-                ctxt = args[0]
-                args = args[1:]
-        except IndexError:
-            pass
-        if ctxt is None:
-            raise exception.OrphanedObjectError(method=fn.__name__,
-                                                objtype=self.obj_name())
-        # Force this to be set if it wasn't before.
-        self._context = ctxt
+        ctxt, args = obj_action_context(self, fn.__name__, args)
         if NovaObject.indirection_api:
             updates, result = NovaObject.indirection_api.object_action(
                 ctxt, self, fn.__name__, args, kwargs)
-            for key, value in updates.iteritems():
-                if key in self.fields:
-                    self[key] = self._attr_from_primitive(key, value)
-            self._changed_fields = set(updates.get('obj_what_changed', []))
+            self.obj_apply_updates(updates)
             return result
         else:
             return fn(self, ctxt, *args, **kwargs)
     return wrapper
 
 
+def obj_action_context(obj, method, args):
+    """Return the context and the arguments of a call of a remotable method.
+
+    This uses either the context passed first in args, or the one stashed
+    in the object, which is set to the one used.
+    """
+    ctxt = obj._context
+    try:
+        if isinstance(args[0], (context.RequestContext,
+                                rpc_common.CommonRpcContext)):
+            ctxt = args[0]
+            args = args[1:]
+    except IndexError:
+        pass
+    if ctxt is None:
+        raise exception.OrphanedObjectError(method=method,
+                                            objtype=obj.obj_name())
+    # Force this to be set if it wasn't before.
+    obj._context = ctxt
+    return ctxt, args
+
+
 # Object versioning rules
 #
 # Each service has its set of objects, each with a version attached. When
@@ -171,6 +180,27 @@ def check_object_version(server, client):
             dict(client=client_minor, server=server_minor))
 
 
+def obj_digest(primitive):
+    """Return a digest of the primitive form of an attribute.
+
+    Keys are not sorted, which would be much slower. Equal values can
+    then have different digests, making the remote side of a compact
+    object action send back a value the caller already has, as it would
+    for an object sent in full.
+    """
+    return hashlib.md5(jsonutils.dumps(primitive)).hexdigest()
+
+
+def _obj_is_dirty(value):
+    if not isinstance(value, NovaObject):
+        return False
+    if value.obj_what_changed():
+        return True
+    if isinstance(value, ObjectListBase):
+        return any(_obj_is_dirty(item) for item in value.objects)
+    return False
+
+
 class NovaObject(object):
     """Base class and object factory.
 
@@ -194,6 +224,10 @@ class NovaObject(object):
     fields = {}
     obj_extra_fields = []
 
+    # Whether save() can be remoted with obj_to_compact_primitive(), that
+    # is without the list, dict and object fields that did not change.
+    obj_compact_save = False
+
     def __init__(self):
         self._changed_fields = set()
         self._context = None
@@ -265,6 +299,8 @@ class NovaObject(object):
                         self._attr_from_primitive(name, objdata[name]))
         changes = primitive.get('nova_object.changes', [])
         self._changed_fields = set([x for x in changes if x in self.fields])
+        if 'nova_object.digests' in primitive:
+            self._obj_digests = primitive['nova_object.digests']
         return self
 
     def _attr_to_primitive(self, attribute):
@@ -301,6 +337,54 @@ class NovaObject(object):
             obj['nova_object.changes'] = list(self.obj_what_changed())
         return obj
 
+    def obj_to_compact_primitive(self):
+        """Dehydrate only what a remote save() needs.
+
+        Fields holding a list, a dict or a nested object are only sent if
+        they changed, the others are sent as digests of their primitive
+        form, so that the remote side can tell which values it does not
+        need to return. Plain values are sent as usual, their digests
+        would not be any smaller.
+        """
+        primitive = dict()
+        digests = dict()
+        changes = self.obj_what_changed()
+        for name in self.fields:
+            if not self.obj_attr_is_set(name):
+                continue
+            value = self._attr_to_primitive(name)
+            if (name in changes or
+                    not isinstance(value, (dict, list, tuple)) or
+                    _obj_is_dirty(self[name])):
+                primitive[name] = value
+            else:
+                digests[name] = obj_digest(value)
+        obj = {'nova_object.name': self.obj_name(),
+               'nova_object.namespace': 'nova',
+               'nova_object.version': self.version,
+               'nova_object.data': primitive,
+               'nova_object.digests': digests}
+        if changes:
+            obj['nova_object.changes'] = list(changes)
+        return obj
+
+    def obj_matches_remote(self, attrname, primitive):
+        """Test whether the sender of a compact primitive has this value.
+
+        Returns True if attrname was sent as a digest that matches the
+        given primitive form of the attribute.
+        """
+        digests = getattr(self, '_obj_digests', None) or {}
+        return (attrname in digests and
+                digests[attrname] == obj_digest(primitive))
+
+    def obj_apply_updates(self, updates):
+        """Apply the updates returned by a remote object_action()."""
+        for key, value in updates.iteritems():
+            if key in self.fields:
+                self[key] = self._attr_from_primitive(key, value)
+        self._changed_fields = set(updates.get('obj_what_changed', []))
+
     def obj_load_attr(self, attrname):
         """Load an additional attribute from the real object.
 
@@ -68,7 +68,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
     # Version 1.6: Added pci_devices
     # Version 1.7: String attributes updated to support unicode
     # Version 1.8: 'security_groups' and 'pci_devices' cannot be None
-    VERSION = '1.8'
+    # Version 1.9: Added use_slave to get_by_uuid()
+    VERSION = '1.9'
 
     fields = {
         'id': int,
@@ -160,6 +161,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
 
     obj_extra_fields = ['name']
 
+    obj_compact_save = True
+
     def __init__(self, *args, **kwargs):
         super(Instance, self).__init__(*args, **kwargs)
         self.obj_reset_changes()
@@ -294,12 +297,13 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         return instance
 
     @base.remotable_classmethod
-    def get_by_uuid(cls, context, uuid, expected_attrs=None):
+    def get_by_uuid(cls, context, uuid, expected_attrs=None, use_slave=False):
         if expected_attrs is None:
             expected_attrs = ['info_cache', 'security_groups']
         columns_to_join = _expected_cols(expected_attrs)
         db_inst = db.instance_get_by_uuid(context, uuid,
-                                          columns_to_join=columns_to_join)
+                                          columns_to_join=columns_to_join,
+                                          use_slave=use_slave)
         return cls._from_db_object(context, cls(), db_inst,
                                    expected_attrs)
 
@@ -517,23 +521,67 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
 
 
 class InstanceList(base.ObjectListBase, base.NovaObject):
+    # Version 1.0: Initial version
+    # Version 1.1: Added use_slave to get_by_filters() and get_by_host()
+    VERSION = '1.1'
+
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
-                       marker=None, expected_attrs=None):
+                       marker=None, expected_attrs=None, use_slave=False):
         db_inst_list = db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, limit=limit, marker=marker,
-            columns_to_join=_expected_cols(expected_attrs))
+            columns_to_join=_expected_cols(expected_attrs),
+            use_slave=use_slave)
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None):
+    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
         db_inst_list = db.instance_get_all_by_host(
-            context, host, columns_to_join=_expected_cols(expected_attrs))
+            context, host, columns_to_join=_expected_cols(expected_attrs),
+            use_slave=use_slave)
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
+    @classmethod
+    def iter_by_filters(cls, context, filters, batch_size,
+                        sort_key='created_at', sort_dir='desc',
+                        expected_attrs=None, use_slave=False):
+        """Yield the instances matching filters, fetching them batch_size
+        at a time.
+
+        Each batch is a separate get_by_filters() call resuming after the
+        last instance of the previous batch, so only one batch is held in
+        memory and the joins of expected_attrs are done per batch.
+        Instances created or deleted during the scan may or may not be
+        returned.
+        """
+        marker = None
+        while True:
+            batch = cls.get_by_filters(context, filters, sort_key=sort_key,
+                                       sort_dir=sort_dir, limit=batch_size,
+                                       marker=marker,
+                                       expected_attrs=expected_attrs,
+                                       use_slave=use_slave)
+            for instance in batch:
+                yield instance
+            if len(batch) < batch_size:
+                return
+            marker = batch[-1].uuid
+
+    @classmethod
+    def iter_by_host(cls, context, host, batch_size, expected_attrs=None,
+                     use_slave=False):
+        """Yield the instances of a host, batch_size at a time.
+
+        Returns the same instances as get_by_host(), see iter_by_filters().
+        """
+        filters = {'host': host, 'deleted': False, 'soft_deleted': True}
+        return cls.iter_by_filters(context, filters, batch_size,
+                                   expected_attrs=expected_attrs,
+                                   use_slave=use_slave)
+
     @base.remotable_classmethod
     def get_by_host_and_node(cls, context, host, node, expected_attrs=None):
         db_inst_list = db.instance_get_all_by_host_and_node(
@@ -46,6 +46,14 @@ class InstanceInfoCache(base.NovaPersistentObject, base.NovaObject):
     def _from_db_object(context, info_cache, db_obj):
         info_cache.instance_uuid = db_obj['instance_uuid']
         info_cache.network_info = db_obj['network_info']
+        # NOTE: the timestamps tell how fresh the cache is, but callers
+        # that build info caches by hand do not always provide them.  Rows
+        # do not support 'in', so look them up with get().
+        missing = object()
+        for field in ('created_at', 'updated_at', 'deleted_at', 'deleted'):
+            value = db_obj.get(field, missing)
+            if value is not missing:
+                info_cache[field] = value
         info_cache.obj_reset_changes()
         info_cache._context = context
         return info_cache
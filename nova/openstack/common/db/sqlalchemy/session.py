@@ -607,6 +607,25 @@ def _ping_listener(dbapi_conn, connection_rec, connection_proxy):
             raise
 
 
+def _pid_listener(dbapi_conn, connection_rec):
+    """Records the process that opened a pooled connection."""
+    connection_rec.info['pid'] = os.getpid()
+
+
+def _fork_listener(dbapi_conn, connection_rec, connection_proxy):
+    """Ensures that connections checked out of the pool are not shared.
+
+    A service forking workers (see ProcessLauncher) hands a copy of the
+    pool to every child.  Connections opened by another process are
+    dropped, without closing them under that process, and replaced.
+    """
+    if connection_rec.info.get('pid', os.getpid()) != os.getpid():
+        connection_rec.connection = connection_proxy.connection = None
+        raise sqla_exc.DisconnectionError(
+            _("Connection was opened by process %(pid)d, reconnecting") %
+            {'pid': connection_rec.info['pid']})
+
+
 def _is_db_connection_error(args):
     """Return True if error in connecting to db."""
     # NOTE(adam_g): This is currently MySQL specific and needs to be extended
@@ -657,6 +676,8 @@ def create_engine(sql_connection, sqlite_fk=False):
 
     engine = sqlalchemy.create_engine(sql_connection, **engine_args)
 
+    sqlalchemy.event.listen(engine, 'connect', _pid_listener)
+    sqlalchemy.event.listen(engine, 'checkout', _fork_listener)
     sqlalchemy.event.listen(engine, 'checkin', _greenthread_yield)
 
     if 'mysql' in connection_dict.drivername:
@@ -28,6 +28,7 @@ AMQP, but is deprecated and predates this code.
 import collections
 import inspect
 import sys
+import time
 import uuid
 
 from eventlet import greenpool
@@ -41,6 +42,7 @@ from nova.openstack.common.gettextutils import _  # noqa
 from nova.openstack.common import local
 from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common.rpc import stats as rpc_stats
 
 
 amqp_opts = [
@@ -52,11 +54,18 @@ amqp_opts = [
     cfg.BoolOpt('amqp_auto_delete',
                 default=False,
                 help='Auto-delete queues in amqp.'),
+    cfg.BoolOpt('rpc_latency_stats',
+                default=True,
+                help='Keep histograms of the round trip, queueing and '
+                     'dispatch times of rpc messages per topic and method. '
+                     'Queueing times are only measured for messages from '
+                     'senders that have this enabled too'),
 ]
 
 cfg.CONF.register_opts(amqp_opts)
 
 UNIQUE_ID = '_unique_id'
+SEND_TIME = '_send_time'
 LOG = logging.getLogger(__name__)
 
 
@@ -140,12 +149,15 @@ class ConnectionContext(rpc_common.Connection):
                 # to grab from the pool
                 self.connection.reset()
                 self.connection_pool.put(self.connection)
+                self.connection = None
             else:
+                # Forget the connection first, so that a close cut short
+                # (e.g. by a timeout) isn't made again by __del__.
+                connection, self.connection = self.connection, None
                 try:
-                    self.connection.close()
+                    connection.close()
                 except Exception:
                     pass
-            self.connection = None
 
     def __exit__(self, exc_type, exc_value, tb):
         """End of 'with' statement.  We're done here."""
@@ -224,10 +236,11 @@ class ReplyProxy(ConnectionContext):
 
 
 def msg_reply(conf, msg_id, reply_q, connection_pool, reply=None,
-              failure=None, ending=False, log_failure=True):
+              failure=None, ending=False, log_failure=True, codec='json'):
     """Sends a reply or an error on the channel signified by msg_id.
 
-    Failure should be a sys.exc_info() tuple.
+    Failure should be a sys.exc_info() tuple. The reply is encoded with
+    the codec asked for by the caller.
 
     """
     with ConnectionContext(conf, connection_pool) as conn:
@@ -238,15 +251,18 @@ def msg_reply(conf, msg_id, reply_q, connection_pool, reply=None,
         msg = {'result': reply, 'failure': failure}
         if ending:
             msg['ending'] = True
+        if codec != 'json':
+            # Tell the caller that we can decode the codec too.
+            msg['_codec'] = codec
         _add_unique_id(msg)
         # If a reply_q exists, add the msg_id to the reply and pass the
         # reply_q to direct_send() to use it as the response queue.
         # Otherwise use the msg_id for backward compatibilty.
         if reply_q:
             msg['_msg_id'] = msg_id
-            conn.direct_send(reply_q, rpc_common.serialize_msg(msg))
+            conn.direct_send(reply_q, rpc_common.serialize_msg(msg, codec))
         else:
-            conn.direct_send(msg_id, rpc_common.serialize_msg(msg))
+            conn.direct_send(msg_id, rpc_common.serialize_msg(msg, codec))
 
 
 class RpcContext(rpc_common.CommonRpcContext):
@@ -254,6 +270,7 @@ class RpcContext(rpc_common.CommonRpcContext):
     def __init__(self, **kwargs):
         self.msg_id = kwargs.pop('msg_id', None)
         self.reply_q = kwargs.pop('reply_q', None)
+        self.reply_codec = kwargs.pop('reply_codec', None) or 'json'
         self.conf = kwargs.pop('conf')
         super(RpcContext, self).__init__(**kwargs)
 
@@ -262,13 +279,14 @@ class RpcContext(rpc_common.CommonRpcContext):
         values['conf'] = self.conf
         values['msg_id'] = self.msg_id
         values['reply_q'] = self.reply_q
+        values['reply_codec'] = self.reply_codec
         return self.__class__(**values)
 
     def reply(self, reply=None, failure=None, ending=False,
               connection_pool=None, log_failure=True):
         if self.msg_id:
             msg_reply(self.conf, self.msg_id, self.reply_q, connection_pool,
-                      reply, failure, ending, log_failure)
+                      reply, failure, ending, log_failure, self.reply_codec)
             if ending:
                 self.msg_id = None
 
@@ -285,6 +303,7 @@ def unpack_context(conf, msg):
             context_dict[key[9:]] = value
     context_dict['msg_id'] = msg.pop('_msg_id', None)
     context_dict['reply_q'] = msg.pop('_reply_q', None)
+    context_dict['reply_codec'] = msg.pop('_reply_codec', None)
     context_dict['conf'] = conf
     ctx = RpcContext.from_dict(context_dict)
     rpc_common._safe_log(LOG.debug, _('unpacked context: %s'), ctx.to_dict())
@@ -341,6 +360,12 @@ def _add_unique_id(msg):
     LOG.debug(_('UNIQUE_ID is %s.') % (unique_id))
 
 
+def _add_send_time(conf, msg):
+    """Add the send time for measuring the queueing delay of messages."""
+    if conf.rpc_latency_stats:
+        msg[SEND_TIME] = time.time()
+
+
 class _ThreadPoolWithWait(object):
     """Base class for a delayed invocation manager.
 
@@ -406,12 +431,13 @@ class CallbackWrapper(_ThreadPoolWithWait):
 class ProxyCallback(_ThreadPoolWithWait):
     """Calls methods on a proxy object based on method and args."""
 
-    def __init__(self, conf, proxy, connection_pool):
+    def __init__(self, conf, proxy, connection_pool, topic=None):
         super(ProxyCallback, self).__init__(
             conf=conf,
             connection_pool=connection_pool,
         )
         self.proxy = proxy
+        self.topic = topic
         self.msg_id_cache = _MsgIdCache()
 
     def __call__(self, message_data):
@@ -433,6 +459,7 @@ class ProxyCallback(_ThreadPoolWithWait):
             del local.store.context
         rpc_common._safe_log(LOG.debug, _('received %s'), message_data)
         self.msg_id_cache.check_duplicate_message(message_data)
+        send_time = message_data.pop(SEND_TIME, None)
         ctxt = unpack_context(self.conf, message_data)
         method = message_data.get('method')
         args = message_data.get('args', {})
@@ -444,9 +471,10 @@ class ProxyCallback(_ThreadPoolWithWait):
                        connection_pool=self.connection_pool)
             return
         self.pool.spawn_n(self._process_data, ctxt, version, method,
-                          namespace, args)
+                          namespace, args, send_time)
 
-    def _process_data(self, ctxt, version, method, namespace, args):
+    def _process_data(self, ctxt, version, method, namespace, args,
+                      send_time=None):
         """Process a message in a new thread.
 
         If the proxy object we have has a dispatch method
@@ -455,6 +483,11 @@ class ProxyCallback(_ThreadPoolWithWait):
         the old behavior of magically calling the specified method on the
         proxy we have here.
         """
+        started = time.time()
+        name = rpc_stats.method_name({'method': method,
+                                      'namespace': namespace})
+        if send_time is not None and self.conf.rpc_latency_stats:
+            rpc_stats.record('queue', self.topic, name, started - send_time)
         ctxt.update_store()
         try:
             rval = self.proxy.dispatch(ctxt, version, method, namespace,
@@ -479,11 +512,48 @@ class ProxyCallback(_ThreadPoolWithWait):
             LOG.error(_('Exception during message handling'),
                       exc_info=exc_info)
             ctxt.reply(None, exc_info, connection_pool=self.connection_pool)
+        if self.conf.rpc_latency_stats:
+            rpc_stats.record('dispatch', self.topic, name,
+                             time.time() - started)
+
+
+# { topic : codec } of the servers which replied to a call in the
+# rpc_codec.
+_TOPIC_CODECS = {}
+
+
+def _topic_codec(conf, topic):
+    """Return the codec to send a cast or a call to topic with.
+
+    A server which replied to a call in the rpc_codec runs a version of
+    this code with that codec installed, so it can decode it too.  That
+    says nothing about the other servers of a topic, so only the topics
+    of a single server, like compute.host1, are sent the rpc_codec.
+    """
+    if _TOPIC_CODECS.get(topic) == conf.rpc_codec:
+        return conf.rpc_codec
+    return 'json'
+
+
+def _learn_topic_codec(conf, topic, reply):
+    codec = reply.pop('_codec', 'json')
+    if conf.rpc_codec == 'json' or not topic or '.' not in topic:
+        return
+    if codec == conf.rpc_codec:
+        _TOPIC_CODECS[topic] = codec
+    else:
+        # E.g. the server was downgraded.
+        _TOPIC_CODECS.pop(topic, None)
 
 
 class MulticallProxyWaiter(object):
-    def __init__(self, conf, msg_id, timeout, connection_pool):
+    def __init__(self, conf, msg_id, timeout, connection_pool, topic=None,
+                 method=None):
         self._msg_id = msg_id
+        # The round trip is recorded under topic and method, if given.
+        self._topic = topic
+        self._method = method
+        self._started = time.time()
         self._timeout = timeout or conf.rpc_response_timeout
         self._reply_proxy = connection_pool.reply_proxy
         self._done = False
@@ -503,10 +573,14 @@ class MulticallProxyWaiter(object):
         self._done = True
         # Remove this caller from reply proxy's call_waiters
         self._reply_proxy.del_call_waiter(self._msg_id)
+        if self._method is not None and self._conf.rpc_latency_stats:
+            rpc_stats.record('client', self._topic, self._method,
+                             time.time() - self._started)
 
     def _process_data(self, data):
         result = None
         self.msg_id_cache.check_duplicate_message(data)
+        _learn_topic_codec(self._conf, self._topic, data)
         if data['failure']:
             failure = data['failure']
             result = rpc_common.deserialize_remote_exception(self._conf,
@@ -561,9 +635,17 @@ def multicall(conf, context, topic, msg, timeout, connection_pool):
         if not connection_pool.reply_proxy:
             connection_pool.reply_proxy = ReplyProxy(conf, connection_pool)
     msg.update({'_reply_q': connection_pool.reply_proxy.get_reply_q()})
-    wait_msg = MulticallProxyWaiter(conf, msg_id, timeout, connection_pool)
+    if conf.rpc_codec != 'json':
+        msg.update({'_reply_codec': conf.rpc_codec})
+    _add_send_time(conf, msg)
+    wait_msg = MulticallProxyWaiter(conf, msg_id, timeout, connection_pool,
+                                    topic=topic,
+                                    method=rpc_stats.method_name(msg))
     with ConnectionContext(conf, connection_pool) as conn:
-        conn.topic_send(topic, rpc_common.serialize_msg(msg), timeout)
+        conn.topic_send(topic,
+                        rpc_common.serialize_msg(msg,
+                                                 _topic_codec(conf, topic)),
+                        timeout)
     return wait_msg
 
 
@@ -581,15 +663,19 @@ def cast(conf, context, topic, msg, connection_pool):
     """Sends a message on a topic without waiting for a response."""
     LOG.debug(_('Making asynchronous cast on %s...'), topic)
     _add_unique_id(msg)
+    _add_send_time(conf, msg)
     pack_context(msg, context)
     with ConnectionContext(conf, connection_pool) as conn:
-        conn.topic_send(topic, rpc_common.serialize_msg(msg))
+        conn.topic_send(topic,
+                        rpc_common.serialize_msg(msg,
+                                                 _topic_codec(conf, topic)))
 
 
 def fanout_cast(conf, context, topic, msg, connection_pool):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
     _add_unique_id(msg)
+    _add_send_time(conf, msg)
     pack_context(msg, context)
     with ConnectionContext(conf, connection_pool) as conn:
         conn.fanout_send(topic, rpc_common.serialize_msg(msg))
@@ -598,16 +684,20 @@ def fanout_cast(conf, context, topic, msg, connection_pool):
 def cast_to_server(conf, context, server_params, topic, msg, connection_pool):
     """Sends a message on a topic to a specific server."""
     _add_unique_id(msg)
+    _add_send_time(conf, msg)
     pack_context(msg, context)
     with ConnectionContext(conf, connection_pool, pooled=False,
                            server_params=server_params) as conn:
-        conn.topic_send(topic, rpc_common.serialize_msg(msg))
+        conn.topic_send(topic,
+                        rpc_common.serialize_msg(msg,
+                                                 _topic_codec(conf, topic)))
 
 
 def fanout_cast_to_server(conf, context, server_params, topic, msg,
                           connection_pool):
     """Sends a message on a fanout exchange to a specific server."""
     _add_unique_id(msg)
+    _add_send_time(conf, msg)
     pack_context(msg, context)
     with ConnectionContext(conf, connection_pool, pooled=False,
                            server_params=server_params) as conn:
@@ -623,6 +713,8 @@ def notify(conf, context, topic, msg, connection_pool, envelope):
     pack_context(msg, context)
     with ConnectionContext(conf, connection_pool) as conn:
         if envelope:
+            # NOTE: Notifications are read by other projects, keep them
+            # in JSON whatever the rpc_codec.
             msg = rpc_common.serialize_msg(msg)
         conn.notify_send(topic, msg)
 
@@ -17,6 +17,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import copy
 import sys
 import traceback
@@ -24,6 +25,11 @@ import traceback
 from oslo.config import cfg
 import six
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from nova.openstack.common.gettextutils import _  # noqa
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
@@ -31,7 +37,17 @@ from nova.openstack.common import local
 from nova.openstack.common import log as logging
 
 
+rpc_codec_opt = cfg.StrOpt('rpc_codec',
+                           default='json',
+                           help='Encoding to negotiate for rpc messages, '
+                                'json or msgpack (if installed). Calls ask '
+                                'for their replies in it. Casts and calls '
+                                'to the topic of a single server are sent in '
+                                'it once the server replied to a call in it. '
+                                'Other messages are sent in JSON')
+
 CONF = cfg.CONF
+CONF.register_opt(rpc_codec_opt)
 LOG = logging.getLogger(__name__)
 
 
@@ -64,10 +80,23 @@ payload.
 We will JSON encode the application message payload.  The message envelope,
 which includes the JSON encoded application message body, will be passed down
 to the messaging libraries as a dict.
+
+Message format version '2.1' allows another encoding of the payload, named in
+the envelope:
+
+    {
+        'oslo.version': '2.1',
+        'oslo.codec': <Name of the codec, for example 'msgpack'>,
+        'oslo.message': <Application Message Payload, encoded by the codec>
+    }
+
+Messages with a JSON encoded payload are still sent as version '2.0', so that
+endpoints which only know that version can read them.
 '''
-_RPC_ENVELOPE_VERSION = '2.0'
+_RPC_ENVELOPE_VERSION = '2.1'
 
 _VERSION_KEY = 'oslo.version'
+_CODEC_KEY = 'oslo.codec'
 _MESSAGE_KEY = 'oslo.message'
 
 _REMOTE_POSTFIX = '_Remote'
@@ -161,6 +190,11 @@ class UnsupportedRpcEnvelopeVersion(RPCException):
                 "not supported by this endpoint.")
 
 
+class UnsupportedRpcCodec(RPCException):
+    msg_fmt = _("Specified RPC codec, %(codec)s, not supported by "
+                "this endpoint.")
+
+
 class RpcVersionCapError(RPCException):
     msg_fmt = _("Specified RPC version cap, %(version_cap)s, is too low")
 
@@ -456,13 +490,72 @@ def version_is_compatible(imp_version, version):
     return True
 
 
-def serialize_msg(raw_msg):
+def _json_key(key):
+    """Return a dict key the way JSON encodes it."""
+    if isinstance(key, six.string_types):
+        return key
+    if key is None:
+        return 'null'
+    if isinstance(key, float):
+        return repr(key)
+    if isinstance(key, six.integer_types):
+        return str(key)
+    raise TypeError(_("key %r is not a string") % (key,))
+
+
+def _json_keys_hook(obj):
+    """Turn the dict keys of a decoded map into strings, like JSON does."""
+    try:
+        # NOTE: A check of the keys at C speed, as this runs on every map
+        # of every message.
+        u''.join(obj)
+    except TypeError:
+        return dict((_json_key(k), v) for k, v in six.iteritems(obj))
+    return obj
+
+
+def _msgpack_dumps(raw_msg):
+    # NOTE: The messaging libraries send the envelope as JSON, which can
+    # not hold arbitrary bytes, hence the base64.
+    return base64.b64encode(msgpack.packb(raw_msg,
+                                          default=jsonutils.to_primitive))
+
+
+def _msgpack_loads(data):
+    # NOTE: Unlike JSON, msgpack keeps dict keys that aren't strings.  They
+    # are converted here rather than by the sender, which would have to
+    # walk the whole payload, to get the same payload with both codecs.
+    return msgpack.unpackb(base64.b64decode(data), encoding='utf-8',
+                           object_hook=_json_keys_hook)
+
+
+# The codecs a payload can be encoded with, as (dumps, loads) pairs.
+_CODECS = {'json': (jsonutils.dumps, jsonutils.loads)}
+if msgpack is not None:
+    _CODECS['msgpack'] = (_msgpack_dumps, _msgpack_loads)
+
+
+def _get_codec(codec):
+    try:
+        return _CODECS[codec]
+    except KeyError:
+        raise UnsupportedRpcCodec(codec=codec)
+
+
+def serialize_msg(raw_msg, codec='json'):
+    """Wrap raw_msg in a message envelope, with its payload encoded with
+    codec.
+    """
     # NOTE(russellb) See the docstring for _RPC_ENVELOPE_VERSION for more
     # information about this format.
-    msg = {_VERSION_KEY: _RPC_ENVELOPE_VERSION,
-           _MESSAGE_KEY: jsonutils.dumps(raw_msg)}
+    if codec == 'json':
+        return {_VERSION_KEY: '2.0',
+                _MESSAGE_KEY: jsonutils.dumps(raw_msg)}
 
-    return msg
+    dumps, _loads = _get_codec(codec)
+    return {_VERSION_KEY: _RPC_ENVELOPE_VERSION,
+            _CODEC_KEY: codec,
+            _MESSAGE_KEY: dumps(raw_msg)}
 
 
 def deserialize_msg(msg):
@@ -504,6 +597,7 @@ def deserialize_msg(msg):
     if not version_is_compatible(_RPC_ENVELOPE_VERSION, msg[_VERSION_KEY]):
         raise UnsupportedRpcEnvelopeVersion(version=msg[_VERSION_KEY])
 
-    raw_msg = jsonutils.loads(msg[_MESSAGE_KEY])
+    _dumps, loads = _get_codec(msg.get(_CODEC_KEY, 'json'))
+    raw_msg = loads(msg[_MESSAGE_KEY])
 
     return raw_msg
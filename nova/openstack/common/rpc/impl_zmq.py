@@ -220,7 +220,7 @@ class ZmqClient(object):
                            (msg_id, topic, 'cast', _serialize(data))))
             return
 
-        rpc_envelope = rpc_common.serialize_msg(data[1], envelope)
+        rpc_envelope = rpc_common.serialize_msg(data[1])
         zmq_msg = reduce(lambda x, y: x + y, rpc_envelope.items())
         self.outq.send(map(bytes,
                        (msg_id, topic, 'impl_zmq_v2', data[0]) + zmq_msg))
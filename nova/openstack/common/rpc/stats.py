@@ -0,0 +1,118 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Latency histograms of rpc messages.
+
+Three latencies are kept, per topic and per method:
+
+    client   - round trip of a call, from sending the request to the last
+               reply (or the timeout)
+    queue    - time a cast or call waited between being sent and starting
+               to be dispatched.  The sender and the receiver are usually
+               on different hosts, so this includes their clock skew.
+    dispatch - time the receiver spent running the method and replying
+
+Topics are kept without their server part, so that calls to compute.host1
+and compute.host2 are counted together as compute.  The histograms have
+fixed buckets, so the memory used does not grow with the traffic.
+"""
+
+import bisect
+import math
+
+# Upper bounds of the histogram buckets, in milliseconds.  The last bucket
+# holds everything slower.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+           30000, 60000)
+
+KINDS = ('client', 'queue', 'dispatch')
+
+# { kind : { topic : { method : Histogram } } }
+_STATS = dict((kind, {}) for kind in KINDS)
+
+
+class Histogram(object):
+    """The distribution of a latency, in milliseconds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        # A negative queueing delay means the clocks are skewed.
+        msecs = max(seconds, 0.0) * 1000
+        self.counts[bisect.bisect_left(BUCKETS, msecs)] += 1
+        self.count += 1
+        self.total += msecs
+        self.max = max(self.max, msecs)
+
+    def percentile(self, percent):
+        """Return an upper bound of the given percentile, or None."""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * percent / 100.0)
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        buckets = dict(('<=%dms' % bound, count)
+                       for bound, count in zip(BUCKETS, self.counts)
+                       if count)
+        if self.counts[-1]:
+            buckets['>%dms' % BUCKETS[-1]] = self.counts[-1]
+        return {'count': self.count,
+                'mean_ms': self.total / self.count if self.count else None,
+                'max_ms': self.max,
+                'p50_ms': self.percentile(50),
+                'p90_ms': self.percentile(90),
+                'p99_ms': self.percentile(99),
+                'buckets': buckets}
+
+
+def method_name(msg):
+    """Return the name a message is counted under."""
+    if msg.get('namespace'):
+        return '%s.%s' % (msg['namespace'], msg.get('method'))
+    return msg.get('method')
+
+
+def record(kind, topic, method, seconds):
+    """Add a latency, in seconds, to the histogram of a topic and method."""
+    topic = (topic or 'unknown').split('.', 1)[0]
+    methods = _STATS[kind].setdefault(topic, {})
+    histogram = methods.get(method)
+    if histogram is None:
+        histogram = methods[method] = Histogram()
+    histogram.add(seconds)
+
+
+def get_stats():
+    """Dump all the histograms of this process."""
+    return dict((kind, dict((topic, dict((method, histogram.to_dict())
+                                         for method, histogram
+                                         in methods.iteritems()))
+                            for topic, methods in topics.iteritems()))
+                for kind, topics in _STATS.iteritems())
+
+
+def reset():
+    for topics in _STATS.itervalues():
+        topics.clear()
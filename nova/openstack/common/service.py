@@ -139,15 +139,23 @@ class ServiceWrapper(object):
 
 
 class ProcessLauncher(object):
-    def __init__(self):
+    def __init__(self, rolling_restart=False):
         self.children = {}
         self.sigcaught = None
         self.running = True
+        # Whether SIGHUP restarts the children one at a time, the children
+        # still to be replaced by such a restart, and the one currently
+        # stopping.
+        self.rolling_restart = rolling_restart
+        self.restarts = []
+        self.restarting = None
         rfd, self.writepipe = os.pipe()
         self.readpipe = eventlet.greenio.GreenPipe(rfd, 'r')
 
         signal.signal(signal.SIGTERM, self._handle_signal)
         signal.signal(signal.SIGINT, self._handle_signal)
+        if rolling_restart:
+            signal.signal(signal.SIGHUP, self._handle_sighup)
 
     def _handle_signal(self, signo, frame):
         self.sigcaught = signo
@@ -157,6 +165,29 @@ class ProcessLauncher(object):
         signal.signal(signal.SIGTERM, signal.SIG_DFL)
         signal.signal(signal.SIGINT, signal.SIG_DFL)
 
+    def _handle_sighup(self, signo, frame):
+        # Replace the children one at a time, so that the others keep
+        # serving while each one finishes its requests and restarts.
+        self.restarts = list(self.children)
+
+    def _restart_next_child(self):
+        if self.restarting in self.children:
+            return
+        self.restarting = None
+        while self.restarts:
+            pid = self.restarts.pop(0)
+            if pid not in self.children:
+                continue
+            LOG.info(_('Restarting child %d'), pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as exc:
+                if exc.errno != errno.ESRCH:
+                    raise
+                continue
+            self.restarting = pid
+            return
+
     def _pipe_watcher(self):
         # This will block until the write end is closed when the parent
         # dies unexpectedly
@@ -175,6 +206,9 @@ class ProcessLauncher(object):
         signal.signal(signal.SIGTERM, _sigterm)
         # Block SIGINT and let the parent send us a SIGTERM
         signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if self.rolling_restart:
+            # The parent restarts us on SIGHUP
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
 
         # Reopen the eventlet hub to make sure we don't share an epoll
         # fd with parent and/or siblings, which would be bad
@@ -277,6 +311,7 @@ class ProcessLauncher(object):
         CONF.log_opt_values(LOG, std_logging.DEBUG)
 
         while self.running:
+            self._restart_next_child()
             wrap = self._wait_child()
             if not wrap:
                 # Yield to other threads if no children have exited
@@ -323,9 +358,9 @@ class Service(object):
         self.tg.wait()
 
 
-def launch(service, workers=None):
+def launch(service, workers=None, rolling_restart=False):
     if workers:
-        launcher = ProcessLauncher()
+        launcher = ProcessLauncher(rolling_restart=rolling_restart)
         launcher.launch_service(service, workers=workers)
     else:
         launcher = ServiceLauncher()
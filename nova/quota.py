@@ -19,14 +19,18 @@
 """Quotas for instances, and floating ips."""
 
 import datetime
+import urllib
+import uuid
 
 from oslo.config import cfg
 
+import nova.context
 from nova import db
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 
 LOG = logging.getLogger(__name__)
@@ -78,6 +82,23 @@ quota_opts = [
     cfg.IntOpt('max_age',
                default=0,
                help='number of seconds between subsequent usage refreshes'),
+    cfg.StrOpt('quota_reservation_engine',
+               default='locking',
+               help='How DbQuotaDriver reserves quota: "locking" locks all '
+                    'the usages of the project for the duration of the '
+                    'reservation, "optimistic" uses atomic updates of '
+                    'single usage rows and validates the quotas afterwards'),
+    cfg.IntOpt('quota_usage_shards',
+               default=1,
+               help='number of usage rows each resource is spread over by '
+                    'the optimistic reservation engine, to reduce row '
+                    'contention in busy projects'),
+    cfg.IntOpt('quota_cache_ttl',
+               default=0,
+               help='number of seconds quota limits and class quotas are '
+                    'cached for by DbQuotaDriver, 0 disables the cache.  '
+                    'The cache is local to each process unless '
+                    'memcached_servers is set'),
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='default driver to use for quota checks'),
@@ -86,6 +107,84 @@ quota_opts = [
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
 
+# NOTE: Quota limits change rarely but are read several times by every
+#       request that checks a quota, so DbQuotaDriver may cache them.
+#       Writes made through this node invalidate the affected entries;
+#       other nodes see them once their entries expire, or at once when
+#       they share the cache through memcached.
+MC = None
+_CACHE_GENERATION_KEY = 'quotacache-generation'
+
+
+def _get_cache():
+    global MC
+
+    if MC is None:
+        MC = memorycache.get_client()
+
+    return MC
+
+
+def reset_cache():
+    """Reset the cache, mainly for testing purposes."""
+
+    global MC
+
+    MC = None
+
+
+def _make_cache_key(*args):
+    # All keys embed the current generation, so flush_cache() can drop
+    # every entry at once, including those held by other processes
+    # sharing the cache.
+    generation = _get_cache().get(_CACHE_GENERATION_KEY) or '0'
+    parts = [urllib.quote(unicode(arg).encode('utf-8'), safe='')
+             for arg in args]
+    return 'quotacache-%s-%s' % (generation, ':'.join(parts))
+
+
+def _cached(key, loader, authorize=None):
+    """Return a copy of the cached value of key, loading it on a miss.
+
+    The DB API checks that the context may read what it loads; since a
+    cache hit skips the DB, authorize is called first to do the same.
+    """
+    if not CONF.quota_cache_ttl:
+        return loader()
+    if authorize:
+        authorize()
+    cache = _get_cache()
+    cache_key = _make_cache_key(*key)
+    value = cache.get(cache_key)
+    if value is None:
+        value = loader()
+        cache.set(cache_key, value, CONF.quota_cache_ttl)
+    return dict(value)
+
+
+def invalidate_cache(project_id=None, user_id=None, quota_class=None):
+    """Drop the cached quota limits after they have been changed.
+
+    :param project_id: Drop the quotas of this project.
+    :param user_id: Also drop the quotas of this user of the project.
+    :param quota_class: Drop the quotas of this quota class.
+    """
+    keys = []
+    if project_id is not None:
+        keys.append(('project', project_id))
+        if user_id is not None:
+            keys.append(('user', project_id, user_id))
+    if quota_class is not None:
+        keys.append(('class', quota_class))
+    cache = _get_cache()
+    for key in keys:
+        cache.delete(_make_cache_key(*key))
+
+
+def flush_cache():
+    """Drop all the cached quota limits."""
+    _get_cache().set(_CACHE_GENERATION_KEY, uuid.uuid4().hex)
+
 
 class DbQuotaDriver(object):
     """
@@ -93,6 +192,33 @@ class DbQuotaDriver(object):
     quota information.  The default driver utilizes the local
     database.
     """
+    def _get_project_limits(self, context, project_id):
+        return _cached(('project', project_id),
+                       lambda: db.quota_get_all_by_project(context,
+                                                           project_id),
+                       lambda: nova.context.authorize_project_context(
+                           context, project_id))
+
+    def _get_user_limits(self, context, project_id, user_id):
+        return _cached(('user', project_id, user_id),
+                       lambda: db.quota_get_all_by_project_and_user(
+                           context, project_id, user_id),
+                       lambda: nova.context.authorize_project_context(
+                           context, project_id))
+
+    def _get_class_limits(self, context, quota_class):
+        return _cached(('class', quota_class),
+                       lambda: db.quota_class_get_all_by_name(context,
+                                                              quota_class),
+                       lambda: nova.context.authorize_quota_class_context(
+                           context, quota_class))
+
+    def _get_default_limits(self, context):
+        # NOTE: The defaults are the quotas of the 'default' class, so
+        #       they share its cache entry.
+        return _cached(('class', 'default'),
+                       lambda: db.quota_class_get_default(context))
+
     def get_by_project_and_user(self, context, project_id, user_id, resource):
         """Get a specific quota by project and user."""
 
@@ -118,7 +244,7 @@ class DbQuotaDriver(object):
         """
 
         quotas = {}
-        default_quotas = db.quota_class_get_default(context)
+        default_quotas = self._get_default_limits(context)
         for resource in resources.values():
             quotas[resource.name] = default_quotas.get(resource.name,
                                                        resource.default)
@@ -141,7 +267,7 @@ class DbQuotaDriver(object):
         """
 
         quotas = {}
-        class_quotas = db.quota_class_get_all_by_name(context, quota_class)
+        class_quotas = self._get_class_limits(context, quota_class)
         for resource in resources.values():
             if defaults or resource.name in class_quotas:
                 quotas[resource.name] = class_quotas.get(resource.name,
@@ -160,7 +286,7 @@ class DbQuotaDriver(object):
         if project_id == context.project_id:
             quota_class = context.quota_class
         if quota_class:
-            class_quotas = db.quota_class_get_all_by_name(context, quota_class)
+            class_quotas = self._get_class_limits(context, quota_class)
         else:
             class_quotas = {}
 
@@ -220,10 +346,9 @@ class DbQuotaDriver(object):
         :param usages: If True, the current in_use and reserved counts
                        will also be returned.
         """
-        user_quotas = db.quota_get_all_by_project_and_user(context,
-                                                           project_id, user_id)
+        user_quotas = self._get_user_limits(context, project_id, user_id)
         # Use the project quota for default user quota.
-        proj_quotas = db.quota_get_all_by_project(context, project_id)
+        proj_quotas = self._get_project_limits(context, project_id)
         for key, value in proj_quotas.iteritems():
             if key not in user_quotas.keys():
                 user_quotas[key] = value
@@ -260,7 +385,7 @@ class DbQuotaDriver(object):
         :param remains: If True, the current remains of the project will
                         will be returned.
         """
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = self._get_project_limits(context, project_id)
         project_usages = None
         if usages:
             project_usages = db.quota_usage_get_all_by_project(context,
@@ -482,6 +607,14 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
+        if CONF.quota_reservation_engine == 'optimistic':
+            return db.quota_reserve_optimistic(context, resources, quotas,
+                                               user_quotas, deltas, expire,
+                                               CONF.until_refresh,
+                                               CONF.max_age,
+                                               shards=CONF.quota_usage_shards,
+                                               project_id=project_id,
+                                               user_id=user_id)
         return db.quota_reserve(context, resources, quotas, user_quotas,
                                 deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
@@ -507,6 +640,11 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
+        if CONF.quota_reservation_engine == 'optimistic':
+            db.reservation_commit_optimistic(context, reservations,
+                                             project_id=project_id,
+                                             user_id=user_id)
+            return
         db.reservation_commit(context, reservations, project_id=project_id,
                               user_id=user_id)
 
@@ -530,6 +668,11 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
+        if CONF.quota_reservation_engine == 'optimistic':
+            db.reservation_rollback_optimistic(context, reservations,
+                                               project_id=project_id,
+                                               user_id=user_id)
+            return
         db.reservation_rollback(context, reservations, project_id=project_id,
                                 user_id=user_id)
 
@@ -574,6 +717,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project_and_user(context, project_id, user_id)
+        invalidate_cache(project_id=project_id, user_id=user_id)
 
     def destroy_all_by_project(self, context, project_id):
         """
@@ -585,6 +729,8 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project(context, project_id)
+        # The users of the project are not known here, so drop them all
+        flush_cache()
 
     def expire(self, context):
         """Expire reservations.
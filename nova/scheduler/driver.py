@@ -147,3 +147,9 @@ class Scheduler(object):
         """Must override select_hosts method for scheduler to work."""
         msg = _("Driver must implement select_hosts")
         raise NotImplementedError(msg)
+
+    def get_stats(self):
+        """Return a dict of counters about the decisions made so far.
+        Override in a subclass that keeps any.
+        """
+        return {}
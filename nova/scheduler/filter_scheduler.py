@@ -19,6 +19,8 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
+import itertools
 import random
 
 from oslo.config import cfg
@@ -31,6 +33,7 @@ from nova.openstack.common import log as logging
 from nova.pci import pci_request
 from nova.scheduler import driver
 from nova.scheduler import scheduler_options
+from nova.scheduler import tracing
 from nova.scheduler import utils as scheduler_utils
 
 
@@ -47,7 +50,27 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='Filter and weigh the hosts only once for requests '
+                     'that boot multiple instances. After each instance '
+                     'is placed only the chosen host is filtered and '
+                     'weighed again. Requests using server groups are '
+                     'always scheduled one instance at a time'),
+    cfg.BoolOpt('scheduler_trace_notifications',
+                default=False,
+                help='Send a scheduler.schedule.trace notification with the '
+                     'time spent in each phase and filter for every '
+                     'scheduling decision'),
+    cfg.BoolOpt('scheduler_optimistic_claims',
+                default=False,
+                help='Claim the resources of each instance on the compute '
+                     'node record of the chosen host, and choose another '
+                     'host if the record changed since it was read. Enable '
+                     'this when running several schedulers, and on the '
+                     'compute hosts so that their resource audits correct '
+                     'the claims'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -60,6 +83,7 @@ class FilterScheduler(driver.Scheduler):
         self.options = scheduler_options.SchedulerOptions()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.notifier = notifier.get_notifier('scheduler')
+        self.trace_stats = tracing.TraceStats()
 
     def schedule_run_instance(self, context, request_spec,
                               admin_password, injected_files,
@@ -274,11 +298,50 @@ class FilterScheduler(driver.Scheduler):
                       'instance_uuid': instance_uuid})
             raise exception.NoValidHost(reason=msg)
 
+    def get_stats(self):
+        """Returns the counters summed over all scheduling decisions, and
+        the counters of each filter.
+        """
+        stats = self.trace_stats.to_dict()
+        stats['filters'] = self.host_manager.get_filter_stats()
+        stats['claim_conflicts'] = self.host_manager.claim_conflicts
+        return stats
+
     def _schedule(self, context, request_spec, filter_properties,
                   instance_uuids=None):
         """Returns a list of hosts that meet the required specs,
         ordered by their fitness.
+
+        The decision is traced: the trace is logged, optionally sent as a
+        notification, and added to the counters returned by get_stats().
         """
+        if instance_uuids:
+            num_instances = len(instance_uuids)
+        else:
+            num_instances = request_spec.get('num_instances', 1)
+
+        trace = tracing.ScheduleTrace()
+        selected_hosts = []
+        try:
+            with tracing.tracing(trace):
+                selected_hosts = self._get_selected_hosts(context,
+                        request_spec, filter_properties, instance_uuids,
+                        num_instances)
+        finally:
+            trace.finish(num_instances, len(selected_hosts))
+            self._record_trace(context, trace, instance_uuids)
+        return selected_hosts
+
+    def _record_trace(self, context, trace, instance_uuids):
+        self.trace_stats.add(trace)
+        payload = trace.to_dict()
+        payload['instance_uuids'] = instance_uuids
+        LOG.debug(_("Scheduling trace: %s"), payload)
+        if CONF.scheduler_trace_notifications:
+            self.notifier.info(context, 'scheduler.schedule.trace', payload)
+
+    def _get_selected_hosts(self, context, request_spec, filter_properties,
+                            instance_uuids, num_instances):
         elevated = context.elevated()
         instance_properties = request_spec['instance_properties']
         instance_type = request_spec.get("instance_type", None)
@@ -323,11 +386,12 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self.host_manager.get_all_host_states(elevated)
 
+        if (CONF.scheduler_batch_placement and num_instances > 1 and
+                not update_group_hosts):
+            return self._schedule_batch(elevated, hosts, filter_properties,
+                                        instance_properties, num_instances)
+
         selected_hosts = []
-        if instance_uuids:
-            num_instances = len(instance_uuids)
-        else:
-            num_instances = request_spec.get('num_instances', 1)
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -338,24 +402,113 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
 
+            chosen_host = self._choose_host(elevated, hosts,
+                                            filter_properties,
+                                            instance_properties)
+            if not chosen_host:
+                break
+            selected_hosts.append(chosen_host)
+
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            chosen_host.obj.consume_from_instance(instance_properties)
+            if update_group_hosts is True:
+                filter_properties['group_hosts'].append(chosen_host.obj.host)
+        return selected_hosts
+
+    def _choose_host(self, context, hosts, filter_properties,
+                     instance_properties):
+        """Returns a weighed host chosen among the best hosts, or None.
+
+        Hosts whose claim conflicts are removed from hosts, and another
+        host is chosen.
+        """
+        while hosts:
+            scheduler_host_subset_size = self._get_host_subset_size(
+                    len(hosts))
+
+            # Only the best hosts that we may choose from need to be
+            # fully sorted.
             weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    filter_properties)
+                    filter_properties, limit=scheduler_host_subset_size)
 
             LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
-
             chosen_host = random.choice(
                 weighed_hosts[0:scheduler_host_subset_size])
+            if self._claim_host(context, chosen_host, instance_properties):
+                return chosen_host
+            hosts.remove(chosen_host.obj)
+        return None
+
+    def _claim_host(self, context, weighed_host, instance_properties):
+        """Returns False if the optimistic claim on the host conflicted."""
+        if not CONF.scheduler_optimistic_claims:
+            return True
+        return self.host_manager.claim_host(context, weighed_host.obj,
+                                            instance_properties)
+
+    def _get_host_subset_size(self, num_hosts):
+        """Returns the number of best weighed hosts to choose from."""
+        scheduler_host_subset_size = CONF.scheduler_host_subset_size
+        if scheduler_host_subset_size > num_hosts:
+            scheduler_host_subset_size = num_hosts
+        if scheduler_host_subset_size < 1:
+            scheduler_host_subset_size = 1
+        return scheduler_host_subset_size
+
+    def _schedule_batch(self, context, hosts, filter_properties,
+                        instance_properties, num_instances):
+        """Returns a list of weighed hosts for num_instances instances.
+
+        All hosts are filtered and weighed once and kept in a heap keyed
+        by weight.  After an instance is placed only the chosen host is
+        filtered and weighed again before being pushed back, which is
+        enough because consuming resources on a host doesn't change the
+        weight of the other hosts.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                filter_properties)
+
+        # The heap is keyed by the negated weight, and then by a counter
+        # so hosts with equal weights keep their weighed order.
+        counter = itertools.count()
+        heap = [(-weighed_host.weight, counter.next(), weighed_host)
+                for weighed_host in weighed_hosts]
+        heapq.heapify(heap)
+
+        selected_hosts = []
+        while heap and len(selected_hosts) < num_instances:
+            scheduler_host_subset_size = self._get_host_subset_size(
+                    len(heap))
+            best_hosts = [heapq.heappop(heap)
+                          for i in xrange(scheduler_host_subset_size)]
+            chosen = random.choice(best_hosts)
+            for entry in best_hosts:
+                if entry is not chosen:
+                    heapq.heappush(heap, entry)
+
+            chosen_host = chosen[2]
+            if not self._claim_host(context, chosen_host,
+                                    instance_properties):
+                continue
             selected_hosts.append(chosen_host)
 
-            # Now consume the resources so the filter/weights
-            # will change for the next instance.
+            # Now consume the resources and check whether the chosen host
+            # still fits and how it weighs for the next instance.
             chosen_host.obj.consume_from_instance(instance_properties)
-            if update_group_hosts is True:
-                filter_properties['group_hosts'].append(chosen_host.obj.host)
+            if not self.host_manager.get_filtered_hosts([chosen_host.obj],
+                    filter_properties, index=len(selected_hosts)):
+                continue
+            reweighed_host = self.host_manager.get_weighed_hosts(
+                    [chosen_host.obj], filter_properties)[0]
+            heapq.heappush(heap, (-reweighed_host.weight, counter.next(),
+                                  reweighed_host))
         return selected_hosts
@@ -30,49 +30,78 @@ class AffinityFilter(filters.BaseHostFilter):
         self.compute_api = compute.API()
 
 
-class DifferentHostFilter(AffinityFilter):
-    '''Schedule the instance on a different host from a set of instances.'''
+class _InstanceAffinityFilter(AffinityFilter):
+    """Base class for filters keyed on hosts of a set of hinted instances.
+
+    The hinted instances are resolved to their hosts with a single lookup
+    per request in filter_all(), so the number of DB queries does not grow
+    with the number of candidate hosts.
+    """
+
+    # Name of the scheduler hint holding the instance uuids
+    hint_name = None
 
     # The hosts the instances are running on doesn't change within a request
     run_filter_once_per_request = True
 
-    def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
+    def _get_affinity_hosts(self, filter_properties):
+        """Return the set of hosts running the hinted instances, or None
+        if the hint was not given.
+        """
         scheduler_hints = filter_properties.get('scheduler_hints') or {}
-
-        affinity_uuids = scheduler_hints.get('different_host', [])
+        affinity_uuids = scheduler_hints.get(self.hint_name, [])
         if isinstance(affinity_uuids, basestring):
             affinity_uuids = [affinity_uuids]
-        if affinity_uuids:
-            return not self.compute_api.get_all(context,
-                                                {'host': host_state.host,
-                                                 'uuid': affinity_uuids,
-                                                 'deleted': False})
-        # With no different_host key
-        return True
+        if not affinity_uuids:
+            return None
+        context = filter_properties['context']
+        instances = self.compute_api.get_all(context,
+                                             {'uuid': affinity_uuids,
+                                              'deleted': False})
+        return set(instance['host'] for instance in instances)
+
+    def _host_in_affinity_hosts_passes(self, in_affinity_hosts):
+        """Override in a subclass to decide whether a host passes."""
+        raise NotImplementedError()
+
+    def run_filter_for_properties(self, filter_properties):
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        return bool(scheduler_hints.get(self.hint_name))
+
+    def host_passes(self, host_state, filter_properties):
+        affinity_hosts = self._get_affinity_hosts(filter_properties)
+        if affinity_hosts is None:
+            return True
+        return self._host_in_affinity_hosts_passes(
+                host_state.host in affinity_hosts)
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        affinity_hosts = self._get_affinity_hosts(filter_properties)
+        if affinity_hosts is None:
+            return filter_obj_list
+        return [host_state for host_state in filter_obj_list
+                if self._host_in_affinity_hosts_passes(
+                        host_state.host in affinity_hosts)]
+
+
+class DifferentHostFilter(_InstanceAffinityFilter):
+    '''Schedule the instance on a different host from a set of instances.'''
 
+    hint_name = 'different_host'
 
-class SameHostFilter(AffinityFilter):
+    def _host_in_affinity_hosts_passes(self, in_affinity_hosts):
+        return not in_affinity_hosts
+
+
+class SameHostFilter(_InstanceAffinityFilter):
     '''Schedule the instance on the same host as another instance in a set of
     of instances.
     '''
 
-    # The hosts the instances are running on doesn't change within a request
-    run_filter_once_per_request = True
+    hint_name = 'same_host'
 
-    def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
-
-        affinity_uuids = scheduler_hints.get('same_host', [])
-        if isinstance(affinity_uuids, basestring):
-            affinity_uuids = [affinity_uuids]
-        if affinity_uuids:
-            return self.compute_api.get_all(context, {'host': host_state.host,
-                                                      'uuid': affinity_uuids,
-                                                      'deleted': False})
-        # With no same_host key
-        return True
+    def _host_in_affinity_hosts_passes(self, in_affinity_hosts):
+        return in_affinity_hosts
 
 
 class SimpleCIDRAffinityFilter(AffinityFilter):
@@ -82,6 +111,10 @@ class SimpleCIDRAffinityFilter(AffinityFilter):
     # The address of a host doesn't change within a request
     run_filter_once_per_request = True
 
+    def run_filter_for_properties(self, filter_properties):
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        return bool(scheduler_hints.get('build_near_host_ip'))
+
     def host_passes(self, host_state, filter_properties):
         scheduler_hints = filter_properties.get('scheduler_hints') or {}
 
@@ -103,6 +136,9 @@ class GroupAntiAffinityFilter(AffinityFilter):
     hosts.
     """
 
+    def run_filter_for_properties(self, filter_properties):
+        return bool(filter_properties.get('group_hosts'))
+
     def host_passes(self, host_state, filter_properties):
         group_hosts = filter_properties.get('group_hosts') or []
         LOG.debug(_("Group anti affinity: check if %(host)s not "
@@ -119,6 +155,9 @@ class GroupAffinityFilter(AffinityFilter):
     """Schedule the instance on to host from a set of group hosts.
     """
 
+    def run_filter_for_properties(self, filter_properties):
+        return bool(filter_properties.get('group_hosts'))
+
     def host_passes(self, host_state, filter_properties):
         group_hosts = filter_properties.get('group_hosts', [])
         LOG.debug(_("Group affinity: check if %(host)s in "
@@ -86,59 +86,80 @@ class JsonFilter(filters.BaseHostFilter):
         'and': _and,
     }
 
-    def _parse_string(self, string, host_state):
+    def _compile_string(self, string):
         """Strings prefixed with $ are capability lookups in the
         form '$variable' where 'variable' is an attribute in the
         HostState class.  If $variable is a dictionary, you may
         use: $variable.dictkey
+
+        Returns a function of a host state returning the value of the
+        string for the host, or None if the string is empty.
         """
         if not string:
             return None
         if not string.startswith("$"):
-            return string
+            return lambda host_state: string
 
         path = string[1:].split(".")
-        obj = getattr(host_state, path[0], None)
-        if obj is None:
-            return None
-        for item in path[1:]:
-            obj = obj.get(item, None)
-            if obj is None:
-                return None
-        return obj
-
-    def _process_filter(self, query, host_state):
-        """Recursively parse the query structure."""
+        attr_name = path[0]
+        keys = path[1:]
+
+        def lookup(host_state):
+            obj = getattr(host_state, attr_name, None)
+            for key in keys:
+                if obj is None:
+                    return None
+                obj = obj.get(key, None)
+            return obj
+        return lookup
+
+    def _compile_query(self, query):
+        """Compile the query structure into a function of a host state
+        returning the result of the query for the host.
+
+        The query is walked and its variables are resolved to lookups only
+        once, so evaluating it for each host is cheap.
+        """
         if not query:
-            return True
-        cmd = query[0]
-        method = self.commands[cmd]
-        cooked_args = []
+            return lambda host_state: True
+        method = self.commands[query[0]]
+        arg_getters = []
         for arg in query[1:]:
             if isinstance(arg, list):
-                arg = self._process_filter(arg, host_state)
+                arg_getters.append(self._compile_query(arg))
             elif isinstance(arg, basestring):
-                arg = self._parse_string(arg, host_state)
-            if arg is not None:
-                cooked_args.append(arg)
-        result = method(self, cooked_args)
-        return result
-
-    def host_passes(self, host_state, filter_properties):
-        """Return a list of hosts that can fulfill the requirements
-        specified in the query.
+                getter = self._compile_string(arg)
+                if getter is not None:
+                    arg_getters.append(getter)
+            elif arg is not None:
+                arg_getters.append(lambda host_state, arg=arg: arg)
+
+        def evaluate(host_state):
+            cooked_args = []
+            for getter in arg_getters:
+                arg = getter(host_state)
+                if arg is not None:
+                    cooked_args.append(arg)
+            return method(self, cooked_args)
+        return evaluate
+
+    def _get_query_func(self, filter_properties):
+        """Return the compiled query of the request, or None if there's no
+        query.
         """
         try:
             query = filter_properties['scheduler_hints']['query']
         except KeyError:
             query = None
         if not query:
-            return True
+            return None
+        return self._compile_query(jsonutils.loads(query))
 
+    def _query_passes(self, query_func, host_state):
         # NOTE(comstud): Not checking capabilities or service for
         # enabled/disabled so that a provided json filter can decide
 
-        result = self._process_filter(jsonutils.loads(query), host_state)
+        result = query_func(host_state)
         if isinstance(result, list):
             # If any succeeded, include the host
             result = any(result)
@@ -146,3 +167,24 @@ class JsonFilter(filters.BaseHostFilter):
             # Filter it out.
             return True
         return False
+
+    def run_filter_for_properties(self, filter_properties):
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        return bool(scheduler_hints.get('query'))
+
+    def host_passes(self, host_state, filter_properties):
+        """Return a list of hosts that can fulfill the requirements
+        specified in the query.
+        """
+        query_func = self._get_query_func(filter_properties)
+        if query_func is None:
+            return True
+        return self._query_passes(query_func, host_state)
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Compile the query once and evaluate it for every host."""
+        query_func = self._get_query_func(filter_properties)
+        if query_func is None:
+            return filter_obj_list
+        return [host_state for host_state in filter_obj_list
+                if self._query_passes(query_func, host_state)]
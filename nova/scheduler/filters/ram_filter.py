@@ -16,10 +16,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -80,11 +80,8 @@ class AggregateRamFilter(BaseRamFilter):
 
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='ram_allocation_ratio')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     context, host_state, key='ram_allocation_ratio')
         aggregate_vals = metadata.get('ram_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
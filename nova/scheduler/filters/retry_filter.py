@@ -25,6 +25,9 @@ class RetryFilter(filters.BaseHostFilter):
     purposes
     """
 
+    def run_filter_for_properties(self, filter_properties):
+        return bool(filter_properties.get('retry'))
+
     def host_passes(self, host_state, filter_properties):
         """Skip nodes that have already been attempted."""
         retry = filter_properties.get('retry', None)
@@ -55,8 +55,10 @@ from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import loopingcall
 from nova.openstack.common import timeutils
 from nova.scheduler import filters
+from nova import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -76,6 +78,14 @@ trusted_opts = [
     cfg.IntOpt('attestation_auth_timeout',
                default=60,
                help='Attestation status cache valid period length'),
+    cfg.IntOpt('attestation_refresh_interval',
+               default=0,
+               help='Interval in seconds at which the attestation status '
+                    'of all compute nodes is refreshed in the background. '
+                    'Filters are then answered from the cache, even when '
+                    'it is out of date, and never wait on the attestation '
+                    'server. 0 refreshes the cache from the scheduling '
+                    'path when it is out of date'),
 ]
 
 CONF = cfg.CONF
@@ -195,11 +205,17 @@ class ComputeAttestationCache(object):
 
     OAT service may have cache also. OAT service's cache valid time
     should be set shorter than trusted filter's cache valid time.
+
+    If attestation_refresh_interval is set, all the compute nodes are
+    attested in a single request at that interval in the background, and
+    out of date entries are served while a refresh is in progress.
     """
 
     def __init__(self):
         self.attestservice = AttestationService()
         self.compute_nodes = {}
+        self._refreshing = False
+        self._refresher = None
         admin = context.get_admin_context()
 
         # Fetch compute node list to initialize the compute_nodes,
@@ -214,6 +230,12 @@ class ComputeAttestationCache(object):
             host = service['host']
             self._init_cache_entry(host)
 
+        refresh_interval = CONF.trusted_computing.attestation_refresh_interval
+        if refresh_interval > 0:
+            self._refresher = loopingcall.FixedIntervalLoopingCall(
+                    self._periodic_refresh)
+            self._refresher.start(interval=refresh_interval, initial_delay=0)
+
     def _cache_valid(self, host):
         cachevalid = False
         if host in self.compute_nodes:
@@ -224,20 +246,16 @@ class ComputeAttestationCache(object):
                 cachevalid = True
         return cachevalid
 
-    def _init_cache_entry(self, host):
-        self.compute_nodes[host] = {
-            'trust_lvl': 'unknown',
-            'vtime': timeutils.normalize_time(
+    def _new_cache_entry(self):
+        return {'trust_lvl': 'unknown',
+                'vtime': timeutils.normalize_time(
                         timeutils.parse_isotime("1970-01-01T00:00:00Z"))}
 
-    def _invalidate_caches(self):
-        for host in self.compute_nodes:
-            self._init_cache_entry(host)
+    def _init_cache_entry(self, host):
+        self.compute_nodes[host] = self._new_cache_entry()
 
-    def _update_cache_entry(self, state):
+    def _cache_entry_from_state(self, state):
         entry = {}
-
-        host = state['host_name']
         entry['trust_lvl'] = state['trust_lvl']
 
         try:
@@ -248,23 +266,56 @@ class ComputeAttestationCache(object):
             # Mark the system as un-trusted if get invalid vtime.
             entry['trust_lvl'] = 'unknown'
             entry['vtime'] = timeutils.utcnow()
-
-        self.compute_nodes[host] = entry
+        return entry
 
     def _update_cache(self):
-        self._invalidate_caches()
-        states = self.attestservice.do_attestation(self.compute_nodes.keys())
-        if states is None:
+        """Attest all the hosts of the cache in a single request."""
+        hosts = self.compute_nodes.keys()
+        states = self.attestservice.do_attestation(hosts)
+
+        # NOTE: Build the new entries aside and swap them in, so that
+        # lookups made while the attestation server is being polled see
+        # the previous entries rather than invalidated ones.
+        compute_nodes = dict((host, self._new_cache_entry())
+                             for host in hosts)
+        for state in states or []:
+            compute_nodes[state['host_name']] = (
+                    self._cache_entry_from_state(state))
+        for host, entry in self.compute_nodes.iteritems():
+            # Hosts looked up for the first time during the request.
+            compute_nodes.setdefault(host, entry)
+        self.compute_nodes = compute_nodes
+
+    def _refresh(self):
+        try:
+            self._update_cache()
+        except Exception:
+            LOG.exception(_("Failed to refresh the attestation cache"))
+        finally:
+            self._refreshing = False
+
+    def _periodic_refresh(self):
+        if self._refreshing:
             return
-        for state in states:
-            self._update_cache_entry(state)
+        self._refreshing = True
+        self._refresh()
+
+    def _refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+        utils.spawn_n(self._refresh)
 
     def get_host_attestation(self, host):
         """Check host's trust level."""
         if host not in self.compute_nodes:
             self._init_cache_entry(host)
         if not self._cache_valid(host):
-            self._update_cache()
+            if self._refresher:
+                # Serve the cached level, stale or not, and refresh it.
+                self._refresh_in_background()
+            else:
+                self._update_cache()
         level = self.compute_nodes.get(host).get('trust_lvl')
         return level
 
@@ -0,0 +1,37 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bits shared by the scheduler filters."""
+
+from nova import db
+
+
+def aggregate_metadata_get_by_host(context, host_state, key=None):
+    """Return a dict of aggregate metadata for the host of host_state.
+
+    Uses the aggregate metadata snapshot loaded by the HostManager when
+    available and only falls back to querying the DB when the host state
+    was built without one.  The result has the same format as
+    db.aggregate_metadata_get_by_host(): key -> set of values.
+    """
+    metadata = host_state.aggregate_metadata
+    if metadata is None:
+        return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                                 key=key)
+    if key is None:
+        return metadata
+    if key in metadata:
+        return {key: metadata[key]}
+    return {}
@@ -17,6 +17,8 @@
 Manage hosts in the current zone.
 """
 
+import collections
+import datetime
 import UserDict
 
 from oslo.config import cfg
@@ -32,6 +34,7 @@ from nova.openstack.common import timeutils
 from nova.pci import pci_request
 from nova.pci import pci_stats
 from nova.scheduler import filters
+from nova.scheduler import tracing
 from nova.scheduler import weights
 
 host_manager_opts = [
@@ -55,6 +58,21 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_incremental_host_states',
+                default=False,
+                help='Only fetch the compute nodes which changed since the '
+                     'last refresh of the host states, instead of all of '
+                     'them, on each scheduling request'),
+    cfg.IntOpt('scheduler_host_states_full_sync_interval',
+               default=60,
+               help='Interval in seconds between full refreshes of the host '
+                    'states when scheduler_incremental_host_states is '
+                    'enabled'),
+    cfg.IntOpt('scheduler_host_states_sync_margin',
+               default=10,
+               help='Number of seconds subtracted from the time of the last '
+                    'refresh when fetching changed compute nodes, to allow '
+                    'for clock skew between compute hosts and the scheduler'),
     ]
 
 CONF = cfg.CONF
@@ -134,6 +152,16 @@ class HostState(object):
         # Resource oversubscription values for the compute host:
         self.limits = {}
 
+        # The compute node record and the generation it was at when this
+        # host state was last updated from it.
+        self.compute_node_id = None
+        self.generation = None
+
+        # Metadata of the aggregates this host belongs to, as a dict of
+        # key -> set of values.  Loaded once per request by the HostManager;
+        # None means it has not been loaded.
+        self.aggregate_metadata = None
+
         self.updated = None
 
     def update_capabilities(self, capabilities=None, service=None):
@@ -168,6 +196,8 @@ class HostState(object):
         self.vcpus_total = compute['vcpus']
         self.vcpus_used = compute['vcpus_used']
         self.updated = compute['updated_at']
+        self.compute_node_id = compute.get('id')
+        self.generation = compute.get('generation')
         if 'pci_stats' in compute:
             self.pci_stats = pci_stats.PciDeviceStats(compute['pci_stats'])
         else:
@@ -289,6 +319,11 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
+        # { compute node id : (host, hypervisor_hostname) }
+        self._compute_node_state_keys = {}
+        self._last_sync = None
+        self._last_full_sync = None
+        self.claim_conflicts = 0
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -296,6 +331,18 @@ class HostManager(object):
         self.weight_classes = self.weight_handler.get_matching_classes(
                 CONF.scheduler_weight_classes)
 
+    @property
+    def filter_classes(self):
+        return self._filter_classes
+
+    @filter_classes.setter
+    def filter_classes(self, filter_classes):
+        self._filter_classes = filter_classes
+        self._filter_cls_map = dict((cls.__name__, cls)
+                                    for cls in filter_classes)
+        # { tuple of filter names : list of filter classes }
+        self._chosen_filters = {}
+
     def _choose_host_filters(self, filter_cls_names):
         """Since the caller may specify which filters to use we need
         to have an authoritative list of what is permissible. This
@@ -306,22 +353,24 @@ class HostManager(object):
             filter_cls_names = CONF.scheduler_default_filters
         if not isinstance(filter_cls_names, (list, tuple)):
             filter_cls_names = [filter_cls_names]
+        key = tuple(filter_cls_names)
+        if key in self._chosen_filters:
+            return self._chosen_filters[key]
         good_filters = []
         bad_filters = []
         for filter_name in filter_cls_names:
-            found_class = False
-            for cls in self.filter_classes:
-                if cls.__name__ == filter_name:
-                    good_filters.append(cls)
-                    found_class = True
-                    break
-            if not found_class:
+            cls = self._filter_cls_map.get(filter_name)
+            if cls:
+                good_filters.append(cls)
+            else:
                 bad_filters.append(filter_name)
         if bad_filters:
             msg = ", ".join(bad_filters)
             raise exception.SchedulerHostFilterNotFound(filter_name=msg)
+        self._chosen_filters[key] = good_filters
         return good_filters
 
+    @tracing.traced('filtering')
     def get_filtered_hosts(self, hosts, filter_properties,
             filter_class_names=None, index=0):
         """Filter hosts and return only ones passing all filters."""
@@ -393,13 +442,48 @@ class HostManager(object):
                     return name_to_cls_map.values()
             hosts = name_to_cls_map.itervalues()
 
+        trace = tracing.get_current_trace()
         return self.filter_handler.get_filtered_objects(filter_classes,
-                hosts, filter_properties, index)
+                hosts, filter_properties, index,
+                trace=trace.filters if trace else None)
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts."""
+    @tracing.traced('weighing')
+    def get_weighed_hosts(self, hosts, weight_properties, limit=None):
+        """Weigh the hosts.  If limit is set, only the 'limit' best weighed
+        hosts are returned.
+        """
         return self.weight_handler.get_weighed_objects(self.weight_classes,
-                hosts, weight_properties)
+                hosts, weight_properties, limit=limit)
+
+    @tracing.traced('claiming')
+    def claim_host(self, context, host_state, instance):
+        """Claim the resources of instance on the compute node of
+        host_state in the DB.
+
+        Returns False if the compute node was updated or claimed, e.g. by
+        another scheduler, since host_state was updated from it.
+        """
+        disk_gb = instance['root_gb'] + instance['ephemeral_gb']
+        try:
+            db.compute_node_claim(context, host_state.compute_node_id,
+                                  host_state.generation,
+                                  instance['memory_mb'], disk_gb,
+                                  instance['vcpus'])
+        except exception.ComputeNodeClaimConflict:
+            LOG.debug(_("Compute node of %(host)s/%(node)s changed since "
+                        "it was read, not claiming it"),
+                      {'host': host_state.host, 'node': host_state.nodename})
+            self.claim_conflicts += 1
+            # Make sure the next refresh from the DB isn't skipped because
+            # of the resources consumed locally.
+            host_state.updated = None
+            return False
+        host_state.generation += 1
+        return True
+
+    def get_filter_stats(self):
+        """Return the per-filter timing and host elimination counters."""
+        return self.filter_handler.get_filter_stats()
 
     def update_service_capabilities(self, service_name, host, capabilities):
         """Update the per-service capabilities based on this notification."""
@@ -419,17 +503,96 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[state_key] = capab_copy
 
+    def _get_aggregate_metadata_by_host(self, context):
+        """Return a dict of host -> aggregate metadata for all aggregates.
+
+        The metadata of each host has the same format as the one returned
+        by db.aggregate_metadata_get_by_host(), so filters can share a single
+        snapshot instead of querying the DB for every host.
+        """
+        metadata_by_host = collections.defaultdict(
+                lambda: collections.defaultdict(set))
+        for aggregate in db.aggregate_get_all(context):
+            metadetails = aggregate['metadetails']
+            for host in aggregate['hosts']:
+                for key, value in metadetails.iteritems():
+                    metadata_by_host[host][key].add(value)
+        return metadata_by_host
+
+    def _need_full_sync(self):
+        """Return True if all compute nodes need to be fetched."""
+        if not CONF.scheduler_incremental_host_states:
+            return True
+        if self._last_full_sync is None:
+            return True
+        return timeutils.is_older_than(
+                self._last_full_sync,
+                CONF.scheduler_host_states_full_sync_interval)
+
+    def _remove_compute_node(self, compute_id):
+        """Drop the host state of a deleted compute node, if known."""
+        state_key = self._compute_node_state_keys.pop(compute_id, None)
+        if state_key and self.host_state_map.pop(state_key, None):
+            host, node = state_key
+            LOG.info(_("Removing deleted compute node %(host)s:%(node)s "
+                       "from scheduler") % {'host': host, 'node': node})
+
+    def _update_services(self, context):
+        """Refresh the services of the known host states.
+
+        Services heartbeat much more often than compute nodes change, so
+        they are not used to select the changed compute nodes.  Instead,
+        all of them are read on each incremental refresh, which keeps the
+        service liveness seen by the filters current, and the host states
+        whose service went away are dropped.
+        """
+        services = dict((service['host'], service)
+                        for service in db.service_get_all(context)
+                        if service['binary'] == 'nova-compute')
+        for state_key, host_state in self.host_state_map.items():
+            service = services.get(host_state.host)
+            if not service:
+                host, node = state_key
+                LOG.info(_("Removing compute node %(host)s:%(node)s without "
+                           "service from scheduler") %
+                         {'host': host, 'node': node})
+                del self.host_state_map[state_key]
+                continue
+            host_state.update_capabilities(self.service_states.get(state_key),
+                                           dict(service.iteritems()))
+
+    @tracing.traced('host_states')
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
+
+        When scheduler_incremental_host_states is enabled, only the compute
+        nodes changed since the last call are fetched from the db, and all
+        of them are only fetched every
+        scheduler_host_states_full_sync_interval seconds.  The resources
+        consumed by the scheduler are then kept on a host state until the
+        row of its compute node changes, or at the latest until the next
+        full refresh, which reloads every host state from its row.
         """
+        now = timeutils.utcnow()
+        full_sync = self._need_full_sync()
 
         # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        if full_sync:
+            compute_nodes = db.compute_node_get_all(context)
+        else:
+            updated_since = self._last_sync - datetime.timedelta(
+                    seconds=CONF.scheduler_host_states_sync_margin)
+            compute_nodes = db.compute_node_get_all(
+                    context, updated_since=updated_since)
+            self._update_services(context)
         seen_nodes = set()
         for compute in compute_nodes:
             service = compute['service']
+            if not full_sync and (compute.get('deleted') or not service):
+                self._remove_compute_node(compute['id'])
+                continue
             if not service:
                 LOG.warn(_("No service for compute ID %s") % compute['id'])
                 continue
@@ -446,15 +609,34 @@ class HostManager(object):
                         capabilities=capabilities,
                         service=dict(service.iteritems()))
                 self.host_state_map[state_key] = host_state
+            if full_sync and CONF.scheduler_incremental_host_states:
+                # Drop the resources consumed since the row was written,
+                # which may never be reported if the compute node's row
+                # does not change anymore.
+                host_state.updated = None
             host_state.update_from_compute_node(compute)
+            self._compute_node_state_keys[compute['id']] = state_key
             seen_nodes.add(state_key)
 
-        # remove compute nodes from host_state_map if they are not active
-        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
-        for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % {'host': host, 'node': node})
-            del self.host_state_map[state_key]
+        if full_sync:
+            # remove compute nodes from host_state_map if they are not active
+            dead_nodes = set(self.host_state_map.keys()) - seen_nodes
+            for state_key in dead_nodes:
+                host, node = state_key
+                LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                           "from scheduler") % {'host': host, 'node': node})
+                del self.host_state_map[state_key]
+            self._compute_node_state_keys = dict(
+                    (compute_id, state_key) for compute_id, state_key
+                    in self._compute_node_state_keys.iteritems()
+                    if state_key in seen_nodes)
+            self._last_full_sync = now
+        self._last_sync = now
+
+        if self.host_state_map:
+            metadata_by_host = self._get_aggregate_metadata_by_host(context)
+            for (host, node), host_state in self.host_state_map.iteritems():
+                host_state.aggregate_metadata = dict(
+                        metadata_by_host.get(host, {}))
 
         return self.host_state_map.itervalues()
@@ -48,8 +48,13 @@ scheduler_driver_opt = cfg.StrOpt('scheduler_driver',
         default='nova.scheduler.filter_scheduler.FilterScheduler',
         help='Default driver to use for the scheduler')
 
+scheduler_workers_opt = cfg.IntOpt('scheduler_workers',
+        help='Number of workers for the scheduler service. Enable '
+             'scheduler_optimistic_claims when running more than one')
+
 CONF = cfg.CONF
 CONF.register_opt(scheduler_driver_opt)
+CONF.register_opt(scheduler_workers_opt)
 
 QUOTAS = quota.QUOTAS
 
@@ -57,7 +62,7 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    RPC_API_VERSION = '2.9'
+    RPC_API_VERSION = '2.11'
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
@@ -297,3 +302,9 @@ class SchedulerManager(manager.Manager):
         dests = self.driver.select_destinations(context, request_spec,
             filter_properties)
         return jsonutils.to_primitive(dests)
+
+    def get_scheduler_stats(self, context):
+        """Returns the counters kept by the scheduler driver, such as the
+        time spent in each phase of the scheduling decisions.
+        """
+        return jsonutils.to_primitive(self.driver.get_stats())
@@ -0,0 +1,153 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tracing of scheduling decisions.
+
+A ScheduleTrace records the wall time spent in each phase of a scheduling
+decision, the hosts going in and out of each filter and the number of DB
+queries issued.  The trace of the decision being made is kept in greenthread
+local storage, so the host manager and the DB query counter can add to it
+without it being passed around.
+"""
+
+import contextlib
+import functools
+import time
+
+from sqlalchemy import engine
+from sqlalchemy import event
+
+from nova.openstack.common import local
+
+
+class ScheduleTrace(object):
+    """The trace of a single scheduling decision."""
+
+    def __init__(self):
+        self.start = time.time()
+        self.total_time = 0.0
+        # { phase name : seconds }
+        self.phases = {}
+        # One dict per filter run: 'name', 'objs_in', 'objs_out', 'time'
+        self.filters = []
+        self.db_queries = 0
+        self.num_instances = 0
+        self.num_selected = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Add the wall time spent in the block to phase 'name'."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = (self.phases.get(name, 0.0) +
+                                 time.time() - start)
+
+    def finish(self, num_instances, num_selected):
+        self.total_time = time.time() - self.start
+        self.num_instances = num_instances
+        self.num_selected = num_selected
+
+    def to_dict(self):
+        return {'total_time': self.total_time,
+                'phases': dict(self.phases),
+                'filters': list(self.filters),
+                'db_queries': self.db_queries,
+                'num_instances': self.num_instances,
+                'num_selected': self.num_selected}
+
+
+class TraceStats(object):
+    """Counters summed over the traces of many scheduling decisions."""
+
+    def __init__(self):
+        self.decisions = 0
+        self.failed_decisions = 0
+        self.instances = 0
+        self.selected = 0
+        self.db_queries = 0
+        self.total_time = 0.0
+        self.phases = {}
+
+    def add(self, trace):
+        self.decisions += 1
+        if trace.num_selected < trace.num_instances:
+            self.failed_decisions += 1
+        self.instances += trace.num_instances
+        self.selected += trace.num_selected
+        self.db_queries += trace.db_queries
+        self.total_time += trace.total_time
+        for name, elapsed in trace.phases.iteritems():
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def to_dict(self):
+        return {'decisions': self.decisions,
+                'failed_decisions': self.failed_decisions,
+                'instances': self.instances,
+                'selected': self.selected,
+                'db_queries': self.db_queries,
+                'total_time': self.total_time,
+                'phases': dict(self.phases)}
+
+
+def get_current_trace():
+    """Return the trace of the decision made by this greenthread, if any."""
+    try:
+        return local.store.schedule_trace
+    except AttributeError:
+        return None
+
+
+@contextlib.contextmanager
+def tracing(trace):
+    """Make trace the current trace for the duration of the block."""
+    local.store.schedule_trace = trace
+    try:
+        yield trace
+    finally:
+        del local.store.schedule_trace
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time the block as phase 'name' of the current trace, if any."""
+    trace = get_current_trace()
+    if trace is None:
+        yield
+    else:
+        with trace.phase(name):
+            yield
+
+
+def traced(phase_name):
+    """Decorator timing calls as phase 'phase_name' of the current trace."""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with phase(phase_name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _count_db_query(*args, **kwargs):
+    trace = get_current_trace()
+    if trace is not None:
+        trace.db_queries += 1
+
+
+event.listen(engine.Engine, 'before_cursor_execute', _count_db_query)
@@ -43,3 +43,6 @@ class RAMWeigher(weights.BaseHostWeigher):
     def _weigh_object(self, host_state, weight_properties):
         """Higher weights win.  We want spreading to be the default."""
         return host_state.free_ram_mb
+
+    def _weigh_object_array(self, host_states, weight_properties):
+        return self._object_attribute_array(host_states, 'free_ram_mb')
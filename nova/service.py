@@ -23,6 +23,7 @@ import os
 import random
 import sys
 
+import eventlet
 from oslo.config import cfg
 
 from nova import conductor
@@ -103,6 +104,10 @@ service_opts = [
     cfg.IntOpt('service_down_time',
                default=60,
                help='maximum time since last check-in for up service'),
+    cfg.IntOpt('service_drain_timeout',
+               default=60,
+               help='Seconds a stopping service waits for the rpc requests '
+                    'it is running to finish and reply'),
     ]
 
 CONF = cfg.CONF
@@ -159,7 +164,14 @@ class Service(service.Service):
                     self.host, self.binary)
             self.service_id = self.service_ref['id']
         except exception.NotFound:
-            self.service_ref = self._create_service_ref(ctxt)
+            try:
+                self.service_ref = self._create_service_ref(ctxt)
+            except (exception.ServiceTopicExists,
+                    exception.ServiceBinaryExists):
+                # NOTE: Another worker of this service got there first.
+                self.service_ref = self.conductor_api.service_get_by_args(
+                    ctxt, self.host, self.binary)
+                self.service_id = self.service_ref['id']
 
         self.manager.pre_start_hook()
 
@@ -268,10 +280,24 @@ class Service(service.Service):
             LOG.warn(_('Service killed that has no database entry'))
 
     def stop(self):
+        # NOTE: closing the connection of the amqp drivers stops consuming
+        # and waits on the proxy callbacks, i.e. for the requests being
+        # dispatched to finish and reply.  Don't let a stuck request keep
+        # the service from stopping.
+        timeout = eventlet.Timeout(CONF.service_drain_timeout)
         try:
             self.conn.close()
+        except eventlet.Timeout as exc:
+            if exc is not timeout:
+                raise
+            LOG.warn(_('Stopping %(topic)s with requests still running '
+                       'after %(timeout)d seconds'),
+                     {'topic': self.topic,
+                      'timeout': CONF.service_drain_timeout})
         except Exception:
             pass
+        finally:
+            timeout.cancel()
 
         super(Service, self).stop()
 
@@ -386,12 +412,13 @@ def process_launcher():
 _launcher = None
 
 
-def serve(server, workers=None):
+def serve(server, workers=None, rolling_restart=False):
     global _launcher
     if _launcher:
         raise RuntimeError(_('serve() can only be called once'))
 
-    _launcher = service.launch(server, workers=workers)
+    _launcher = service.launch(server, workers=workers,
+                               rolling_restart=rolling_restart)
 
 
 def wait():
@@ -135,6 +135,23 @@ class QuotaSetsTest(test.TestCase):
 
         self.assertEqual(res_dict, body)
 
+    def test_quotas_update_invalidates_cache(self):
+        self.flags(quota_cache_ttl=60)
+        quota.reset_cache()
+        self.addCleanup(quota.reset_cache)
+        self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
+        self.ext_mgr.is_loaded('os-extended-quotas').AndReturn(True)
+        self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
+        self.mox.ReplayAll()
+
+        req = fakes.HTTPRequest.blank('/v2/fake4/os-quota-sets/update_me',
+                                      use_admin_context=True)
+        res_dict = self.controller.show(req, 'update_me')
+        self.assertEqual(10, res_dict['quota_set']['instances'])
+        body = {'quota_set': {'instances': 50}}
+        res_dict = self.controller.update(req, 'update_me', body)
+        self.assertEqual(50, res_dict['quota_set']['instances'])
+
     def test_quotas_update_zero_value_as_admin(self):
         self.ext_mgr.is_loaded('os-extended-quotas').AndReturn(True)
         self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
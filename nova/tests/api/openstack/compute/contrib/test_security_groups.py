@@ -89,7 +89,8 @@ def return_server(context, server_id, columns_to_join=None):
            'name': 'asdf'})
 
 
-def return_server_by_uuid(context, server_uuid, columns_to_join=None):
+def return_server_by_uuid(context, server_uuid, columns_to_join=None,
+                          use_slave=False):
     return fake_instance.fake_db_instance(
         **{'id': 1,
            'power_state': 0x01,
@@ -113,7 +114,8 @@ def return_security_group_without_instances(context, project_id, group_name):
     return {'id': 1, 'name': group_name}
 
 
-def return_server_nonexistent(context, server_id, columns_to_join=None):
+def return_server_nonexistent(context, server_id, columns_to_join=None,
+                              use_slave=False):
     raise exception.InstanceNotFound(instance_id=server_id)
 
 
@@ -352,7 +354,8 @@ class TestSecurityGroups(test.TestCase):
             groups.append(sg)
         expected = {'security_groups': groups}
 
-        def return_instance(context, server_id, columns_to_join=None):
+        def return_instance(context, server_id, columns_to_join=None,
+                            use_slave=False):
             self.assertEquals(server_id, FAKE_UUID1)
             return return_server_by_uuid(context, server_id)
 
@@ -68,7 +68,8 @@ class DiskConfigTestCase(test.TestCase):
 
         self.stubs.Set(db, 'instance_get', fake_instance_get)
 
-        def fake_instance_get_by_uuid(context, uuid, columns_to_join=None):
+        def fake_instance_get_by_uuid(context, uuid, columns_to_join=None,
+                                      use_slave=False):
             for instance in FAKE_INSTANCES:
                 if uuid == instance['uuid']:
                     return instance
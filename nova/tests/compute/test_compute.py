@@ -1513,6 +1513,15 @@ class ComputeTestCase(BaseTestCase):
         instances = db.instance_get_all(self.context)
         self.assertEqual(len(instances), 0)
 
+    def test_terminate_returns_resources(self):
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance=instance)
+        rt = self.compute._get_resource_tracker(NODENAME)
+        self.assertTrue(instance['uuid'] in rt.tracked_instances)
+
+        self.compute.terminate_instance(self.context, instance=instance)
+        self.assertFalse(instance['uuid'] in rt.tracked_instances)
+
     def test_terminate_no_network(self):
         # This is as reported in LP bug 1008875
         instance = jsonutils.to_primitive(self._create_fake_instance())
@@ -4938,86 +4947,100 @@ class ComputeTestCase(BaseTestCase):
                                                     fake_instance)
         self.assertEqual(fake_nw_info, result)
 
-    def test_heal_instance_info_cache(self):
-        # Update on every call for the test
-        self.flags(heal_instance_info_cache_interval=-1)
-        ctxt = context.get_admin_context()
-
-        instance_map = {}
-        instances = []
-        for x in xrange(5):
-            inst_uuid = 'fake-uuid-%s' % x
-            instance_map[inst_uuid] = fake_instance.fake_db_instance(
-                uuid=inst_uuid, host=CONF.host, created_at=None)
-            # These won't be in our instance since they're not requested
-            instances.append(instance_map[inst_uuid])
-
-        call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
-                'get_nw_info': 0, 'expected_instance': None}
-
-        def fake_instance_get_all_by_host(context, host, columns_to_join):
-            call_info['get_all_by_host'] += 1
-            self.assertEqual([], columns_to_join)
-            return instances[:]
+    def _stub_heal_instance_info_cache(self, cache_ages, fail=False):
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        instances = [db.instance_create(self.context, {'host': CONF.host})
+                     for age in cache_ages]
+        for instance, age in zip(instances, cache_ages):
+            if age is None:
+                db.instance_info_cache_delete(self.context, instance['uuid'])
+            else:
+                timeutils.set_time_override(
+                    now - datetime.timedelta(seconds=age))
+                db.instance_info_cache_update(self.context, instance['uuid'],
+                                              {'network_info': '[]'})
+        timeutils.set_time_override(now)
 
-        def fake_instance_get_by_uuid(context, instance_uuid, columns_to_join):
-            if instance_uuid not in instance_map:
-                raise exception.InstanceNotFound(instance_id=instance_uuid)
-            call_info['get_by_uuid'] += 1
-            self.assertEqual(['system_metadata'], columns_to_join)
-            return instance_map[instance_uuid]
+        call_info = {'healed': []}
 
         # NOTE(comstud): Override the stub in setUp()
         def fake_get_instance_nw_info(context, instance):
-            # Note that this exception gets caught in compute/manager
-            # and is ignored.  However, the below increment of
-            # 'get_nw_info' won't happen, and you'll get an assert
-            # failure checking it below.
-            self.assertEqual(call_info['expected_instance']['uuid'],
-                             instance['uuid'])
-            call_info['get_nw_info'] += 1
-
-        self.stubs.Set(db, 'instance_get_all_by_host',
-                fake_instance_get_all_by_host)
-        self.stubs.Set(db, 'instance_get_by_uuid',
-                fake_instance_get_by_uuid)
+            call_info['healed'].append(instance['uuid'])
+            if fail:
+                # Failures are ignored by the compute manager.
+                raise test.TestingException()
+            db.instance_info_cache_update(context, instance['uuid'],
+                                          {'network_info': '[]'})
+
         self.stubs.Set(self.compute, '_get_instance_nw_info',
                 fake_get_instance_nw_info)
+        return [instance['uuid'] for instance in instances], call_info
+
+    def _heal_instance_info_cache(self, call_info, seconds_later=60):
+        timeutils.advance_time_seconds(seconds_later)
+        call_info['healed'] = []
+        self.compute._heal_instance_info_cache(
+            context.get_admin_context())
+        return set(call_info['healed'])
+
+    def test_heal_instance_info_cache(self):
+        # Update on every call for the test
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=3,
+                   heal_instance_info_cache_concurrency=2)
+        uuids, call_info = self._stub_heal_instance_info_cache(
+            [10, 50, None, 30, 20])
+
+        # The cache that was never refreshed goes first, then the oldest.
+        self.assertEqual(set([uuids[2], uuids[1], uuids[3]]),
+                         self._heal_instance_info_cache(call_info))
+        # The others are next, then one of those just healed.
+        healed = self._heal_instance_info_cache(call_info)
+        self.assertEqual(3, len(healed))
+        self.assertTrue(set([uuids[4], uuids[0]]) <= healed)
+
+        # Instances that went away are skipped.
+        db.instance_destroy(context.get_admin_context(), uuids[1])
+        healed = self._heal_instance_info_cache(call_info)
+        self.assertEqual(3, len(healed))
+        self.assertNotIn(uuids[1], healed)
+
+    def test_heal_instance_info_cache_failures(self):
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=3)
+        uuids, call_info = self._stub_heal_instance_info_cache(
+            [10, 50, None, 30, 20], fail=True)
+
+        # Caches that could not be healed do not hold back the others.
+        self.assertEqual(set([uuids[2], uuids[1], uuids[3]]),
+                         self._heal_instance_info_cache(call_info))
+        healed = self._heal_instance_info_cache(call_info)
+        self.assertEqual(3, len(healed))
+        self.assertTrue(set([uuids[4], uuids[0]]) <= healed)
+
+    def test_heal_instance_info_cache_invalidated(self):
+        self.flags(heal_instance_info_cache_interval=3600,
+                   heal_instance_info_cache_batch_size=2)
+        uuids, call_info = self._stub_heal_instance_info_cache(
+            [10, 50, None, 30, 20])
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'instance_info_cache_get_updated_at_by_host')
+
+        self.compute._last_info_cache_heal = time.time()
+        self.assertEqual(set(), self._heal_instance_info_cache(call_info))
+        self.mox.UnsetStubs()
 
-        call_info['expected_instance'] = instances[0]
-        self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(0, call_info['get_by_uuid'])
-        self.assertEqual(1, call_info['get_nw_info'])
-
-        call_info['expected_instance'] = instances[1]
-        self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(1, call_info['get_by_uuid'])
-        self.assertEqual(2, call_info['get_nw_info'])
-
-        # Make an instance switch hosts
-        instances[2]['host'] = 'not-me'
-        # Make an instance disappear
-        instance_map.pop(instances[3]['uuid'])
-        # '2' and '3' should be skipped..
-        call_info['expected_instance'] = instances[4]
-        self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(call_info['get_all_by_host'], 1)
-        # Incremented for '2' and '4'.. '3' caused a raise above.
-        self.assertEqual(call_info['get_by_uuid'], 3)
-        self.assertEqual(call_info['get_nw_info'], 3)
-        # Should be no more left.
-        self.assertEqual(len(self.compute._instance_uuids_to_heal), 0)
-
-        # This should cause a DB query now so we get first instance
-        # back again
-        call_info['expected_instance'] = instances[0]
-        self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(call_info['get_all_by_host'], 2)
-        # Stays the same, because the instance came from the DB
-        self.assertEqual(call_info['get_by_uuid'], 3)
-        self.assertEqual(call_info['get_nw_info'], 4)
+        # An invalidation does not wait out the interval and puts the
+        # instance ahead of the stalest ones.
+        ctxt = context.get_admin_context()
+        self.compute.invalidate_instance_info_cache(ctxt, {'uuid': uuids[0]})
+        self.compute.invalidate_instance_info_cache(
+            ctxt, {'uuid': 'not-on-this-host'})
+        self.assertEqual(set([uuids[0], uuids[2]]),
+                         self._heal_instance_info_cache(call_info))
+        self.assertEqual(set(), self.compute._info_cache_invalidated)
 
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
@@ -5091,7 +5114,7 @@ class ComputeTestCase(BaseTestCase):
             migrations.append(fake_mig)
 
         def fake_instance_get_by_uuid(context, instance_uuid,
-                columns_to_join=None):
+                columns_to_join=None, use_slave=False):
             self.assertIn('metadata', columns_to_join)
             self.assertIn('system_metadata', columns_to_join)
             # raise InstanceNotFound exception for uuid 'noexist'
@@ -5614,11 +5637,16 @@ class ComputeTestCase(BaseTestCase):
         self.compute._reclaim_queued_deletes(ctxt)
 
     def test_sync_power_states(self):
+        # Go through the two instances one batch at a time.
+        self.flags(instance_scan_batch_size=1)
         ctxt = self.context.elevated()
         self._create_fake_instance({'host': self.compute.host})
         self._create_fake_instance({'host': self.compute.host})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_all_power_states')
         self.mox.StubOutWithMock(self.compute.driver, 'get_info')
         self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+        self.compute.driver.get_all_power_states().AndRaise(
+            NotImplementedError())
         self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
             {'state': power_state.RUNNING})
         self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
@@ -5630,6 +5658,41 @@ class ComputeTestCase(BaseTestCase):
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
+    def test_sync_power_states_all_power_states(self):
+        ctxt = self.context.elevated()
+        in_sync = self._create_fake_instance({'host': self.compute.host,
+                                              'power_state':
+                                                  power_state.RUNNING})
+        mismatch = self._create_fake_instance({'host': self.compute.host,
+                                               'power_state':
+                                                   power_state.RUNNING})
+        shut_down = self._create_fake_instance({'host': self.compute.host,
+                                                'power_state':
+                                                    power_state.SHUTDOWN})
+        missing = self._create_fake_instance({'host': self.compute.host,
+                                              'power_state':
+                                                  power_state.RUNNING})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_all_power_states')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+        self.compute.driver.get_all_power_states().AndReturn({
+            in_sync['uuid']: power_state.RUNNING,
+            mismatch['uuid']: power_state.PAUSED,
+            shut_down['uuid']: power_state.SHUTDOWN})
+        # The power state matches, but an active instance that is shut
+        # down still has to go through the stop API.
+        self.compute._sync_instance_power_state(
+            ctxt, mox.ContainsKeyValue('uuid', shut_down['uuid']),
+            power_state.SHUTDOWN).InAnyOrder()
+        self.compute._sync_instance_power_state(
+            ctxt, mox.ContainsKeyValue('uuid', mismatch['uuid']),
+            power_state.PAUSED).InAnyOrder()
+        self.compute._sync_instance_power_state(
+            ctxt, mox.ContainsKeyValue('uuid', missing['uuid']),
+            power_state.NOSTATE).InAnyOrder()
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
     def _test_lifecycle_event(self, lifecycle_event, power_state):
         instance = self._create_fake_instance()
         uuid = instance['uuid']
@@ -6488,7 +6551,8 @@ class ComputeAPITestCase(BaseTestCase):
                 self.context, instance_obj.Instance(), exp_instance,
                 instance_obj.INSTANCE_DEFAULT_FIELDS + ['fault']))
 
-        def fake_db_get(_context, _instance_uuid, columns_to_join=None):
+        def fake_db_get(_context, _instance_uuid, columns_to_join=None,
+                        use_slave=False):
             return exp_instance
 
         self.stubs.Set(db, 'instance_get_by_uuid', fake_db_get)
@@ -6508,7 +6572,8 @@ class ComputeAPITestCase(BaseTestCase):
                 c, instance_obj.Instance(), exp_instance,
                 instance_obj.INSTANCE_DEFAULT_FIELDS + ['fault']))
 
-        def fake_db_get(context, instance_uuid, columns_to_join=None):
+        def fake_db_get(context, instance_uuid, columns_to_join=None,
+                        use_slave=False):
             return exp_instance
 
         self.stubs.Set(db, 'instance_get_by_uuid', fake_db_get)
@@ -159,7 +159,8 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             self.compute.driver.init_host(host=our_host)
             context.get_admin_context().AndReturn(fake_context)
             db.instance_get_all_by_host(
-                    fake_context, our_host, columns_to_join=['info_cache']
+                    fake_context, our_host, columns_to_join=['info_cache'],
+                    use_slave=False
                     ).AndReturn(startup_instances)
             if defer_iptables_apply:
                 self.compute.driver.filter_defer_apply_on()
@@ -228,7 +229,8 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.compute.driver.init_host(host=our_host)
         context.get_admin_context().AndReturn(fake_context)
         db.instance_get_all_by_host(fake_context, our_host,
-                                    columns_to_join=['info_cache']
+                                    columns_to_join=['info_cache'],
+                                    use_slave=False
                                     ).AndReturn([])
         self.compute.init_virt_events()
 
@@ -409,9 +411,36 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                        lambda *a, **k: None)
 
         self.mox.StubOutWithMock(self.compute.conductor_api,
-                                 'notify_usage_exists')
-        self.compute.conductor_api.notify_usage_exists(
-            self.context, instances[0], ignore_missing_network_data=False)
+                                 'notify_usage_exists_bulk')
+        self.compute.conductor_api.notify_usage_exists_bulk(
+            self.context, instances,
+            ignore_missing_network_data=False).AndReturn([])
+        self.mox.ReplayAll()
+        self.compute._instance_usage_audit(self.context)
+
+    def test_instance_usage_audit_batches(self):
+        instances = [{'uuid': 'foo'}, {'uuid': 'bar'}, {'uuid': 'baz'}]
+        self.flags(instance_usage_audit=True, instance_scan_batch_size=2)
+        self.stubs.Set(compute_utils, 'has_audit_been_run',
+                       lambda *a, **k: False)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_get_active_by_window_joined',
+                       lambda *a, **k: instances)
+        self.stubs.Set(compute_utils, 'start_instance_usage_audit',
+                       lambda *a, **k: None)
+        self.mox.StubOutWithMock(compute_utils, 'finish_instance_usage_audit')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'notify_usage_exists_bulk')
+        self.compute.conductor_api.notify_usage_exists_bulk(
+            self.context, instances[:2],
+            ignore_missing_network_data=False).AndReturn(['foo'])
+        self.compute.conductor_api.notify_usage_exists_bulk(
+            self.context, instances[2:],
+            ignore_missing_network_data=False).AndRaise(
+                test.TestingException())
+        compute_utils.finish_instance_usage_audit(
+            self.context, self.compute.conductor_api, mox.IgnoreArg(),
+            mox.IgnoreArg(), self.compute.host, 2, mox.IgnoreArg())
         self.mox.ReplayAll()
         self.compute._instance_usage_audit(self.context)
 
@@ -524,6 +524,51 @@ class UsageInfoTestCase(test.TestCase):
         image_ref_url = "%s/images/1" % glance.generate_glance_url()
         self.assertEquals(payload['image_ref_url'], image_ref_url)
 
+    def test_notify_usage_exists_bulk(self):
+        instances = [db.instance_get(self.context, self._create_instance())
+                     for x in xrange(2)]
+        uuids = [instance['uuid'] for instance in instances]
+        bw_queries = []
+        real_bw_usage_get_by_uuids = db.bw_usage_get_by_uuids
+
+        def fake_bw_usage_get_by_uuids(context, uuids, start_period):
+            bw_queries.append(uuids)
+            return real_bw_usage_get_by_uuids(context, uuids, start_period)
+
+        self.stubs.Set(db, 'bw_usage_get_by_uuids',
+                       fake_bw_usage_get_by_uuids)
+        failed = compute_utils.notify_usage_exists_bulk(
+            notify.get_notifier('compute'), self.context, instances)
+        self.assertEqual([], failed)
+        self.assertEqual([uuids], bw_queries)
+        self.assertEqual(uuids, [msg.payload['instance_id']
+                                 for msg in fake_notifier.NOTIFICATIONS])
+        for msg in fake_notifier.NOTIFICATIONS:
+            self.assertEqual('compute.instance.exists', msg.event_type)
+            self.assertEqual({}, msg.payload['bandwidth'])
+
+    def test_notify_usage_exists_bulk_failure(self):
+        instances = [db.instance_get(self.context, self._create_instance())
+                     for x in xrange(2)]
+        real_notify_about_instance_usage = (
+            compute_utils.notify_about_instance_usage)
+
+        def fake_notify_about_instance_usage(notifier, context, instance,
+                                             *args, **kwargs):
+            if instance['uuid'] == instances[0]['uuid']:
+                raise test.TestingException()
+            return real_notify_about_instance_usage(notifier, context,
+                                                    instance, *args, **kwargs)
+
+        self.stubs.Set(compute_utils, 'notify_about_instance_usage',
+                       fake_notify_about_instance_usage)
+        failed = compute_utils.notify_usage_exists_bulk(
+            notify.get_notifier('compute'), self.context, instances)
+        self.assertEqual([instances[0]['uuid']], failed)
+        self.assertEqual(1, len(fake_notifier.NOTIFICATIONS))
+        self.assertEqual(instances[1]['uuid'],
+                         fake_notifier.NOTIFICATIONS[0].payload['instance_id'])
+
     def test_notify_about_instance_usage(self):
         instance_id = self._create_instance()
         instance = db.instance_get(self.context, instance_id)
@@ -44,13 +44,14 @@ class ComputeXenTestCase(stubs.XenAPITestBase):
                 instance_obj.InstanceList(), [db_instance], None)
         instance = instance_list[0]
 
-        self.mox.StubOutWithMock(instance_obj.InstanceList, 'get_by_host')
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'iter_by_host')
         self.mox.StubOutWithMock(self.compute.driver, 'get_num_instances')
         self.mox.StubOutWithMock(vm_utils, 'lookup')
         self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
 
-        instance_obj.InstanceList.get_by_host(ctxt,
-                self.compute.host).AndReturn(instance_list)
+        instance_obj.InstanceList.iter_by_host(ctxt,
+                self.compute.host, CONF.instance_scan_batch_size,
+                use_slave=True).AndReturn(iter(instance_list))
         self.compute.driver.get_num_instances().AndReturn(1)
         vm_utils.lookup(self.compute.driver._session, instance['name'],
                 False).AndReturn(None)
@@ -20,6 +20,7 @@
 import re
 import uuid
 
+import mox
 from oslo.config import cfg
 
 from nova.compute import flavors
@@ -32,6 +33,7 @@ from nova.objects import base as obj_base
 from nova.objects import migration as migration_obj
 from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
+from nova.scheduler import host_manager
 from nova import test
 from nova.tests.objects import test_migration
 from nova.virt import driver
@@ -548,6 +550,127 @@ class TrackerPciStatsTestCase(BaseTrackerTestCase):
         return FakeVirtDriver(pci_support=True)
 
 
+class IncrementalUpdateTestCase(BaseTrackerTestCase):
+
+    def setUp(self):
+        self.compute = None
+        self.update_calls = []
+        self.instance_listings = 0
+        self.service_lookups = 0
+        super(IncrementalUpdateTestCase, self).setUp()
+        self.instance_listings = 0
+        self.update_calls = []
+        self.service_lookups = 0
+
+    def _fake_service_get_by_compute_host(self, ctx, host):
+        self.service_lookups += 1
+        # Keep the same compute node record across calls, like the DB.
+        if self.compute is None:
+            self.compute = self._create_compute_node()
+        self.service = self._create_service(host, compute=self.compute)
+        return self.service
+
+    def _fake_compute_node_update(self, ctx, compute_node_id, values,
+            prune_stats=False):
+        self.update_calls.append((dict(values), prune_stats))
+        # Like the DB, which always bumps the timestamp.
+        values['updated_at'] = timeutils.utcnow()
+        return super(IncrementalUpdateTestCase,
+                     self)._fake_compute_node_update(ctx, compute_node_id,
+                                                     values, prune_stats)
+
+    def _fake_instance_get_all_by_host_and_node(self, context, host,
+                                                nodename):
+        self.instance_listings += 1
+        return super(IncrementalUpdateTestCase,
+                     self)._fake_instance_get_all_by_host_and_node(
+                         context, host, nodename)
+
+    def test_unchanged_node_invalidates_scheduler_cache(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.compute['updated_at'] = timeutils.utcnow()
+        host_state = host_manager.HostState(self.host, 'fakenode')
+        host_state.update_from_compute_node(self.compute)
+        free_ram_mb = host_state.free_ram_mb
+        # The scheduler consumes resources for a build that then fails
+        # on another host, so the compute node never hears of it.
+        timeutils.advance_time_seconds(1)
+        host_state.consume_from_instance({'memory_mb': 1, 'root_gb': 0,
+                                          'ephemeral_gb': 0, 'vcpus': 0})
+        timeutils.advance_time_seconds(1)
+
+        self.tracker.update_available_resource(self.context)
+        # Only the timestamp is written.
+        self.assertEqual([({}, False)], self.update_calls)
+        # Nothing else writes the record, so it isn't read back either.
+        self.assertEqual(0, self.service_lookups)
+
+        host_state.update_from_compute_node(self.compute)
+        self.assertEqual(free_ram_mb, host_state.free_ram_mb)
+
+    def test_only_changes_written(self):
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1, task_state=None)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self.assertEqual(1, len(self.update_calls))
+        values, prune_stats = self.update_calls[0]
+        self.assertFalse(prune_stats)
+        self.assertEqual(3 + FAKE_VIRT_MEMORY_OVERHEAD,
+                         values['memory_mb_used'])
+        self.assertEqual(2, values['local_gb_used'])
+        self.assertFalse('memory_mb' in values)
+        self.assertFalse('cpu_info' in values)
+        self.assertEqual(1, values['stats']['num_instances'])
+
+        # Nothing changed since the claim.
+        self.update_calls = []
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual([({}, False)], self.update_calls)
+
+    def test_usage_changed_behind_our_back(self):
+        self.flags(scheduler_optimistic_claims=True)
+        # E.g. a claim by a scheduler.
+        self.compute['memory_mb_used'] += 2
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, self.service_lookups)
+        self.assertEqual(1, len(self.update_calls))
+        self.assertEqual(0, self.update_calls[0][0]['memory_mb_used'])
+
+    def test_audit_interval(self):
+        self.flags(resource_tracker_audit_interval=3)
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1, task_state=None)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        # An instance the tracker was not told about.
+        self._fake_instance(memory_mb=1, root_gb=1, ephemeral_gb=0,
+                            task_state=None, host=self.host)
+        self.update_calls = []
+
+        for i in xrange(2):
+            self.tracker.update_available_resource(self.context)
+        self.assertEqual(0, self.instance_listings)
+        self.assertEqual([({}, False)] * 2, self.update_calls)
+        self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+
+        self.mox.StubOutWithMock(resource_tracker.LOG, 'warn')
+        resource_tracker.LOG.warn(mox.IgnoreArg(), mox.IgnoreArg())
+        self.mox.ReplayAll()
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, self.instance_listings)
+        self._assert(4 + 2 * FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+
+    def test_hypervisor_view_refreshed_between_audits(self):
+        self.flags(resource_tracker_audit_interval=3)
+        self.tracker.driver.memory_mb += 1
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(0, self.instance_listings)
+        self.assertEqual(1, len(self.update_calls))
+        self.assertEqual(FAKE_VIRT_MEMORY_MB + 1,
+                         self.update_calls[0][0]['memory_mb'])
+        self._assert(FAKE_VIRT_MEMORY_MB + 1, 'free_ram_mb')
+
+
 class InstanceClaimTestCase(BaseTrackerTestCase):
 
     def test_update_usage_only_for_tracked(self):
@@ -203,6 +203,10 @@ class ComputeRpcAPITestCase(test.TestCase):
                 instance=self.fake_instance,
                 version='2.41')
 
+    def test_invalidate_instance_info_cache(self):
+        self._test_compute_api('invalidate_instance_info_cache', 'cast',
+                instance=self.fake_instance, version='2.48')
+
     def test_live_migration(self):
         self._test_compute_api('live_migration', 'cast',
                 instance=self.fake_instance, dest='dest',
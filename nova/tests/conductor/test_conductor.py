@@ -324,6 +324,18 @@ class _BaseTestCase(object):
                                                   fake_inst,
                                                   fake_values)
 
+    def test_instance_info_cache_get_updated_at_by_host(self):
+        caches = [{'instance_uuid': 'fake-uuid', 'created_at': None,
+                   'updated_at': None}]
+        self.mox.StubOutWithMock(db,
+                                 'instance_info_cache_get_updated_at_by_host')
+        db.instance_info_cache_get_updated_at_by_host(
+            self.context, 'fake-host', use_slave=True).AndReturn(caches)
+        self.mox.ReplayAll()
+        result = self.conductor.instance_info_cache_get_updated_at_by_host(
+            self.context, 'fake-host', use_slave=True)
+        self.assertEqual(caches, result)
+
     def test_flavor_get(self):
         self.mox.StubOutWithMock(db, 'flavor_get')
         db.flavor_get(self.context, 'fake-id').AndReturn('fake-type')
@@ -477,6 +489,19 @@ class _BaseTestCase(object):
                                            system_metadata={},
                                            extra_usage_info=dict(extra='info'))
 
+    def test_notify_usage_exists_bulk(self):
+        instances = [{'uuid': 'fake-uuid-1'}, {'uuid': 'fake-uuid-2'}]
+        self.mox.StubOutWithMock(compute_utils, 'notify_usage_exists_bulk')
+        notifier = self.conductor_manager.notifier
+        compute_utils.notify_usage_exists_bulk(
+            notifier, self.context, instances, False, False).AndReturn(
+                ['fake-uuid-2'])
+        self.mox.ReplayAll()
+
+        result = self.conductor.notify_usage_exists_bulk(
+            self.context, instances, ignore_missing_network_data=False)
+        self.assertEqual(['fake-uuid-2'], result)
+
     def test_security_groups_trigger_members_refresh(self):
         self.mox.StubOutWithMock(self.conductor_manager.security_group_api,
                                  'trigger_members_refresh')
@@ -824,6 +849,39 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         self.conductor.compute_confirm_resize(self.context, inst_obj,
                                               mig_obj)
 
+    def test_batch(self):
+        self.mox.StubOutWithMock(db, 'agent_build_get_by_triple')
+        self.mox.StubOutWithMock(db, 'instance_destroy')
+        db.agent_build_get_by_triple(self.context, 'hv', 'os', 'arch'
+                                     ).AndReturn('foo')
+        db.instance_destroy(mox.Func(lambda ctxt: ctxt.is_admin),
+                            'fake-uuid')
+        self.mox.ReplayAll()
+        calls = [{'method': 'agent_build_get_by_triple',
+                  'args': {'hypervisor': 'hv', 'os': 'os',
+                           'architecture': 'arch'}},
+                 {'method': 'instance_destroy',
+                  'args': {'instance': {'uuid': 'fake-uuid'}},
+                  'context': self.context.elevated().to_dict()}]
+        self.assertEqual(['foo', None],
+                         self.conductor.batch(self.context, calls))
+
+    def test_batch_stops_at_failure(self):
+        self.mox.StubOutWithMock(db, 'agent_build_get_by_triple')
+        db.agent_build_get_by_triple(self.context, 'hv', 'os', 'arch'
+                                     ).AndRaise(exc.NotFound())
+        self.mox.ReplayAll()
+        args = {'hypervisor': 'hv', 'os': 'os', 'architecture': 'arch'}
+        calls = [{'method': 'agent_build_get_by_triple', 'args': args},
+                 {'method': 'agent_build_get_by_triple', 'args': args}]
+        self.assertRaises(exc.NotFound, self.conductor.batch, self.context,
+                          calls)
+
+    def test_batch_only_api_methods(self):
+        for method in ('_get_instance', 'batch'):
+            self.assertRaises(AttributeError, self.conductor.batch,
+                              self.context, [{'method': method, 'args': {}}])
+
 
 class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
     """Conductor RPC API Tests."""
@@ -1143,6 +1201,111 @@ class ConductorAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor.security_groups_trigger_handler(self.context,
                                                        'event', 'arg')
 
+    def _test_batch(self):
+        db_migration = test_migration.fake_db_migration()
+        migration = migration_obj.Migration._from_db_object(
+            self.context, migration_obj.Migration(), db_migration)
+        migration.status = 'migrating'
+        self.mox.StubOutWithMock(db, 'bw_usage_get')
+        self.mox.StubOutWithMock(db, 'migration_update')
+        db.bw_usage_get(self.context, 'uuid', 0, 'mac').AndReturn('foo')
+        db.migration_update(mox.Func(lambda ctxt: ctxt.is_admin),
+                            db_migration['id'], {'status': 'migrating'}
+                            ).AndReturn(dict(db_migration, status='migrating',
+                                             dest_host='newhost'))
+        self.mox.ReplayAll()
+
+        batch = self.conductor.batch()
+        with batch:
+            batch.bw_usage_get(self.context, 'uuid', 0, 'mac')
+            batch.object_action(migration, 'save', self.context.elevated())
+            self.assertEqual('migrating', migration.status)
+        self.assertEqual('newhost', migration.dest_host)
+        self.assertEqual(set(), migration.obj_what_changed())
+        self.assertEqual([], batch.run())
+
+    def test_batch(self):
+        calls = []
+        batch = self.conductor_manager.batch
+
+        def fake_batch(context, **kwargs):
+            calls.append(kwargs['calls'])
+            return batch(context, **kwargs)
+        self.stubs.Set(self.conductor_manager, 'batch', fake_batch)
+
+        self._test_batch()
+        self.assertEqual(['bw_usage_update', 'object_action'],
+                         [call['method'] for call in calls[0]])
+
+    def test_batch_unsupported(self):
+        self.flags(conductor='1.60', group='upgrade_levels')
+        self.conductor = conductor_api.API()
+        self._test_batch()
+
+    def test_batch_cast(self):
+        def fake_bw_usage_update(_self, context, uuid, mac, start_period):
+            cctxt = _self.client.prepare(version='1.54')
+            cctxt.cast(context, 'bw_usage_update', uuid=uuid, mac=mac,
+                       start_period=start_period)
+        self.stubs.Set(conductor_rpcapi.ConductorAPI, 'bw_usage_update',
+                       fake_bw_usage_update)
+        self.mox.StubOutWithMock(db, 'bw_usage_get')
+        db.bw_usage_get(self.context, 'uuid', 0, 'mac').AndReturn('foo')
+        db.bw_usage_get(self.context, 'uuid', 1, 'mac').AndReturn('bar')
+        self.mox.ReplayAll()
+
+        batch = self.conductor.batch()
+        batch.bw_usage_get(self.context, 'uuid', 0, 'mac')
+        batch.bw_usage_get(self.context, 'uuid', 1, 'mac')
+        self.assertEqual([None, None], batch.run())
+
+    def test_batch_not_one_call_per_method(self):
+        def fake_bw_usage_update(_self, context, uuid, mac, start_period):
+            _self.client.call(context, 'bw_usage_update', uuid=uuid, mac=mac,
+                              start_period=start_period)
+            return _self.client.call(context, 'bw_usage_update', uuid=uuid,
+                                     mac=mac, start_period=start_period)
+        self.stubs.Set(conductor_rpcapi.ConductorAPI, 'bw_usage_update',
+                       fake_bw_usage_update)
+        self.mox.StubOutWithMock(self.conductor_manager, 'batch')
+        self.mox.StubOutWithMock(db, 'bw_usage_get')
+        db.bw_usage_get(self.context, 'uuid', 0, 'mac').AndReturn('foo')
+        db.bw_usage_get(self.context, 'uuid', 0, 'mac').AndReturn('foo')
+        db.bw_usage_get(self.context, 'uuid', 1, 'mac').AndReturn('bar')
+        db.bw_usage_get(self.context, 'uuid', 1, 'mac').AndReturn('bar')
+        self.mox.ReplayAll()
+
+        batch = self.conductor.batch()
+        batch.bw_usage_get(self.context, 'uuid', 0, 'mac')
+        batch.bw_usage_get(self.context, 'uuid', 1, 'mac')
+        self.assertEqual(['foo', 'bar'], batch.run())
+
+    def test_batch_stops_at_failure(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_get')
+        db.bw_usage_get(self.context, 'uuid', 0, 'mac').AndRaise(
+            exc.NotFound())
+        self.mox.ReplayAll()
+
+        def run_batch():
+            with self.conductor.batch() as batch:
+                batch.bw_usage_get(self.context, 'uuid', 0, 'mac')
+                batch.bw_usage_get(self.context, 'uuid', 1, 'mac')
+        self.assertRaises(exc.NotFound, run_batch)
+
+    def test_batch_not_run_on_exception(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_get')
+        self.mox.ReplayAll()
+
+        def run_batch():
+            with self.conductor.batch() as batch:
+                batch.bw_usage_get(self.context, 'uuid', 0, 'mac')
+                raise test.TestingException()
+        self.assertRaises(test.TestingException, run_batch)
+
+    def test_batch_unknown_method(self):
+        self.assertRaises(AttributeError, getattr, self.conductor.batch(),
+                          'no_such_method')
+
 
 class ConductorLocalAPITestCase(ConductorAPITestCase):
     """Conductor LocalAPI Tests."""
@@ -1164,6 +1327,21 @@ class ConductorLocalAPITestCase(ConductorAPITestCase):
         # Override test in ConductorAPITestCase
         pass
 
+    def test_batch(self):
+        self._test_batch()
+
+    def test_batch_unsupported(self):
+        # Override test in ConductorAPITestCase
+        pass
+
+    def test_batch_cast(self):
+        # Override test in ConductorAPITestCase
+        pass
+
+    def test_batch_not_one_call_per_method(self):
+        # Override test in ConductorAPITestCase
+        pass
+
 
 class ConductorImportTest(test.TestCase):
     def test_import_conductor_local(self):
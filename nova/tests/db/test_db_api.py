@@ -235,6 +235,18 @@ class NotDbApiTestCase(DbTestCase):
                           self.context, {'display_name': '%test%'},
                           marker=str(stdlib_uuid.uuid4()))
 
+    def test_instance_get_all_by_filters_paginate_deleted_marker(self):
+        test1 = self.create_instance_with_args(display_name='test1')
+        self.create_instance_with_args(display_name='test2')
+        db.instance_destroy(self.context, test1['uuid'])
+        result = db.instance_get_all_by_filters(self.context,
+                                                {'display_name': '%test%',
+                                                 'deleted': False,
+                                                 'soft_deleted': True},
+                                                sort_dir="asc",
+                                                marker=test1['uuid'])
+        self.assertEqual(1, len(result))
+
 
 class AggregateDBApiTestCase(test.TestCase):
     def setUp(self):
@@ -661,6 +673,62 @@ class SqlAlchemyDbApiTestCase(DbTestCase):
         self.assertEqual(types.UnicodeType, type(result[0]))
 
 
+class UseSlaveTestCase(DbTestCase):
+    def setUp(self):
+        super(UseSlaveTestCase, self).setUp()
+        self.slave_calls = []
+        real_get_session = db_session.get_session
+        real_get_engine = db_session.get_engine
+
+        # Record which database was asked for but always hand out the
+        # primary one, the test database has no slave.
+        def fake_get_session(slave_session=False, **kwargs):
+            self.slave_calls.append(slave_session)
+            return real_get_session(**kwargs)
+
+        def fake_get_engine(slave_engine=False, **kwargs):
+            self.slave_calls.append(slave_engine)
+            return real_get_engine(**kwargs)
+
+        self.stubs.Set(db_session, 'get_session', fake_get_session)
+        self.stubs.Set(db_session, 'get_engine', fake_get_engine)
+
+    def test_no_slave_configured(self):
+        self.flags(slave_connection='', group='database')
+        db.instance_get_all_by_filters(self.context, {}, use_slave=True)
+        self.assertTrue(self.slave_calls)
+        self.assertNotIn(True, self.slave_calls)
+
+    def test_use_slave_default_false(self):
+        self.flags(slave_connection='sqlite://', group='database')
+        db.instance_get_all_by_filters(self.context, {})
+        self.assertTrue(self.slave_calls)
+        self.assertNotIn(True, self.slave_calls)
+
+    def test_instance_get_all_by_filters_use_slave(self):
+        self.flags(slave_connection='sqlite://', group='database')
+        self.create_instance_with_args()
+        self.slave_calls = []
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                use_slave=True)
+        self.assertEqual(1, len(result))
+        self.assertTrue(self.slave_calls)
+        self.assertNotIn(False, self.slave_calls)
+
+    def test_instance_get_by_uuid_use_slave(self):
+        self.flags(slave_connection='sqlite://', group='database')
+        instance = self.create_instance_with_args()
+        self.slave_calls = []
+        db.instance_get_by_uuid(self.context, instance['uuid'],
+                                use_slave=True)
+        self.assertEqual([True], self.slave_calls)
+
+    def test_compute_node_get_all_use_slave(self):
+        self.flags(slave_connection='sqlite://', group='database')
+        db.compute_node_get_all(context.get_admin_context(), use_slave=True)
+        self.assertEqual([True], self.slave_calls)
+
+
 class MigrationTestCase(test.TestCase):
 
     def setUp(self):
@@ -1124,8 +1192,8 @@ class SecurityGroupTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
         session = get_session()
         self.mox.StubOutWithMock(sqlalchemy_api, 'get_session')
-        sqlalchemy_api.get_session().AndReturn(session)
-        sqlalchemy_api.get_session().AndReturn(session)
+        sqlalchemy_api.get_session(use_slave=False).AndReturn(session)
+        sqlalchemy_api.get_session(use_slave=False).AndReturn(session)
         self.mox.ReplayAll()
 
         security_group = db.security_group_get(self.ctxt, sid,
@@ -1619,6 +1687,128 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
             self.assertTrue(result[1]['cleaned'])
             self.assertFalse(result[0]['cleaned'])
 
+    def test_instance_get_columns_by_filters(self):
+        inst1 = self.create_instance_with_args(host='h1')
+        self.create_instance_with_args(host='h2')
+        result = db.instance_get_columns_by_filters(self.ctxt, {'host': 'h1'},
+                                                    ['host', 'vm_state'])
+        self.assertEqual([{'uuid': inst1['uuid'], 'host': 'h1',
+                           'vm_state': inst1['vm_state']}], result)
+
+    def test_instance_get_columns_by_filters_metadata(self):
+        inst = self.create_instance_with_args()
+        result = db.instance_get_columns_by_filters(self.ctxt, {},
+                ['metadata', 'system_metadata'])
+        self.assertEqual([{'uuid': inst['uuid'],
+                           'metadata': self.sample_data['metadata'],
+                           'system_metadata':
+                               self.sample_data['system_metadata']}],
+                         result)
+
+    def test_instance_get_columns_by_filters_keyset(self):
+        created_at = timeutils.utcnow()
+        uuids = []
+        for i in range(5):
+            # Two instances per created_at, so that the uuid has to break
+            # the ties.
+            inst = self.create_instance_with_args(
+                created_at=created_at + datetime.timedelta(seconds=i // 2))
+            uuids.append((inst['created_at'], inst['uuid']))
+        expected = [uuid for _created_at, uuid in sorted(uuids)]
+
+        for sort_dir, ordered in (('asc', expected),
+                                  ('desc', list(reversed(expected)))):
+            pages = []
+            marker = None
+            while True:
+                page = db.instance_get_columns_by_filters(self.ctxt, {},
+                        ['created_at'], sort_dir=sort_dir, limit=2,
+                        marker=marker)
+                if not page:
+                    break
+                self.assertTrue(len(page) <= 2)
+                pages.extend(inst['uuid'] for inst in page)
+                marker = page[-1]['uuid']
+            self.assertEqual(ordered, pages)
+
+    def test_instance_get_columns_by_filters_keyset_nulls(self):
+        launched_at = timeutils.utcnow()
+        nulls = []
+        values = []
+        for i in range(4):
+            inst = self.create_instance_with_args()
+            nulls.append(inst['uuid'])
+            inst = self.create_instance_with_args(
+                launched_at=launched_at + datetime.timedelta(seconds=i))
+            values.append(inst['uuid'])
+
+        for sort_dir, ordered in (('asc', values + sorted(nulls)),
+                                  ('desc', list(reversed(values)) +
+                                           sorted(nulls, reverse=True))):
+            pages = []
+            marker = None
+            while True:
+                page = db.instance_get_columns_by_filters(self.ctxt, {},
+                        [], sort_key='launched_at', sort_dir=sort_dir,
+                        limit=3, marker=marker)
+                if not page:
+                    break
+                pages.extend(inst['uuid'] for inst in page)
+                marker = page[-1]['uuid']
+            self.assertEqual(ordered, pages)
+
+    def test_instance_get_columns_by_filters_keyset_plain_order(self):
+        statements = []
+        orig_all = query.Query.all
+
+        def fake_all(_self):
+            statements.append(str(_self))
+            return orig_all(_self)
+
+        inst = self.create_instance_with_args()
+        self.stubs.Set(query.Query, 'all', fake_all)
+        db.instance_get_columns_by_filters(self.ctxt, {}, [], limit=2,
+                                           marker=inst['uuid'])
+        # A plain ORDER BY on the columns of the (deleted, created_at,
+        # uuid) index, then the NULLs in a pass of their own.
+        values_statement, nulls_statement = statements
+        self.assertNotIn('CASE', values_statement)
+        self.assertIn('ORDER BY instances.created_at DESC, '
+                      'instances.uuid DESC', values_statement)
+        self.assertIn('instances.created_at IS NULL', nulls_statement)
+
+    def test_instance_get_columns_by_filters_marker_other_project(self):
+        inst = self.create_instance_with_args(project_id='other')
+        ctxt = context.RequestContext('user1', 'project1')
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_columns_by_filters,
+                          ctxt, {}, [], marker=inst['uuid'])
+
+    def test_instance_get_columns_by_filters_marker_deleted(self):
+        inst1 = self.create_instance_with_args(vm_state=vm_states.ACTIVE)
+        inst2 = self.create_instance_with_args(vm_state=vm_states.ACTIVE)
+        first = db.instance_get_columns_by_filters(self.ctxt, {}, [],
+                                                   limit=1)
+        db.instance_destroy(self.ctxt, first[0]['uuid'])
+        result = db.instance_get_columns_by_filters(self.ctxt,
+                {'deleted': False}, [], marker=first[0]['uuid'])
+        self.assertEqual(1, len(result))
+        self.assertIn(result[0]['uuid'], [inst1['uuid'], inst2['uuid']])
+        self.assertNotEqual(first[0]['uuid'], result[0]['uuid'])
+
+    def test_instance_get_columns_by_filters_bad_marker(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_columns_by_filters,
+                          self.ctxt, {}, [], marker='nonexistent')
+
+    def test_instance_get_columns_by_filters_bad_column(self):
+        self.assertRaises(exception.InvalidInput,
+                          db.instance_get_columns_by_filters,
+                          self.ctxt, {}, ['nonexistent'])
+        self.assertRaises(exception.InvalidSortKey,
+                          db.instance_get_columns_by_filters,
+                          self.ctxt, {}, [], sort_key='nonexistent')
+
     def test_instance_get_all_by_host_and_node_no_join(self):
         instance = self.create_instance_with_args()
         result = db.instance_get_all_by_host_and_node(self.ctxt, 'h1', 'n1')
@@ -1834,6 +2024,41 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertTrue(isinstance(instance['access_ip_v4'], basestring))
         self.assertTrue(isinstance(instance['access_ip_v6'], basestring))
 
+    def test_instance_info_cache_update_unchanged_bumps_updated_at(self):
+        instance = self.create_instance_with_args()
+        db.instance_info_cache_update(self.ctxt, instance['uuid'],
+                                      {'network_info': '[]'})
+        refreshed_at = datetime.datetime(2013, 10, 1, 12, 0, 0)
+        timeutils.set_time_override(refreshed_at)
+        self.addCleanup(timeutils.clear_time_override)
+        db.instance_info_cache_update(self.ctxt, instance['uuid'],
+                                      {'network_info': '[]'})
+        info_cache = db.instance_info_cache_get(self.ctxt, instance['uuid'])
+        self.assertEqual(refreshed_at, info_cache['updated_at'])
+
+    def test_instance_info_cache_get_updated_at_by_host(self):
+        refreshed_at = datetime.datetime(2013, 10, 1, 12, 0, 0)
+        timeutils.set_time_override(refreshed_at)
+        self.addCleanup(timeutils.clear_time_override)
+        refreshed = self.create_instance_with_args(host='host1')
+        db.instance_info_cache_update(self.ctxt, refreshed['uuid'],
+                                      {'network_info': '[]'})
+        no_cache = self.create_instance_with_args(host='host1')
+        db.instance_info_cache_delete(self.ctxt, no_cache['uuid'])
+        deleted = self.create_instance_with_args(host='host1')
+        db.instance_destroy(self.ctxt, deleted['uuid'])
+        self.create_instance_with_args(host='host2')
+
+        result = db.instance_info_cache_get_updated_at_by_host(self.ctxt,
+                                                               'host1')
+        self.assertEqual(
+            {refreshed['uuid']: {'instance_uuid': refreshed['uuid'],
+                                 'created_at': refreshed_at,
+                                 'updated_at': refreshed_at},
+             no_cache['uuid']: {'instance_uuid': no_cache['uuid'],
+                                'created_at': None, 'updated_at': None}},
+            dict((row['instance_uuid'], row) for row in result))
+
 
 class InstanceMetadataTestCase(test.TestCase):
 
@@ -5096,6 +5321,216 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
                           'project1', 'resource1', 42)
 
 
+class QuotaReserveOptimisticTestCase(test.TestCase):
+
+    """Tests for the optimistic quota reservation engine."""
+
+    def setUp(self):
+        super(QuotaReserveOptimisticTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.in_use = {'resource0': 0, 'fixed_ips': 0}
+        self.resources = {}
+        self.quotas = {'resource0': 10, 'fixed_ips': 10}
+
+        def get_sync(resource):
+            def sync(elevated, project_id, user_id, session):
+                return {resource: self.in_use[resource]}
+            return sync
+
+        for resource in self.quotas:
+            sync_name = '_sync_optimistic_%s' % resource
+            self.resources[resource] = quota.ReservableResource(
+                resource, sync_name, 'quota_%s' % resource)
+            sqlalchemy_api.QUOTA_SYNC_FUNCTIONS[sync_name] = get_sync(
+                resource)
+
+    def _reserve(self, deltas, shards=1):
+        expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        return db.quota_reserve_optimistic(self.ctxt, self.resources,
+                                           self.quotas, self.quotas, deltas,
+                                           expire, None, None, shards=shards,
+                                           project_id='project1',
+                                           user_id='user1')
+
+    def _usages(self):
+        return db.quota_usage_get_all_by_project_and_user(
+            self.ctxt, 'project1', 'user1')
+
+    def _shards(self, resource):
+        return sqlalchemy_api._quota_usage_shards_query(
+            self.ctxt, 'project1', 'user1', resource).all()
+
+    def test_reserve_creates_shards(self):
+        self.in_use['resource0'] = 2
+        reservations = self._reserve({'resource0': 3, 'fixed_ips': 1},
+                                     shards=4)
+        self.assertEqual(2, len(reservations))
+        self.assertEqual(4, len(self._shards('resource0')))
+        self.assertEqual([None] * 4,
+                         [row.user_id for row in self._shards('fixed_ips')])
+        self.assertEqual({'project_id': 'project1', 'user_id': 'user1',
+                          'resource0': {'in_use': 2, 'reserved': 3},
+                          'fixed_ips': {'in_use': 0, 'reserved': 1}},
+                         self._usages())
+
+    def test_reserve_negative_delta_not_reserved(self):
+        self.in_use['resource0'] = 5
+        self._reserve({'resource0': -2})
+        self.assertEqual({'in_use': 5, 'reserved': 0},
+                         self._usages()['resource0'])
+
+    def test_commit(self):
+        reservations = self._reserve({'resource0': 3, 'fixed_ips': 1},
+                                     shards=2)
+        db.reservation_commit_optimistic(self.ctxt, reservations)
+        # A second commit of the same reservations is a no-op
+        db.reservation_commit_optimistic(self.ctxt, reservations)
+        self.assertEqual({'project_id': 'project1', 'user_id': 'user1',
+                          'resource0': {'in_use': 3, 'reserved': 0},
+                          'fixed_ips': {'in_use': 1, 'reserved': 0}},
+                         self._usages())
+        self.assertRaises(exception.ReservationNotFound,
+                          db.reservation_get, self.ctxt, reservations[0])
+
+    def test_rollback(self):
+        reservations = self._reserve({'resource0': 3}, shards=2)
+        db.reservation_rollback_optimistic(self.ctxt, reservations)
+        db.reservation_commit_optimistic(self.ctxt, reservations)
+        self.assertEqual({'in_use': 0, 'reserved': 0},
+                         self._usages()['resource0'])
+
+    def test_over_quota_rolls_back(self):
+        self._reserve({'resource0': 6}, shards=3)
+        exc = self.assertRaises(exception.OverQuota, self._reserve,
+                                {'resource0': 5, 'fixed_ips': 1}, shards=3)
+        self.assertEqual(['resource0'], exc.kwargs['overs'])
+        self.assertEqual({'in_use': 0, 'reserved': 6},
+                         exc.kwargs['usages']['resource0'])
+        self.assertEqual({'project_id': 'project1', 'user_id': 'user1',
+                          'resource0': {'in_use': 0, 'reserved': 6},
+                          'fixed_ips': {'in_use': 0, 'reserved': 0}},
+                         self._usages())
+        self.assertEqual(1, len(sqlalchemy_api.model_query(
+            self.ctxt, models.Reservation, read_deleted='no').all()))
+
+    def test_unlimited_quota(self):
+        self.quotas['resource0'] = -1
+        self._reserve({'resource0': 100})
+        self.assertEqual({'in_use': 0, 'reserved': 100},
+                         self._usages()['resource0'])
+
+    def test_refresh_negative_usage(self):
+        reservations = self._reserve({'resource0': 1}, shards=2)
+        db.reservation_commit_optimistic(self.ctxt, reservations)
+        db.quota_usage_update(self.ctxt, 'project1', 'user1', 'resource0',
+                              in_use=-1)
+        self.in_use['resource0'] = 7
+        self._reserve({'resource0': 1}, shards=2)
+        self.assertEqual([7, 0],
+                         [row.in_use for row in self._shards('resource0')])
+        self.assertEqual({'in_use': 7, 'reserved': 1},
+                         self._usages()['resource0'])
+
+    def test_refresh_retries_on_concurrent_change(self):
+        self._reserve({'resource0': 1})
+        self.in_use['resource0'] = 4
+        row = self._shards('resource0')[0]
+        orig_sync = sqlalchemy_api.QUOTA_SYNC_FUNCTIONS[
+            '_sync_optimistic_resource0']
+        calls = []
+
+        def racing_sync(elevated, project_id, user_id, session):
+            if not calls:
+                # Another request commits while we are counting
+                db.reservation_commit_optimistic(self.ctxt, [
+                    db.reservation_create(self.ctxt, 'racing-uuid', row,
+                                          'project1', 'user1', 'resource0',
+                                          2, timeutils.utcnow()).uuid])
+            calls.append(1)
+            return orig_sync(elevated, project_id, user_id, session)
+
+        self.stubs.Set(sqlalchemy_api, 'QUOTA_SYNC_FUNCTIONS',
+                       {'_sync_optimistic_resource0': racing_sync})
+        refreshed = sqlalchemy_api._quota_usage_refresh(
+            self.ctxt, self.resources, 'resource0', 'project1', 'user1',
+            None)
+        self.assertEqual(set(['resource0']), refreshed)
+        self.assertEqual(2, len(calls))
+        self.assertEqual(4, self._usages()['resource0']['in_use'])
+
+    def test_until_refresh_countdown(self):
+        expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        reserve = lambda: db.quota_reserve_optimistic(
+            self.ctxt, self.resources, self.quotas, self.quotas,
+            {'resource0': 1}, expire, 2, None, project_id='project1',
+            user_id='user1')
+        reserve()
+        self.in_use['resource0'] = 3
+        reserve()
+        self.assertEqual(0, self._usages()['resource0']['in_use'])
+        reserve()
+        self.assertEqual(3, self._usages()['resource0']['in_use'])
+        self.assertEqual(2, self._shards('resource0')[0].until_refresh)
+
+    def test_locking_engine_folds_shards(self):
+        reservations = self._reserve({'resource0': 3, 'fixed_ips': 1},
+                                     shards=3)
+        db.reservation_commit_optimistic(self.ctxt, reservations[:1])
+        reservations = reservations[1:] + self._reserve({'resource0': 4},
+                                                        shards=3)
+        expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        self.assertRaises(exception.OverQuota, db.quota_reserve, self.ctxt,
+                          self.resources, self.quotas, self.quotas,
+                          {'resource0': 4}, expire, None, None,
+                          project_id='project1', user_id='user1')
+        reservations += db.quota_reserve(self.ctxt, self.resources,
+                                         self.quotas, self.quotas,
+                                         {'resource0': 3}, expire, None,
+                                         None, project_id='project1',
+                                         user_id='user1')
+        usages = self._usages()
+        self.assertEqual(10, usages['resource0']['in_use'] +
+                         usages['resource0']['reserved'])
+        self.assertEqual([0, 0], [row.in_use + row.reserved
+                                  for row in self._shards('resource0')[1:]])
+
+        db.reservation_commit(self.ctxt, reservations,
+                              project_id='project1', user_id='user1')
+        self.assertEqual({'project_id': 'project1', 'user_id': 'user1',
+                          'resource0': {'in_use': 10, 'reserved': 0},
+                          'fixed_ips': {'in_use': 1, 'reserved': 0}},
+                         self._usages())
+
+    def test_usage_update_and_get_with_shards(self):
+        self._reserve({'resource0': 1}, shards=3)
+        self._reserve({'resource0': 2}, shards=3)
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'resource0',
+                                   'user1')
+        self.assertEqual(3, usage.reserved)
+        self.assertEqual(3, usage.total)
+
+        db.quota_usage_update(self.ctxt, 'project1', 'user1', 'resource0',
+                              in_use=-1, reserved=5)
+        self.assertEqual({'in_use': -1, 'reserved': 5},
+                         self._usages()['resource0'])
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'resource0',
+                                   'user1')
+        self.assertEqual(-1, usage.in_use)
+        self.assertEqual(5, usage.reserved)
+
+    def test_reservation_expire(self):
+        expire = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        reservations = db.quota_reserve_optimistic(
+            self.ctxt, self.resources, self.quotas, self.quotas,
+            {'resource0': 2}, expire, None, None, shards=2,
+            project_id='project1', user_id='user1')
+        db.reservation_expire(self.ctxt)
+        # Committing an expired reservation must not touch the usage
+        db.reservation_commit_optimistic(self.ctxt, reservations)
+        self.assertEqual({'in_use': 0, 'reserved': 0},
+                         self._usages()['resource0'])
+
+
 class QuotaClassTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
     def setUp(self):
@@ -5190,7 +5625,8 @@ class S3ImageTestCase(test.TestCase):
 
 class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
-    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at']
+    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at',
+                     'generation']
 
     def setUp(self):
         super(ComputeNodeTestCase, self).setUp()
@@ -5289,6 +5725,35 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
             # Clean up the service
             db.service_destroy(self.ctxt, service['id'])
 
+    def test_compute_node_get_all_updated_since(self):
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(minutes=5))
+        updated_since = timeutils.utcnow()
+        self.assertEqual([], db.compute_node_get_all(
+                self.ctxt, False, updated_since=updated_since))
+
+        # A service heartbeat doesn't change the compute node
+        db.service_update(self.ctxt, self.service['id'],
+                          {'report_count': 1})
+        self.assertEqual([], db.compute_node_get_all(
+                self.ctxt, False, updated_since=updated_since))
+
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'vcpus_used': 1})
+        nodes = db.compute_node_get_all(self.ctxt, False,
+                                        updated_since=updated_since)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(1, nodes[0]['vcpus_used'])
+        self.assertEqual(self.service['id'], nodes[0]['service']['id'])
+        self._stats_equal(self.stats, self._stats_as_dict(nodes[0]['stats']))
+
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        nodes = db.compute_node_get_all(self.ctxt, True,
+                                        updated_since=updated_since)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['deleted'])
+
     def test_compute_node_get_all_mult_compute_nodes_one_service_entry(self):
         service_data = self.service_dict.copy()
         service_data['host'] = 'host2'
@@ -5340,6 +5805,31 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         new_stats = self._stats_as_dict(item_updated['stats'])
         self._stats_equal(stats, new_stats)
 
+    def test_compute_node_update_bumps_generation(self):
+        self.assertEqual(0, self.item['generation'])
+        item_updated = db.compute_node_update(self.ctxt, self.item['id'],
+                                              {'vcpus': 4})
+        self.assertEqual(1, item_updated['generation'])
+
+    def test_compute_node_claim(self):
+        db.compute_node_claim(self.ctxt, self.item['id'], 0, 512, 10, 1)
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(1, node['generation'])
+        self.assertEqual(512, node['free_ram_mb'])
+        self.assertEqual(512, node['memory_mb_used'])
+        self.assertEqual(2038, node['free_disk_gb'])
+        self.assertEqual(10, node['local_gb_used'])
+        self.assertEqual(1, node['vcpus_used'])
+
+    def test_compute_node_claim_conflict(self):
+        db.compute_node_claim(self.ctxt, self.item['id'], 0, 512, 10, 1)
+        self.assertRaises(exception.ComputeNodeClaimConflict,
+                          db.compute_node_claim, self.ctxt, self.item['id'],
+                          0, 512, 10, 1)
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(1, node['generation'])
+        self.assertEqual(512, node['free_ram_mb'])
+
     def test_compute_node_delete(self):
         compute_node_id = self.item['id']
         db.compute_node_delete(self.ctxt, compute_node_id)
@@ -3033,6 +3033,30 @@ class TestNovaMigrations(BaseMigrationTestCase, CommonTestsMixIn):
                 else:
                     self.assertNotIn((name, columns), index_data)
 
+    def _check_216(self, engine, data):
+        self.assertColumnExists(engine, 'compute_nodes', 'generation')
+        self.assertColumnExists(engine, 'shadow_compute_nodes', 'generation')
+
+    def _post_downgrade_216(self, engine):
+        self.assertColumnNotExists(engine, 'compute_nodes', 'generation')
+        self.assertColumnNotExists(engine, 'shadow_compute_nodes',
+                                   'generation')
+
+    def _check_217(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_deleted_created_at_uuid_idx',
+                                ['deleted', 'created_at', 'uuid'])
+        self.assertIndexMembers(engine, 'instances',
+                'instances_project_id_deleted_created_at_uuid_idx',
+                ['project_id', 'deleted', 'created_at', 'uuid'])
+
+    def _post_downgrade_217(self, engine):
+        instances = db_utils.get_table(engine, 'instances')
+        index_names = [idx.name for idx in instances.indexes]
+        self.assertNotIn('instances_deleted_created_at_uuid_idx', index_names)
+        self.assertNotIn('instances_project_id_deleted_created_at_uuid_idx',
+                         index_names)
+
 
 class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
@@ -23,6 +23,7 @@ import random
 import mox
 
 from nova.compute import flavors
+from nova.compute import rpcapi as compute_rpcapi
 from nova import context
 from nova import exception
 from nova import network
@@ -272,3 +273,17 @@ class ApiTestCase(test.TestCase):
         self.stubs.Set(self.network_api, 'get', fake_get)
 
         self.network_api.associate(self.context, FAKE_UUID, project=None)
+
+    def test_update_instance_cache_failure_invalidates(self):
+        instance = {'uuid': FAKE_UUID, 'host': 'fake-host'}
+        self.mox.StubOutWithMock(self.network_api, '_get_instance_nw_info')
+        self.mox.StubOutWithMock(compute_rpcapi.ComputeAPI,
+                                 'invalidate_instance_info_cache')
+        self.network_api._get_instance_nw_info(
+            self.context, instance).AndRaise(test.TestingException())
+        compute_rpcapi.ComputeAPI.invalidate_instance_info_cache(
+            self.context, instance)
+        self.mox.ReplayAll()
+
+        api.update_instance_cache_with_nw_info(self.network_api,
+                                               self.context, instance)
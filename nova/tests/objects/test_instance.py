@@ -102,7 +102,8 @@ class _TestInstanceObject(object):
     def test_get_without_expected(self):
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, 'uuid',
-                                columns_to_join=[]
+                                columns_to_join=[],
+                                use_slave=False
                                 ).AndReturn(self.fake_instance)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, 'uuid',
@@ -120,7 +121,8 @@ class _TestInstanceObject(object):
 
         db.instance_get_by_uuid(
             self.context, 'uuid',
-            columns_to_join=exp_cols
+            columns_to_join=exp_cols,
+            use_slave=False
             ).AndReturn(self.fake_instance)
         fake_faults = test_instance_fault.fake_faults
         db.instance_fault_get_by_instance_uuids(
@@ -151,12 +153,14 @@ class _TestInstanceObject(object):
         fake_uuid = self.fake_instance['uuid']
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(self.fake_instance)
         fake_inst2 = dict(self.fake_instance,
                           system_metadata=[{'key': 'foo', 'value': 'bar'}])
         db.instance_get_by_uuid(self.context, fake_uuid,
-                                columns_to_join=['system_metadata']
+                                columns_to_join=['system_metadata'],
+                                use_slave=False
                                 ).AndReturn(fake_inst2)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
@@ -181,7 +185,8 @@ class _TestInstanceObject(object):
         fake_instance = self.fake_instance
         db.instance_get_by_uuid(self.context, 'fake-uuid',
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(fake_instance)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, 'fake-uuid')
@@ -198,12 +203,14 @@ class _TestInstanceObject(object):
         fake_uuid = self.fake_instance['uuid']
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(dict(self.fake_instance,
                                                  host='orig-host'))
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(dict(self.fake_instance,
                                                  host='new-host'))
         self.mox.ReplayAll()
@@ -249,7 +256,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(notifications, 'send_update')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(old_ref)
         db.instance_update_and_get_original(
                 self.context, fake_uuid, expected_updates,
@@ -320,7 +328,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(notifications, 'send_update')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(old_ref)
         db.instance_update_and_get_original(
                 self.context, fake_uuid, expected_updates, update_cells=False,
@@ -344,7 +353,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
@@ -357,7 +367,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
@@ -370,7 +381,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
@@ -391,7 +403,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(db, 'instance_info_cache_update')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         db.instance_info_cache_update(self.context, fake_uuid,
                                       {'network_info': nwinfo2_json})
@@ -407,7 +420,8 @@ class _TestInstanceObject(object):
         fake_uuid = fake_inst['uuid']
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, fake_uuid,
-                                columns_to_join=['info_cache']
+                                columns_to_join=['info_cache'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid,
@@ -432,7 +446,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(db, 'security_group_update')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         db.security_group_update(self.context, 1, {'description': 'changed'}
                                  ).AndReturn(fake_inst['security_groups'][0])
@@ -456,7 +471,8 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
@@ -467,7 +483,8 @@ class _TestInstanceObject(object):
         fake_uuid = fake_inst['uuid']
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, fake_uuid,
-                                columns_to_join=['pci_devices']
+                                columns_to_join=['pci_devices'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid,
@@ -512,7 +529,8 @@ class _TestInstanceObject(object):
             ]
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(self.context, fake_uuid,
-                                columns_to_join=['pci_devices']
+                                columns_to_join=['pci_devices'],
+                                use_slave=False
                                 ).AndReturn(fake_inst)
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid,
@@ -530,6 +548,7 @@ class _TestInstanceObject(object):
         self.mox.StubOutWithMock(db, 'instance_fault_get_by_instance_uuids')
         db.instance_get_by_uuid(self.context, fake_uuid,
                                 columns_to_join=[],
+                                use_slave=False
                                 ).AndReturn(self.fake_instance)
         db.instance_fault_get_by_instance_uuids(
             self.context, [fake_uuid]).AndReturn({fake_uuid: fake_faults})
@@ -681,7 +700,48 @@ class TestInstanceObject(test_objects._LocalTest,
 
 class TestRemoteInstanceObject(test_objects._RemoteTest,
                                _TestInstanceObject):
-    pass
+    def test_save_compact(self):
+        self.flags(compact_object_actions=True, group='conductor')
+        old_ref = dict(self.fake_instance, host='oldhost', vm_state='old')
+        new_ref = dict(old_ref, host='newhost', vm_state='meow')
+        fake_uuid = old_ref['uuid']
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(notifications, 'send_update')
+        db.instance_get_by_uuid(self.context, fake_uuid,
+                                columns_to_join=['info_cache',
+                                                 'security_groups'],
+                                use_slave=False
+                                ).AndReturn(old_ref)
+        # Neither the info cache nor the security groups changed, so
+        # they are not sent and the update does not join them.
+        db.instance_update_and_get_original(
+                self.context, fake_uuid, {'vm_state': 'meow'},
+                update_cells=False, columns_to_join=[]
+                ).AndReturn((old_ref, new_ref))
+        notifications.send_update(self.context, old_ref, new_ref)
+        self.mox.ReplayAll()
+
+        action_updates = []
+        object_action = self.conductor_service.manager.object_action
+
+        def fake_object_action(*args, **kwargs):
+            result = object_action(*args, **kwargs)
+            action_updates.append(result[0])
+            return result
+        self.stubs.Set(self.conductor_service.manager, 'object_action',
+                       fake_object_action)
+
+        inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
+        inst.vm_state = 'meow'
+        inst.save()
+        self.assertEqual(['host'], [field for field in action_updates[0]
+                                    if field in inst.fields])
+        self.assertEqual('newhost', inst.host)
+        self.assertEqual('meow', inst.vm_state)
+        self.assertEqual(old_ref['display_name'], inst.display_name)
+        self.assertTrue(inst.obj_attr_is_set('info_cache'))
+        self.assertEqual(set(), inst.obj_what_changed())
 
 
 class _TestInstanceListObject(object):
@@ -710,7 +770,8 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
         db.instance_get_all_by_filters(self.context, {'foo': 'bar'}, 'uuid',
                                        'asc', limit=None, marker=None,
-                                       columns_to_join=['metadata']).AndReturn(
+                                       columns_to_join=['metadata'],
+                                       use_slave=False).AndReturn(
                                            fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -732,7 +793,8 @@ class _TestInstanceListObject(object):
         db.instance_get_all_by_filters(self.context,
                                        {'deleted': True, 'cleaned': False},
                                        'uuid', 'asc', limit=None, marker=None,
-                                       columns_to_join=['metadata']).AndReturn(
+                                       columns_to_join=['metadata'],
+                                       use_slave=False).AndReturn(
                                            [fakes[1]])
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -749,7 +811,8 @@ class _TestInstanceListObject(object):
                  self.fake_instance(2)]
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
         db.instance_get_all_by_host(self.context, 'foo',
-                                    columns_to_join=None).AndReturn(fakes)
+                                    columns_to_join=None,
+                                    use_slave=False).AndReturn(fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_host(self.context, 'foo')
         for i in range(0, len(fakes)):
@@ -760,6 +823,42 @@ class _TestInstanceListObject(object):
         self.assertEqual(inst_list.obj_what_changed(), set())
         self.assertRemotes()
 
+    def test_iter_by_filters(self):
+        fakes = [self.fake_instance(i) for i in range(1, 6)]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        for marker, batch in ((None, fakes[0:2]),
+                              (fakes[1]['uuid'], fakes[2:4]),
+                              (fakes[3]['uuid'], fakes[4:5])):
+            db.instance_get_all_by_filters(self.context, {'foo': 'bar'},
+                                           'created_at', 'desc', limit=2,
+                                           marker=marker,
+                                           columns_to_join=['metadata'],
+                                           use_slave=True).AndReturn(batch)
+        self.mox.ReplayAll()
+        instances = instance.InstanceList.iter_by_filters(
+            self.context, {'foo': 'bar'}, 2, expected_attrs=['metadata'],
+            use_slave=True)
+        self.assertEqual([fake['uuid'] for fake in fakes],
+                         [inst.uuid for inst in instances])
+
+    def test_iter_by_host(self):
+        fakes = [self.fake_instance(1), self.fake_instance(2)]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        filters = {'host': 'foo', 'deleted': False, 'soft_deleted': True}
+        db.instance_get_all_by_filters(self.context, filters,
+                                       'created_at', 'desc', limit=2,
+                                       marker=None, columns_to_join=None,
+                                       use_slave=False).AndReturn(fakes)
+        db.instance_get_all_by_filters(self.context, filters,
+                                       'created_at', 'desc', limit=2,
+                                       marker=fakes[1]['uuid'],
+                                       columns_to_join=None,
+                                       use_slave=False).AndReturn([])
+        self.mox.ReplayAll()
+        instances = instance.InstanceList.iter_by_host(self.context, 'foo', 2)
+        self.assertEqual([fake['uuid'] for fake in fakes],
+                         [inst.uuid for inst in instances])
+
     def test_get_by_host_and_node(self):
         fakes = [self.fake_instance(1),
                  self.fake_instance(2)]
@@ -815,7 +914,8 @@ class _TestInstanceListObject(object):
         fake_faults = test_instance_fault.fake_faults
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
         self.mox.StubOutWithMock(db, 'instance_fault_get_by_instance_uuids')
-        db.instance_get_all_by_host(self.context, 'host', columns_to_join=[]
+        db.instance_get_all_by_host(self.context, 'host', columns_to_join=[],
+                                    use_slave=False
                                     ).AndReturn(fake_insts)
         db.instance_fault_get_by_instance_uuids(
             self.context, [x['uuid'] for x in fake_insts]
@@ -12,12 +12,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
+import iso8601
+
 from nova.cells import opts as cells_opts
 from nova.cells import rpcapi as cells_rpcapi
 from nova import db
 from nova import exception
 from nova.network import model as network_model
+from nova.objects import instance
 from nova.objects import instance_info_cache
+from nova.openstack.common import timeutils
 from nova.tests.objects import test_objects
 
 
@@ -34,6 +40,23 @@ class _TestInstanceInfoCacheObject(object):
         self.assertEqual(obj.network_info, nwinfo)
         self.assertRemotes()
 
+    def test_timestamps_from_db(self):
+        updated_at = datetime.datetime(2013, 10, 1, 12, 0, 0)
+        inst = db.instance_create(self.context, {'host': 'fake-host'})
+        timeutils.set_time_override(updated_at)
+        self.addCleanup(timeutils.clear_time_override)
+        db.instance_info_cache_update(self.context, inst['uuid'],
+                                      {'network_info': '[]'})
+
+        # The info cache comes joined to the instance, as a model row.
+        instances = instance.InstanceList.get_by_host(
+            self.context.elevated(), 'fake-host',
+            expected_attrs=['info_cache'])
+        info_cache = instances[0].info_cache
+        self.assertEqual(updated_at.replace(tzinfo=iso8601.iso8601.Utc()),
+                         info_cache.updated_at)
+        self.assertEqual(set(), info_cache.obj_what_changed())
+
     def test_get_by_instance_uuid_no_entries(self):
         self.mox.StubOutWithMock(db, 'instance_info_cache_get')
         db.instance_info_cache_get(self.context, 'fake-uuid').AndReturn(None)
@@ -670,6 +670,52 @@ class TestObjectListBase(test.TestCase):
         self.assertEqual([x.foo for x in obj],
                          [y.foo for y in obj2])
 
+    def test_compact_primitive(self):
+        class Foo(base.ObjectListBase, base.NovaObject):
+            pass
+
+        class Bar(base.NovaObject):
+            fields = {'foo': str}
+
+        class Baz(base.NovaObject):
+            fields = {'id': int,
+                      'meta': dict,
+                      'bar': utils.nested_object(Bar),
+                      'bars': utils.nested_object(Foo)}
+            _attr_bar_to_primitive = utils.obj_serializer('bar')
+            _attr_bars_to_primitive = utils.obj_serializer('bars')
+
+        obj = Baz()
+        obj.id = 1
+        obj.meta = {'a': 'b'}
+        obj.bar = Bar()
+        obj.bars = Foo()
+        obj.bars.objects = [Bar(), Bar()]
+        for bar in [obj.bar, obj.bars] + obj.bars.objects:
+            bar.foo = 'b'
+            bar.obj_reset_changes()
+        obj.obj_reset_changes()
+
+        primitive = obj.obj_to_compact_primitive()
+        self.assertEqual({'id': 1}, primitive['nova_object.data'])
+        self.assertEqual(set(['meta', 'bar', 'bars']),
+                         set(primitive['nova_object.digests']))
+        obj2 = base.NovaObject.obj_from_primitive(primitive)
+        self.assertFalse(obj2.obj_attr_is_set('meta'))
+        self.assertTrue(obj2.obj_matches_remote('meta', {'a': 'b'}))
+        self.assertFalse(obj2.obj_matches_remote('meta', {'a': 'c'}))
+        self.assertFalse(obj2.obj_matches_remote('id', 1))
+        self.assertFalse(obj.obj_matches_remote('meta', {'a': 'b'}))
+
+        obj.meta = {'a': 'c'}
+        obj.bar.foo = 'c'
+        obj.bars.objects[1].foo = 'c'
+        primitive = obj.obj_to_compact_primitive()
+        self.assertEqual(set(['id', 'meta', 'bar', 'bars']),
+                         set(primitive['nova_object.data']))
+        self.assertEqual({}, primitive['nova_object.digests'])
+        self.assertEqual(['meta'], primitive['nova_object.changes'])
+
 
 class TestObjectSerializer(_BaseTestCase):
     def test_serialize_entity_primitive(self):
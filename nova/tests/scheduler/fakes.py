@@ -16,11 +16,16 @@
 Fakes For Scheduler tests.
 """
 
+import httplib
+
+from eventlet import greenthread
 import mox
 
 from nova.compute import vm_states
 from nova import db
+from nova.openstack.common import timeutils
 from nova.scheduler import filter_scheduler
+from nova.scheduler.filters import trusted_filter
 from nova.scheduler import host_manager
 
 
@@ -136,7 +141,41 @@ class FakeComputeAPI(object):
         pass
 
 
+AGGREGATES = [
+        dict(id=1, name='agg1', hosts=['host1', 'host2'],
+             metadetails={'availability_zone': 'az1', 'opt1': '1'}),
+        dict(id=2, name='agg2', hosts=['host2'],
+             metadetails={'opt1': '2'}),
+]
+
+
+class FakeAttestationService(trusted_filter.AttestationService):
+    """Attestation server answering locally with the trust levels of
+    trust_levels, 'trusted' by default.  Every request is recorded and
+    takes 'delay' seconds, so the attestation cache can be load tested.
+    """
+
+    def __init__(self, trust_levels=None, delay=0):
+        super(FakeAttestationService, self).__init__()
+        self.trust_levels = trust_levels or {}
+        self.delay = delay
+        self.requests = []
+
+    def _request(self, cmd, subcmd, hosts):
+        self.requests.append(sorted(hosts))
+        if self.delay:
+            greenthread.sleep(self.delay)
+        vtime = timeutils.isotime()
+        states = [{'host_name': host,
+                   'trust_lvl': self.trust_levels.get(host, 'trusted'),
+                   'vtime': vtime}
+                  for host in hosts]
+        return httplib.OK, {'hosts': states}
+
+
 def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
+    mock.StubOutWithMock(db, 'aggregate_get_all')
 
     db.compute_node_get_all(mox.IgnoreArg()).AndReturn(COMPUTE_NODES)
+    db.aggregate_get_all(mox.IgnoreArg()).AndReturn(AGGREGATES)
@@ -31,6 +31,7 @@ from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
 from nova.scheduler import utils as scheduler_utils
 from nova.scheduler import weights
+from nova.tests import fake_notifier
 from nova.tests.scheduler import fakes
 from nova.tests.scheduler import test_scheduler
 
@@ -168,7 +169,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -376,7 +378,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                                            'ephemeral_gb': 0, 'vcpus': 1}}
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -504,7 +507,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 50
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             this_weight = self.next_weight
             self.next_weight = 0
             host_state = hosts[0]
@@ -533,6 +537,116 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEquals(50, hosts[0].weight)
 
+    def _test_schedule_batch(self, fake_filtered_hosts, num_instances=3,
+                             sched=None):
+        if sched is None:
+            sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                fake_filtered_hosts)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 1,
+                               'memory_mb': 4096,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux'}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={}, num_instances=num_instances)
+        self.mox.ReplayAll()
+        hosts = sched._schedule(fake_context, request_spec, {})
+        return [(host.obj.host, host.weight) for host in hosts]
+
+    def test_schedule_batch(self):
+        self.flags(scheduler_batch_placement=True)
+        filtered_host_lists = []
+
+        def _fake_filtered_hosts(hosts, filter_properties, index):
+            hosts = list(hosts)
+            filtered_host_lists.append((len(hosts), index))
+            return hosts
+
+        hosts = self._test_schedule_batch(_fake_filtered_hosts)
+
+        # host4 has 8192MB free and host3 3072MB, each instance uses
+        # 4096MB, so host4 is chosen twice.
+        self.assertEqual([('host4', 8192), ('host4', 4096), ('host3', 3072)],
+                         hosts)
+        # All hosts are filtered once, then only the chosen host.
+        self.assertEqual([(4, 0), (1, 1), (1, 2), (1, 3)],
+                         filtered_host_lists)
+
+    def test_schedule_batch_same_hosts_as_serial(self):
+        hosts = self._test_schedule_batch(fake_get_filtered_hosts,
+                                          num_instances=5)
+        self.mox.UnsetStubs()
+        self.mox.ResetAll()
+        self.flags(scheduler_batch_placement=True)
+        self.assertEqual(hosts,
+                         self._test_schedule_batch(fake_get_filtered_hosts,
+                                                   num_instances=5))
+
+    def test_schedule_batch_drops_host_failing_filters(self):
+        self.flags(scheduler_batch_placement=True)
+
+        def _fake_filtered_hosts(hosts, filter_properties, index):
+            return [host for host in hosts if host.free_ram_mb >= 4096]
+
+        hosts = self._test_schedule_batch(_fake_filtered_hosts)
+
+        # host4 no longer passes once two instances are placed on it and
+        # no other host has enough RAM.
+        self.assertEqual([('host4', 8192), ('host4', 4096)], hosts)
+
+    def test_schedule_optimistic_claim_conflict(self):
+        self.flags(scheduler_optimistic_claims=True)
+        claimed_hosts = []
+
+        def _fake_claim_host(context, host_state, instance):
+            claimed_hosts.append(host_state.host)
+            # Another scheduler claimed host4 first.
+            return host_state.host != 'host4'
+
+        sched = fakes.FakeFilterScheduler()
+        self.stubs.Set(sched.host_manager, 'claim_host', _fake_claim_host)
+        hosts = self._test_schedule_batch(fake_get_filtered_hosts,
+                                          num_instances=2, sched=sched)
+
+        # host4 is not chosen again once its claim conflicted.
+        self.assertEqual(['host4', 'host3', 'host2'], claimed_hosts)
+        self.assertEqual([('host3', 3072), ('host2', 1024)], hosts)
+
+    def test_schedule_batch_optimistic_claim_conflict(self):
+        self.flags(scheduler_optimistic_claims=True,
+                   scheduler_batch_placement=True)
+        self.test_schedule_optimistic_claim_conflict()
+
+    def test_schedule_traced(self):
+        self.flags(scheduler_trace_notifications=True)
+        fake_notifier.stub_notifier(self.stubs)
+        self.addCleanup(fake_notifier.reset)
+        sched = fakes.FakeFilterScheduler()
+
+        hosts = self._test_schedule_batch(fake_get_filtered_hosts,
+                                          num_instances=2, sched=sched)
+
+        self.assertEqual(2, len(hosts))
+        self.assertEqual(1, len(fake_notifier.NOTIFICATIONS))
+        msg = fake_notifier.NOTIFICATIONS[0]
+        self.assertEqual('scheduler.schedule.trace', msg.event_type)
+        self.assertEqual(2, msg.payload['num_instances'])
+        self.assertEqual(2, msg.payload['num_selected'])
+        self.assertIn('host_states', msg.payload['phases'])
+        self.assertIn('weighing', msg.payload['phases'])
+
+        stats = sched.get_stats()
+        self.assertEqual(1, stats['decisions'])
+        self.assertEqual(0, stats['failed_decisions'])
+        self.assertEqual(2, stats['selected'])
+        self.assertEqual(0, stats['claim_conflicts'])
+
     def test_select_hosts_happy_day(self):
         """select_hosts is basically a wrapper around the _select() method.
 
@@ -544,7 +658,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         selected_hosts = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -596,7 +711,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         selected_hosts = []
         selected_nodes = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
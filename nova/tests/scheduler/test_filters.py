@@ -101,21 +101,25 @@ class FiltersTestCase(test.NoDBTestCase):
         filt1_mock = self.mox.CreateMock(Filter1)
         filt2_mock = self.mox.CreateMock(Filter2)
 
-        self.mox.StubOutWithMock(sys.modules[__name__], 'Filter1',
-                                 use_mock_anything=True)
+        self.stubs.Set(sys.modules[__name__], 'Filter1',
+                       lambda: filt1_mock)
         self.mox.StubOutWithMock(filt1_mock, 'run_filter_for_index')
+        self.mox.StubOutWithMock(filt1_mock, 'run_filter_for_properties')
         self.mox.StubOutWithMock(filt1_mock, 'filter_all')
-        self.mox.StubOutWithMock(sys.modules[__name__], 'Filter2',
-                                 use_mock_anything=True)
+        self.stubs.Set(sys.modules[__name__], 'Filter2',
+                       lambda: filt2_mock)
         self.mox.StubOutWithMock(filt2_mock, 'run_filter_for_index')
+        self.mox.StubOutWithMock(filt2_mock, 'run_filter_for_properties')
         self.mox.StubOutWithMock(filt2_mock, 'filter_all')
 
-        Filter1().AndReturn(filt1_mock)
         filt1_mock.run_filter_for_index(0).AndReturn(True)
+        filt1_mock.run_filter_for_properties(
+                filter_properties).AndReturn(True)
         filt1_mock.filter_all(filter_objs_initial,
                               filter_properties).AndReturn(filter_objs_second)
-        Filter2().AndReturn(filt2_mock)
         filt2_mock.run_filter_for_index(0).AndReturn(True)
+        filt2_mock.run_filter_for_properties(
+                filter_properties).AndReturn(True)
         filt2_mock.filter_all(filter_objs_second,
                               filter_properties).AndReturn(filter_objs_last)
 
@@ -145,20 +149,21 @@ class FiltersTestCase(test.NoDBTestCase):
         filt1_mock = self.mox.CreateMock(Filter1)
         filt2_mock = self.mox.CreateMock(Filter2)
 
-        self.mox.StubOutWithMock(sys.modules[__name__], 'Filter1',
-                                 use_mock_anything=True)
+        self.stubs.Set(sys.modules[__name__], 'Filter1',
+                       lambda: filt1_mock)
         self.mox.StubOutWithMock(filt1_mock, 'run_filter_for_index')
+        self.mox.StubOutWithMock(filt1_mock, 'run_filter_for_properties')
         self.mox.StubOutWithMock(filt1_mock, 'filter_all')
-        self.mox.StubOutWithMock(sys.modules[__name__], 'Filter2',
-                                 use_mock_anything=True)
+        self.stubs.Set(sys.modules[__name__], 'Filter2',
+                       lambda: filt2_mock)
         self.mox.StubOutWithMock(filt2_mock, 'run_filter_for_index')
         self.mox.StubOutWithMock(filt2_mock, 'filter_all')
 
-        Filter1().AndReturn(filt1_mock)
         filt1_mock.run_filter_for_index(0).AndReturn(True)
+        filt1_mock.run_filter_for_properties(
+                filter_properties).AndReturn(True)
         filt1_mock.filter_all(filter_objs_initial,
                               filter_properties).AndReturn(filter_objs_second)
-        Filter2().AndReturn(filt2_mock)
         # return false so filter_all will not be called
         filt2_mock.run_filter_for_index(0).AndReturn(False)
 
@@ -183,17 +188,19 @@ class FiltersTestCase(test.NoDBTestCase):
         filt1_mock = self.mox.CreateMock(Filter1)
         filt2_mock = self.mox.CreateMock(Filter2)
 
-        self.mox.StubOutWithMock(sys.modules[__name__], 'Filter1',
-                                 use_mock_anything=True)
+        self.stubs.Set(sys.modules[__name__], 'Filter1',
+                       lambda: filt1_mock)
         self.mox.StubOutWithMock(filt1_mock, 'run_filter_for_index')
+        self.mox.StubOutWithMock(filt1_mock, 'run_filter_for_properties')
         self.mox.StubOutWithMock(filt1_mock, 'filter_all')
         # Shouldn't be called.
-        self.mox.StubOutWithMock(sys.modules[__name__], 'Filter2',
-                                 use_mock_anything=True)
+        self.stubs.Set(sys.modules[__name__], 'Filter2',
+                       lambda: filt2_mock)
         self.mox.StubOutWithMock(filt2_mock, 'filter_all')
 
-        Filter1().AndReturn(filt1_mock)
         filt1_mock.run_filter_for_index(0).AndReturn(True)
+        filt1_mock.run_filter_for_properties(
+                filter_properties).AndReturn(True)
         filt1_mock.filter_all(filter_objs_initial,
                               filter_properties).AndReturn(None)
         self.mox.ReplayAll()
@@ -204,3 +211,72 @@ class FiltersTestCase(test.NoDBTestCase):
                                                      filter_objs_initial,
                                                      filter_properties)
         self.assertEqual(None, result)
+
+    def _get_filter_handler(self):
+        def _fake_base_loader_init(*args, **kwargs):
+            pass
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       _fake_base_loader_init)
+        return filters.BaseFilterHandler(filters.BaseFilter)
+
+    def test_get_filtered_objects_reuses_filters(self):
+        filter_handler = self._get_filter_handler()
+        created = []
+
+        class CountingFilter(filters.BaseFilter):
+            def __init__(self):
+                created.append(self)
+
+        for x in xrange(3):
+            result = filter_handler.get_filtered_objects(
+                    [CountingFilter], ['obj1', 'obj2'], {})
+            self.assertEqual(['obj1', 'obj2'], result)
+        self.assertEqual(1, len(created))
+
+    def test_get_filtered_objects_for_properties(self):
+        class SkippedFilter(filters.BaseFilter):
+            def run_filter_for_properties(self, filter_properties):
+                return False
+
+            def _filter_one(self, obj, filter_properties):
+                raise AssertionError('Filter should have been skipped')
+
+        filter_handler = self._get_filter_handler()
+        result = filter_handler.get_filtered_objects(
+                [SkippedFilter], ['obj1', 'obj2'], {})
+        self.assertEqual(['obj1', 'obj2'], result)
+        stats = filter_handler.get_filter_stats()['SkippedFilter']
+        self.assertEqual(1, stats['skips'])
+        self.assertEqual(0, stats['runs'])
+
+    def test_get_filtered_objects_trace(self):
+        class OddFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                return obj % 2
+
+        filter_handler = self._get_filter_handler()
+        trace = []
+        result = filter_handler.get_filtered_objects([Filter1, OddFilter],
+                                                     range(4), {},
+                                                     trace=trace)
+        self.assertEqual([1, 3], result)
+        self.assertEqual([('Filter1', 4, 4), ('OddFilter', 4, 2)],
+                         [(run['name'], run['objs_in'], run['objs_out'])
+                          for run in trace])
+
+    def test_get_filter_stats(self):
+        class OddFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                return obj % 2
+
+        filter_handler = self._get_filter_handler()
+        filter_handler.get_filtered_objects([OddFilter], range(10), {})
+        filter_handler.get_filtered_objects([Filter1, OddFilter],
+                                            range(4), {})
+        stats = filter_handler.get_filter_stats()
+        self.assertEqual(2, stats['OddFilter']['runs'])
+        self.assertEqual(14, stats['OddFilter']['objs_in'])
+        self.assertEqual(7, stats['OddFilter']['objs_out'])
+        self.assertEqual(1, stats['Filter1']['runs'])
+        self.assertEqual(4, stats['Filter1']['objs_out'])
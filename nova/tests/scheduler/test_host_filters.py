@@ -399,6 +399,49 @@ class HostFiltersTestCase(test.NoDBTestCase):
 
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def _test_affinity_filter_all_single_lookup(self, filter_name,
+                                                hint_name):
+        filt_cls = self.class_map[filter_name]()
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                 for i in xrange(50)]
+        instance = fakes.FakeInstance(context=self.context,
+                                      params={'host': 'host1'})
+        filter_properties = {'context': self.context.elevated(),
+                             'scheduler_hints': {
+                                 hint_name: [instance.uuid], }}
+
+        calls = []
+        orig_get_all = filt_cls.compute_api.get_all
+
+        def fake_get_all(*args, **kwargs):
+            calls.append(args)
+            return orig_get_all(*args, **kwargs)
+
+        self.stubs.Set(filt_cls.compute_api, 'get_all', fake_get_all)
+        result = list(filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual(1, len(calls))
+        return hosts, result
+
+    def test_affinity_different_filter_all_single_lookup(self):
+        hosts, result = self._test_affinity_filter_all_single_lookup(
+                'DifferentHostFilter', 'different_host')
+        self.assertEqual(49, len(result))
+        self.assertNotIn(hosts[1], result)
+
+    def test_affinity_same_filter_all_single_lookup(self):
+        hosts, result = self._test_affinity_filter_all_single_lookup(
+                'SameHostFilter', 'same_host')
+        self.assertEqual([hosts[1]], result)
+
+    def test_affinity_filter_all_no_hint_no_lookup(self):
+        filt_cls = self.class_map['DifferentHostFilter']()
+        hosts = [fakes.FakeHostState('host1', 'node1', {})]
+        self.mox.StubOutWithMock(filt_cls.compute_api, 'get_all')
+        self.mox.ReplayAll()
+        result = filt_cls.filter_all(hosts, {'context': self.context,
+                                             'scheduler_hints': None})
+        self.assertEqual(hosts, list(result))
+
     def test_affinity_simple_cidr_filter_passes(self):
         filt_cls = self.class_map['SimpleCIDRAffinityFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -1063,6 +1106,38 @@ class HostFiltersTestCase(test.NoDBTestCase):
                  'service': service})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_json_filter_filter_all_compiles_once(self):
+        filt_cls = self.class_map['JsonFilter']()
+        raw = ['and',
+                  ['>=', '$free_ram_mb', 1024],
+                  ['=', '$capabilities.opt1', 'match']]
+        filter_properties = {
+            'scheduler_hints': {
+                'query': jsonutils.dumps(raw),
+            },
+        }
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 1024, 'capabilities': {'opt1': 'match'}})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': 512, 'capabilities': {'opt1': 'match'}})
+        host3 = fakes.FakeHostState('host3', 'node3',
+                {'free_ram_mb': 2048, 'capabilities': {}})
+        host4 = fakes.FakeHostState('host4', 'node4',
+                {'free_ram_mb': 2048, 'capabilities': {'opt1': 'match'}})
+
+        self.mox.StubOutWithMock(jsonutils, 'loads')
+        jsonutils.loads(jsonutils.dumps(raw)).AndReturn(raw)
+        self.mox.ReplayAll()
+
+        result = filt_cls.filter_all([host1, host2, host3, host4],
+                                     filter_properties)
+        self.assertEqual([host1, host4], list(result))
+
+    def test_json_filter_filter_all_with_no_query(self):
+        filt_cls = self.class_map['JsonFilter']()
+        host = fakes.FakeHostState('host1', 'node1', {})
+        self.assertEqual([host], list(filt_cls.filter_all([host], {})))
+
     def test_json_filter_basic_operators(self):
         filt_cls = self.class_map['JsonFilter']()
         host = fakes.FakeHostState('host1', 'node1',
@@ -1319,6 +1394,74 @@ class HostFiltersTestCase(test.NoDBTestCase):
 
         timeutils.clear_time_override()
 
+    def _get_attestation_cache(self, trust_levels):
+        self.flags(attestation_refresh_interval=30,
+                   group='trusted_computing')
+        periodic_funcs = []
+        background_funcs = []
+
+        class FakeLoopingCall(object):
+            def __init__(self, f):
+                periodic_funcs.append(f)
+
+            def start(self, interval, initial_delay=None):
+                pass
+
+        self.stubs.Set(trusted_filter.loopingcall,
+                       'FixedIntervalLoopingCall', FakeLoopingCall)
+        self.stubs.Set(trusted_filter.utils, 'spawn_n',
+                       lambda f: background_funcs.append(f))
+        attestservice = fakes.FakeAttestationService(trust_levels)
+        self.stubs.Set(trusted_filter, 'AttestationService',
+                       lambda: attestservice)
+        cache = trusted_filter.ComputeAttestationCache()
+        self.assertEqual(1, len(periodic_funcs))
+        return cache, attestservice, periodic_funcs[0], background_funcs
+
+    def test_trusted_filter_background_refresh(self):
+        cache, attestservice, periodic_refresh, background_funcs = (
+                self._get_attestation_cache({'host1': 'trusted',
+                                             'host2': 'untrusted'}))
+
+        # Unknown hosts aren't attested from the scheduling path.
+        self.assertEqual('unknown', cache.get_host_attestation('host1'))
+        self.assertEqual('unknown', cache.get_host_attestation('host2'))
+        self.assertEqual([], attestservice.requests)
+        self.assertEqual(1, len(background_funcs))
+
+        background_funcs.pop()()
+        self.assertEqual([['host1', 'host2']], attestservice.requests)
+        self.assertEqual('trusted', cache.get_host_attestation('host1'))
+        self.assertEqual('untrusted', cache.get_host_attestation('host2'))
+        self.assertEqual([], background_funcs)
+
+        # All hosts are attested at once periodically.
+        periodic_refresh()
+        self.assertEqual([['host1', 'host2']] * 2, attestservice.requests)
+
+    def test_trusted_filter_background_refresh_serves_stale(self):
+        cache, attestservice, periodic_refresh, background_funcs = (
+                self._get_attestation_cache({'host1': 'trusted'}))
+        cache.get_host_attestation('host1')
+        background_funcs.pop()()
+
+        timeutils.set_time_override(timeutils.utcnow())
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.advance_time_seconds(
+            CONF.trusted_computing.attestation_auth_timeout + 80)
+        attestservice.trust_levels['host1'] = 'untrusted'
+
+        # The stale level is served and a single refresh is started.
+        self.assertEqual('trusted', cache.get_host_attestation('host1'))
+        self.assertEqual('trusted', cache.get_host_attestation('host1'))
+        self.assertEqual(1, len(background_funcs))
+        periodic_refresh()
+        self.assertEqual(1, len(attestservice.requests))
+
+        background_funcs.pop()()
+        self.assertEqual('untrusted', cache.get_host_attestation('host1'))
+        self.assertEqual([], background_funcs)
+
     def test_core_filter_passes(self):
         filt_cls = self.class_map['CoreFilter']()
         filter_properties = {'instance_type': {'vcpus': 1}}
@@ -1415,6 +1558,17 @@ class HostFiltersTestCase(test.NoDBTestCase):
                                    {'service': service})
         self.assertFalse(filt_cls.host_passes(host, request))
 
+    def test_availability_zone_filter_uses_aggregate_snapshot(self):
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        host = fakes.FakeHostState('host1', 'node1',
+                {'aggregate_metadata': {'availability_zone': set(['az1'])}})
+        self.assertTrue(filt_cls.host_passes(
+                host, self._make_zone_request('az1')))
+        self.assertFalse(filt_cls.host_passes(
+                host, self._make_zone_request('az2')))
+
     def test_retry_filter_disabled(self):
         # Test case where retry/re-scheduling is disabled.
         filt_cls = self.class_map['RetryFilter']()
@@ -1526,6 +1680,21 @@ class HostFiltersTestCase(test.NoDBTestCase):
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_aggregate_multi_tenancy_isolation_uses_aggregate_snapshot(self):
+        filt_cls = self.class_map['AggregateMultiTenancyIsolation']()
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        filter_properties = {'context': self.context,
+                             'request_spec': {
+                                 'instance_properties': {
+                                     'project_id': 'my_tenantid'}}}
+        host = fakes.FakeHostState('host1', 'compute',
+                {'aggregate_metadata': {
+                    'filter_tenant_id': set(['other_tenantid'])}})
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+        host.aggregate_metadata = {}
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+
     def test_aggregate_multi_tenancy_isolation_no_meta_passes(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['AggregateMultiTenancyIsolation']()
@@ -15,6 +15,10 @@
 """
 Tests For HostManager
 """
+import datetime
+
+import mox
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -317,11 +321,13 @@ class HostManagerTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         self.mox.StubOutWithMock(host_manager.LOG, 'warn')
 
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
         # Invalid service
         host_manager.LOG.warn("No service for compute ID 5")
+        db.aggregate_get_all(context).AndReturn(fakes.AGGREGATES)
 
         self.mox.ReplayAll()
         self.host_manager.get_all_host_states(context)
@@ -356,6 +362,47 @@ class HostManagerTestCase(test.NoDBTestCase):
         # 8191GB
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
+        self.assertEqual(
+                host_states_map[('host1', 'node1')].aggregate_metadata,
+                {'availability_zone': set(['az1']), 'opt1': set(['1'])})
+        self.assertEqual(
+                host_states_map[('host2', 'node2')].aggregate_metadata,
+                {'availability_zone': set(['az1']), 'opt1': set(['1', '2'])})
+        self.assertEqual(
+                host_states_map[('host3', 'node3')].aggregate_metadata, {})
+
+    def _get_claimed_host_state(self):
+        host_state = host_manager.HostState('host1', 'node1')
+        host_state.compute_node_id = 1
+        host_state.generation = 3
+        host_state.updated = timeutils.utcnow()
+        instance = {'memory_mb': 512, 'root_gb': 10, 'ephemeral_gb': 5,
+                    'vcpus': 2}
+        self.mox.StubOutWithMock(db, 'compute_node_claim')
+        return host_state, instance
+
+    def test_claim_host(self):
+        host_state, instance = self._get_claimed_host_state()
+        db.compute_node_claim('fake_context', 1, 3, 512, 15, 2)
+        self.mox.ReplayAll()
+
+        self.assertTrue(self.host_manager.claim_host('fake_context',
+                                                     host_state, instance))
+        self.assertEqual(4, host_state.generation)
+        self.assertEqual(0, self.host_manager.claim_conflicts)
+
+    def test_claim_host_conflict(self):
+        host_state, instance = self._get_claimed_host_state()
+        db.compute_node_claim('fake_context', 1, 3, 512, 15, 2).AndRaise(
+                exception.ComputeNodeClaimConflict(compute_id=1,
+                                                   generation=3))
+        self.mox.ReplayAll()
+
+        self.assertFalse(self.host_manager.claim_host('fake_context',
+                                                      host_state, instance))
+        self.assertEqual(3, host_state.generation)
+        self.assertIsNone(host_state.updated)
+        self.assertEqual(1, self.host_manager.claim_conflicts)
 
 
 class HostManagerChangedNodesTestCase(test.NoDBTestCase):
@@ -376,7 +423,9 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -387,12 +436,15 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         # all nodes active for first call
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
         # remove node4 for second call
         running_nodes = [n for n in fakes.COMPUTE_NODES
                          if n.get('hypervisor_hostname') != 'node4']
         db.compute_node_get_all(context).AndReturn(running_nodes)
+        db.aggregate_get_all(context).AndReturn([])
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -404,9 +456,11 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         # all nodes active for first call
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
-        # remove all nodes for second call
+        db.aggregate_get_all(context).AndReturn([])
+        # remove all nodes for second call, no aggregate lookup needed
         db.compute_node_get_all(context).AndReturn([])
         self.mox.ReplayAll()
 
@@ -415,6 +469,113 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         host_states_map = self.host_manager.host_state_map
         self.assertEqual(len(host_states_map), 0)
 
+    def test_get_all_host_states_incremental(self):
+        self.flags(scheduler_incremental_host_states=True,
+                   scheduler_host_states_full_sync_interval=60)
+        context = 'fake_context'
+        timeutils.set_time_override()
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        # first call fetches all nodes
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
+        # second call only fetches the changed ones, and all the services
+        changed_node = dict(fakes.COMPUTE_NODES[0], free_ram_mb=256)
+        deleted_node = dict(fakes.COMPUTE_NODES[3], deleted=4)
+        db.compute_node_get_all(context,
+                updated_since=mox.IsA(datetime.datetime)).AndReturn(
+                        [changed_node, deleted_node])
+        services = [dict(node['service'], binary='nova-compute')
+                    for node in fakes.COMPUTE_NODES[:4]]
+        services[1]['disabled'] = False
+        db.service_get_all(context).AndReturn(services)
+        db.aggregate_get_all(context).AndReturn([])
+        # third call is past the full sync interval
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:2])
+        db.aggregate_get_all(context).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(30)
+        self.host_manager.get_all_host_states(context)
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(3, len(host_states_map))
+        self.assertNotIn(('host4', 'node4'), host_states_map)
+        self.assertEqual(
+                256, host_states_map[('host1', 'node1')].free_ram_mb)
+        # the service of an unchanged node is refreshed too
+        self.assertFalse(
+                host_states_map[('host2', 'node2')].service['disabled'])
+
+        timeutils.advance_time_seconds(31)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(2, len(self.host_manager.host_state_map))
+
+    def test_get_all_host_states_incremental_service_gone(self):
+        self.flags(scheduler_incremental_host_states=True)
+        context = 'fake_context'
+        timeutils.set_time_override()
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
+        db.compute_node_get_all(context,
+                updated_since=mox.IsA(datetime.datetime)).AndReturn([])
+        # host3 went away, and other services aren't computes
+        services = [dict(node['service'], binary='nova-compute')
+                    for node in fakes.COMPUTE_NODES[:2]]
+        services.append(dict(host='host4', disabled=False,
+                             binary='nova-conductor'))
+        db.service_get_all(context).AndReturn(services)
+        db.aggregate_get_all(context).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(set([('host1', 'node1'), ('host2', 'node2')]),
+                         set(self.host_manager.host_state_map))
+
+    def test_get_all_host_states_incremental_keeps_consumed(self):
+        self.flags(scheduler_incremental_host_states=True,
+                   scheduler_host_states_full_sync_interval=60)
+        context = 'fake_context'
+        timeutils.set_time_override()
+        nodes = [dict(fakes.COMPUTE_NODES[0], updated_at=timeutils.utcnow())]
+        services = [dict(nodes[0]['service'], binary='nova-compute')]
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.compute_node_get_all(context).AndReturn(nodes)
+        db.aggregate_get_all(context).AndReturn([])
+        db.compute_node_get_all(context,
+                updated_since=mox.IsA(datetime.datetime)).AndReturn([])
+        db.service_get_all(context).AndReturn(services)
+        db.aggregate_get_all(context).AndReturn([])
+        db.compute_node_get_all(context).AndReturn(nodes)
+        db.aggregate_get_all(context).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        timeutils.advance_time_seconds(1)
+        host_state.consume_from_instance(fakes.INSTANCES[0])
+        self.assertEqual(0, host_state.free_ram_mb)
+
+        # the consumed resources are kept while the row doesn't change
+        timeutils.advance_time_seconds(30)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(0, host_state.free_ram_mb)
+
+        # and dropped by the next full refresh
+        timeutils.advance_time_seconds(31)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(512, host_state.free_ram_mb)
+
 
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
@@ -87,3 +87,7 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
                 request_spec='fake_request_spec',
                 filter_properties='fake_prop',
                 version='2.7')
+
+    def test_get_scheduler_stats(self):
+        self._test_scheduler_api('get_scheduler_stats', rpc_method='call',
+                version='2.11')
@@ -72,6 +72,13 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
         manager = self.manager
         self.assertTrue(isinstance(manager.driver, self.driver_cls))
 
+    def test_get_scheduler_stats(self):
+        self.mox.StubOutWithMock(self.manager.driver, 'get_stats')
+        self.manager.driver.get_stats().AndReturn({'decisions': 1})
+        self.mox.ReplayAll()
+        self.assertEqual({'decisions': 1},
+                         self.manager.get_scheduler_stats(self.context))
+
     def test_update_service_capabilities(self):
         service_name = 'fake_service'
         host = 'fake_host'
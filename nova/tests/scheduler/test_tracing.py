@@ -0,0 +1,92 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For scheduler decision tracing.
+"""
+
+import sqlalchemy
+
+from nova.scheduler import tracing
+from nova import test
+
+
+class ScheduleTraceTestCase(test.NoDBTestCase):
+    def test_tracing_sets_current_trace(self):
+        trace = tracing.ScheduleTrace()
+        self.assertIsNone(tracing.get_current_trace())
+        with tracing.tracing(trace):
+            self.assertIs(trace, tracing.get_current_trace())
+        self.assertIsNone(tracing.get_current_trace())
+
+    def test_phase_adds_up(self):
+        trace = tracing.ScheduleTrace()
+        times = iter([10.0, 11.5, 20.0, 20.5])
+        self.stubs.Set(tracing.time, 'time', lambda: times.next())
+
+        with tracing.tracing(trace):
+            with tracing.phase('filtering'):
+                pass
+            with tracing.phase('filtering'):
+                pass
+        self.assertEqual({'filtering': 2.0}, trace.phases)
+
+    def test_phase_without_trace(self):
+        with tracing.phase('filtering'):
+            pass
+
+    def test_traced(self):
+        @tracing.traced('weighing')
+        def fake_weigh(arg):
+            return arg
+
+        trace = tracing.ScheduleTrace()
+        with tracing.tracing(trace):
+            self.assertEqual('fake_arg', fake_weigh('fake_arg'))
+        self.assertEqual(['weighing'], trace.phases.keys())
+
+    def test_db_queries_counted(self):
+        engine = sqlalchemy.create_engine('sqlite://')
+        engine.execute('select 1')
+
+        trace = tracing.ScheduleTrace()
+        with tracing.tracing(trace):
+            engine.execute('select 1')
+            engine.execute('select 2')
+        engine.execute('select 3')
+        self.assertEqual(2, trace.db_queries)
+
+
+class TraceStatsTestCase(test.NoDBTestCase):
+    def _get_trace(self, num_instances, num_selected, phases):
+        trace = tracing.ScheduleTrace()
+        trace.phases = phases
+        trace.db_queries = 3
+        trace.finish(num_instances, num_selected)
+        return trace
+
+    def test_add(self):
+        stats = tracing.TraceStats()
+        stats.add(self._get_trace(2, 2, {'filtering': 1.0}))
+        stats.add(self._get_trace(1, 0, {'filtering': 0.5,
+                                         'weighing': 0.25}))
+
+        result = stats.to_dict()
+        self.assertEqual(2, result['decisions'])
+        self.assertEqual(1, result['failed_decisions'])
+        self.assertEqual(3, result['instances'])
+        self.assertEqual(2, result['selected'])
+        self.assertEqual(6, result['db_queries'])
+        self.assertEqual({'filtering': 1.5, 'weighing': 0.25},
+                         result['phases'])
@@ -19,6 +19,7 @@ Tests For Scheduler weights.
 from nova import context
 from nova.scheduler import weights
 from nova import test
+from nova import weights as base_weights
 from nova.tests import matchers
 from nova.tests.scheduler import fakes
 
@@ -59,7 +60,7 @@ class RamWeigherTestCase(test.NoDBTestCase):
         host_states = self.host_manager.get_all_host_states(ctxt)
         self.mox.VerifyAll()
         self.mox.ResetAll()
-        return host_states
+        return list(host_states)
 
     def test_default_of_spreading_first(self):
         hostinfo_list = self._get_all_hosts()
@@ -101,3 +102,66 @@ class RamWeigherTestCase(test.NoDBTestCase):
         weighed_host = self._get_weighed_host(hostinfo_list)
         self.assertEqual(weighed_host.weight, 8192 * 2)
         self.assertEqual(weighed_host.obj.host, 'host4')
+
+    def _get_weighed_hosts_by_name(self, hosts, limit=None):
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hosts, {}, limit=limit)
+        return [(weighed_host.obj.host, weighed_host.weight)
+                for weighed_host in weighed_hosts]
+
+    def test_ram_weigher_limit(self):
+        hostinfo_list = self._get_all_hosts()
+
+        weighed_hosts = self._get_weighed_hosts_by_name(hostinfo_list,
+                                                        limit=2)
+        self.assertEqual([('host4', 8192), ('host3', 3072)], weighed_hosts)
+
+    def test_ram_weigher_limit_larger_than_hosts(self):
+        hostinfo_list = self._get_all_hosts()
+
+        weighed_hosts = self._get_weighed_hosts_by_name(hostinfo_list,
+                                                        limit=10)
+        self.assertEqual(['host4', 'host3', 'host2', 'host1'],
+                         [host for host, weight in weighed_hosts])
+
+    def test_ram_weigher_without_numpy(self):
+        hostinfo_list = self._get_all_hosts()
+        expected = self._get_weighed_hosts_by_name(hostinfo_list)
+        expected_limited = self._get_weighed_hosts_by_name(hostinfo_list,
+                                                           limit=2)
+
+        self.stubs.Set(base_weights, 'numpy', None)
+        self.assertEqual(expected,
+                         self._get_weighed_hosts_by_name(hostinfo_list))
+        self.assertEqual(expected_limited,
+                         self._get_weighed_hosts_by_name(hostinfo_list,
+                                                         limit=2))
+
+    def test_ram_weigher_ties_keep_host_order(self):
+        hostinfo_list = self._get_all_hosts()
+        for host_state in hostinfo_list:
+            host_state.free_ram_mb = 1024
+
+        weighed_hosts = self._get_weighed_hosts_by_name(hostinfo_list)
+        self.assertEqual([host_state.host for host_state in hostinfo_list],
+                         [host for host, weight in weighed_hosts])
+        for limit in range(1, len(hostinfo_list)):
+            weighed_hosts = self._get_weighed_hosts_by_name(hostinfo_list,
+                                                            limit=limit)
+            self.assertEqual(
+                    [host_state.host for host_state in hostinfo_list][:limit],
+                    [host for host, weight in weighed_hosts])
+
+    def test_ram_weigher_ties_with_limit(self):
+        hostinfo_list = [fakes.FakeHostState('host%d' % i, 'node',
+                                             {'free_ram_mb': 1024 * (i % 3)})
+                         for i in range(80)]
+
+        for limit in (1, 5, 21, 40, 79):
+            expected = self._get_weighed_hosts_by_name(hostinfo_list,
+                                                       limit=limit)
+            self.stubs.Set(base_weights, 'numpy', None)
+            self.assertEqual(expected,
+                             self._get_weighed_hosts_by_name(hostinfo_list,
+                                                             limit=limit))
+            self.stubs.UnsetAll()
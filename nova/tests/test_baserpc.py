@@ -22,6 +22,7 @@ from oslo.config import cfg
 
 from nova import baserpc
 from nova import context
+from nova.openstack.common.rpc import stats as rpc_stats
 from nova import test
 
 CONF = cfg.CONF
@@ -48,3 +49,16 @@ class BaseAPITestCase(test.TestCase):
         res = self.base_rpcapi.get_backdoor_port(self.context,
                 self.compute.host)
         self.assertEqual(res, self.compute.backdoor_port)
+
+    def test_get_rpc_stats(self):
+        rpc_stats.reset()
+        self.addCleanup(rpc_stats.reset)
+        rpc_stats.record('dispatch', 'compute.fake-host', 'ping', 0.003)
+
+        res = self.base_rpcapi.get_rpc_stats(self.context,
+                self.compute.host)
+        self.assertEqual({}, res['client'])
+        self.assertEqual({}, res['queue'])
+        ping = res['dispatch']['compute']['ping']
+        self.assertEqual(1, ping['count'])
+        self.assertEqual({'<=5ms': 1}, ping['buckets'])
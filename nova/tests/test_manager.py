@@ -18,7 +18,13 @@
 Unit Tests for nova.manager
 """
 
+import datetime
+
+from eventlet import greenthread
+
 from nova import manager
+from nova.openstack.common import periodic_task
+from nova.openstack.common import timeutils
 from nova import test
 
 
@@ -33,3 +39,118 @@ class ManagerTestCase(test.NoDBTestCase):
 
         self.assertEqual(len(dispatch.callbacks), 3)
         self.assertTrue(api in dispatch.callbacks)
+
+
+class PeriodicTasksTestCase(test.NoDBTestCase):
+    def _make_manager(self):
+        class FakeManager(manager.Manager):
+            def __init__(self, *args, **kwargs):
+                self.calls = []
+                super(FakeManager, self).__init__(*args, **kwargs)
+
+            @periodic_task.periodic_task
+            def every_pass(self, context):
+                self.calls.append('every_pass')
+
+            @periodic_task.periodic_task(spacing=600)
+            def spaced(self, context):
+                self.calls.append('spaced')
+
+            @manager.independent_task
+            @periodic_task.periodic_task
+            def independent1(self, context):
+                self.calls.append('independent1')
+                greenthread.sleep(0)
+                self.calls.append('independent1 done')
+
+            @manager.independent_task
+            @periodic_task.periodic_task
+            def independent2(self, context):
+                self.calls.append('independent2')
+                greenthread.sleep(0)
+                self.calls.append('independent2 done')
+
+            @manager.independent_task
+            @periodic_task.periodic_task
+            def failing(self, context):
+                raise test.TestingException()
+
+        return FakeManager(host='fake-host')
+
+    def test_periodic_tasks_stats(self):
+        m = self._make_manager()
+        m.periodic_tasks(None)
+        m.periodic_tasks(None)
+        self.assertEqual(sorted(['every_pass', 'independent1',
+                                 'independent1 done', 'independent2',
+                                 'independent2 done'] * 2),
+                         sorted(m.calls))
+        stats = m.periodic_task_stats()
+        self.assertEqual(set(['every_pass', 'independent1', 'independent2',
+                              'failing']),
+                         set(stats))
+        self.assertEqual(2, stats['every_pass']['runs'])
+        self.assertEqual(0, stats['every_pass']['failures'])
+        self.assertEqual(2, stats['failing']['runs'])
+        self.assertEqual(2, stats['failing']['failures'])
+        for key in ('last_runtime', 'max_runtime', 'mean_runtime',
+                    'total_runtime'):
+            self.assertTrue(stats['every_pass'][key] >= 0)
+
+    def test_periodic_tasks_raise_on_error(self):
+        m = self._make_manager()
+        self.assertRaises(test.TestingException, m.periodic_tasks, None,
+                          raise_on_error=True)
+
+    def test_periodic_tasks_serial(self):
+        m = self._make_manager()
+        m.periodic_tasks(None)
+        for name in ('independent1', 'independent2'):
+            index = m.calls.index(name)
+            self.assertEqual(name + ' done', m.calls[index + 1])
+
+    def test_periodic_tasks_concurrent(self):
+        self.flags(periodic_task_concurrency=2)
+        m = self._make_manager()
+        m.periodic_tasks(None)
+        # The independent tasks run alongside each other.
+        self.assertTrue(max(m.calls.index('independent1'),
+                            m.calls.index('independent2')) <
+                        min(m.calls.index('independent1 done'),
+                            m.calls.index('independent2 done')))
+
+    def test_periodic_tasks_concurrent_raise_on_error(self):
+        self.flags(periodic_task_concurrency=2)
+        m = self._make_manager()
+        self.assertRaises(test.TestingException, m.periodic_tasks, None,
+                          raise_on_error=True)
+
+    def test_periodic_tasks_jitter(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        now = timeutils.utcnow()
+        first_runs = set()
+        for host in ('host1', 'host2', 'host3'):
+            m = self._make_manager()
+            m.host = host
+            m._jitter_periodic_tasks()
+            first_run = (m._periodic_last_run['spaced'] +
+                         datetime.timedelta(seconds=600))
+            self.assertTrue(now + datetime.timedelta(seconds=600) <=
+                            first_run < now + datetime.timedelta(seconds=1200))
+            first_runs.add(first_run)
+        self.assertEqual(3, len(first_runs))
+
+    def test_periodic_tasks_no_jitter(self):
+        self.flags(periodic_task_jitter=False)
+        m = self._make_manager()
+        self.assertEqual(type(m)._periodic_last_run['spaced'],
+                         m._periodic_last_run['spaced'])
+
+    def test_periodic_tasks_idle_for_accounts_for_runtime(self):
+        m = self._make_manager()
+        self.stubs.Set(manager.time, 'time',
+                       iter([100.0, 130.0]).next)
+        self.stubs.Set(m, '_run_periodic_task', lambda *args: None)
+        self.assertEqual(periodic_task.DEFAULT_INTERVAL - 30,
+                         m.periodic_tasks(None))
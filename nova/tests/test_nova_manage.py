@@ -20,6 +20,7 @@ import StringIO
 import sys
 
 from nova.cmd import manage
+from nova.compute import flavors
 from nova import context
 from nova import db
 from nova import exception
@@ -383,6 +384,49 @@ class ProjectCommandsTestCase(test.TestCase):
     def test_quota_update_invalid_key(self):
         self.assertEqual(2, self.commands.quota('admin', 'volumes1', '10'))
 
+    def test_flush_quota_cache(self):
+        self.mox.StubOutWithMock(manage.quota, 'flush_cache')
+        manage.quota.flush_cache()
+        self.mox.ReplayAll()
+        self.commands.flush_quota_cache()
+
+
+class VmCommandsTestCase(test.TestCase):
+    def setUp(self):
+        super(VmCommandsTestCase, self).setUp()
+        self.commands = manage.VmCommands()
+        self.context = context.get_admin_context()
+
+    def _create_instance(self, name, host):
+        sys_meta = flavors.save_flavor_info(
+                {}, flavors.get_flavor_by_name('m1.tiny'))
+        return db.instance_create(self.context,
+                {'display_name': name, 'host': host, 'launch_index': 0,
+                 'system_metadata': sys_meta})
+
+    def test_list(self):
+        self.flags(instance_scan_batch_size=2)
+        for i in range(3):
+            self._create_instance('inst%d' % i, 'host%d' % (i % 2))
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.list()
+        lines = sys.stdout.getvalue().splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertEqual(['inst0', 'inst1', 'inst2'],
+                         sorted(line.split()[0] for line in lines[1:]))
+        self.assertIn('m1.tiny', lines[1])
+
+    def test_list_just_one_host(self):
+        self._create_instance('inst0', 'host0')
+        self._create_instance('inst1', 'host1')
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.list('host1')
+        lines = sys.stdout.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[1].startswith('inst1'))
+
 
 class DBCommandsTestCase(test.TestCase):
     def setUp(self):
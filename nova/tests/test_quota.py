@@ -1912,6 +1912,54 @@ class DbQuotaDriverTestCase(test.TestCase):
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
+    def test_reserve_optimistic(self):
+        def fake_quota_reserve_optimistic(context, resources, quotas,
+                                          user_quotas, deltas, expire,
+                                          until_refresh, max_age, shards=1,
+                                          project_id=None, user_id=None):
+            self.calls.append(('quota_reserve_optimistic', expire, shards,
+                               project_id, user_id))
+            return ['resv-1']
+
+        self._stub_get_project_quotas()
+        self._stub_quota_reserve()
+        self.stubs.Set(db, 'quota_reserve_optimistic',
+                       fake_quota_reserve_optimistic)
+        self.flags(quota_reservation_engine='optimistic',
+                   quota_usage_shards=4)
+        expire = timeutils.utcnow() + datetime.timedelta(seconds=120)
+        result = self.driver.reserve(FakeContext('test_project', 'test_class'),
+                                     quota.QUOTAS._resources,
+                                     dict(instances=2), expire=expire)
+
+        self.assertEqual(self.calls, [
+                'get_project_quotas',
+                ('quota_reserve_optimistic', expire, 4, 'test_project',
+                 'fake_user'),
+                ])
+        self.assertEqual(result, ['resv-1'])
+
+    def test_commit_rollback_optimistic(self):
+        def fake_settle(name):
+            def settle(context, reservations, project_id=None, user_id=None):
+                self.calls.append((name, reservations, project_id, user_id))
+            return settle
+
+        for name in ('reservation_commit_optimistic',
+                     'reservation_rollback_optimistic'):
+            self.stubs.Set(db, name, fake_settle(name))
+        self.flags(quota_reservation_engine='optimistic')
+        ctx = FakeContext('test_project', 'test_class')
+        self.driver.commit(ctx, ['resv-1'])
+        self.driver.rollback(ctx, ['resv-2'])
+
+        self.assertEqual(self.calls, [
+                ('reservation_commit_optimistic', ['resv-1'],
+                 'test_project', 'fake_user'),
+                ('reservation_rollback_optimistic', ['resv-2'],
+                 'test_project', 'fake_user'),
+                ])
+
     def test_usage_reset(self):
         calls = []
 
@@ -1943,6 +1991,129 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(calls, exemplar)
 
 
+class DbQuotaDriverCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(DbQuotaDriverCacheTestCase, self).setUp()
+        self.flags(quota_cache_ttl=60)
+        quota.reset_cache()
+        self.addCleanup(quota.reset_cache)
+        self.driver = quota.DbQuotaDriver()
+        self.context = FakeContext('test_project', 'test_class')
+        self.calls = []
+
+        def fake_get_all_by_project(context, project_id):
+            self.calls.append('quota_get_all_by_project')
+            return dict(instances=7)
+
+        def fake_get_all_by_project_and_user(context, project_id, user_id):
+            self.calls.append('quota_get_all_by_project_and_user')
+            return dict(instances=3)
+
+        def fake_class_get_all_by_name(context, quota_class):
+            self.calls.append('quota_class_get_all_by_name')
+            return dict(instances=9)
+
+        def fake_class_get_default(context):
+            self.calls.append('quota_class_get_default')
+            return dict(instances=5)
+
+        self.stubs.Set(db, 'quota_get_all_by_project',
+                       fake_get_all_by_project)
+        self.stubs.Set(db, 'quota_get_all_by_project_and_user',
+                       fake_get_all_by_project_and_user)
+        self.stubs.Set(db, 'quota_class_get_all_by_name',
+                       fake_class_get_all_by_name)
+        self.stubs.Set(db, 'quota_class_get_default',
+                       fake_class_get_default)
+
+    def _limit_check(self):
+        self.driver.limit_check(self.context, quota.QUOTAS._resources,
+                                dict(metadata_items=1))
+
+    def test_limit_check_cached(self):
+        self._limit_check()
+        self.assertEqual(sorted(self.calls), [
+                'quota_class_get_all_by_name',
+                'quota_class_get_default',
+                'quota_get_all_by_project',
+                'quota_get_all_by_project_and_user',
+                ])
+        self.calls = []
+        self._limit_check()
+        self._limit_check()
+        self.assertEqual(self.calls, [])
+
+    def test_cache_disabled(self):
+        self.flags(quota_cache_ttl=0)
+        self._limit_check()
+        self._limit_check()
+        self.assertEqual(len(self.calls), 14)
+
+    def test_cache_returns_copies(self):
+        result = self.driver.get_user_quotas(self.context,
+                                             quota.QUOTAS._resources,
+                                             'test_project', 'fake_user',
+                                             usages=False)
+        self.assertEqual(3, result['instances']['limit'])
+        result = self.driver.get_project_quotas(self.context,
+                                                quota.QUOTAS._resources,
+                                                'test_project', usages=False)
+        self.assertEqual(7, result['instances']['limit'])
+
+    def test_invalidate_cache(self):
+        self._limit_check()
+        quota.invalidate_cache(project_id='test_project')
+        self.calls = []
+        self._limit_check()
+        self.assertEqual(self.calls, ['quota_get_all_by_project'])
+
+        quota.invalidate_cache(project_id='test_project',
+                               user_id='fake_user')
+        self.calls = []
+        self._limit_check()
+        self.assertEqual(sorted(self.calls), [
+                'quota_get_all_by_project',
+                'quota_get_all_by_project_and_user',
+                ])
+
+        quota.invalidate_cache(quota_class='test_class')
+        self.calls = []
+        self._limit_check()
+        self.assertEqual(self.calls, ['quota_class_get_all_by_name'])
+
+    def test_invalidate_default_class(self):
+        self._limit_check()
+        quota.invalidate_cache(quota_class='default')
+        self.calls = []
+        self._limit_check()
+        self.assertEqual(self.calls, ['quota_class_get_default'])
+
+    def test_flush_cache(self):
+        self._limit_check()
+        quota.flush_cache()
+        self.calls = []
+        self._limit_check()
+        self.assertEqual(len(self.calls), 4)
+
+    def test_destroy_all_by_project_flushes(self):
+        self.stubs.Set(db, 'quota_destroy_all_by_project',
+                       lambda context, project_id: None)
+        self._limit_check()
+        self.driver.destroy_all_by_project(self.context, 'test_project')
+        self.calls = []
+        self._limit_check()
+        self.assertEqual(len(self.calls), 4)
+
+    def test_cache_hit_authorized(self):
+        self.driver.get_project_quotas(self.context.elevated(),
+                                       quota.QUOTAS._resources,
+                                       'other_project', usages=False)
+        self.assertRaises(exception.NotAuthorized,
+                          self.driver.get_project_quotas, self.context,
+                          quota.QUOTAS._resources, 'other_project',
+                          usages=False)
+
+
 class FakeSession(object):
     def begin(self):
         return self
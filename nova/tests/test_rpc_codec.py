@@ -0,0 +1,190 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Test the encoding of rpc payloads.
+"""
+
+import datetime
+
+import testtools
+
+from nova import context
+from nova.objects import instance as instance_obj
+from nova.openstack.common.rpc import amqp as rpc_amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova import test
+
+
+class FakeConnectionContext(object):
+    sent = []
+
+    def __init__(self, conf, connection_pool):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+    def direct_send(self, msg_id, msg):
+        self.sent.append((msg_id, msg))
+
+    def topic_send(self, topic, msg, timeout=None):
+        self.sent.append((topic, msg))
+
+
+class FakeReplyProxy(object):
+    def add_call_waiter(self, waiter, msg_id):
+        pass
+
+    def del_call_waiter(self, msg_id):
+        pass
+
+
+class FakeConnectionPool(object):
+    reply_proxy = FakeReplyProxy()
+
+
+class CodecTestCase(test.NoDBTestCase):
+    codec = 'json'
+
+    def setUp(self):
+        super(CodecTestCase, self).setUp()
+        self.context = context.RequestContext('fake', 'fake')
+
+    def _round_trip(self, raw_msg):
+        msg = rpc_common.serialize_msg(raw_msg, self.codec)
+        return rpc_common.deserialize_msg(msg)
+
+    def test_envelope(self):
+        msg = rpc_common.serialize_msg({'method': 'ping'}, self.codec)
+        if self.codec == 'json':
+            self.assertEqual('2.0', msg['oslo.version'])
+            self.assertNotIn('oslo.codec', msg)
+        else:
+            self.assertEqual('2.1', msg['oslo.version'])
+            self.assertEqual(self.codec, msg['oslo.codec'])
+        # The codec is negotiated, the option alone doesn't change the
+        # default.
+        self.flags(rpc_codec=self.codec)
+        msg = rpc_common.serialize_msg({'method': 'ping'})
+        self.assertEqual('2.0', msg['oslo.version'])
+
+    def test_datetime(self):
+        when = datetime.datetime(2013, 10, 29, 13, 42, 2, 123456)
+        result = self._round_trip({'args': {'when': when}})
+        self.assertEqual({'args': {'when': '2013-10-29T13:42:02.123456'}},
+                         result)
+
+    def test_set(self):
+        result = self._round_trip({'args': {'ids': set([1, 2])}})
+        self.assertEqual([1, 2], sorted(result['args']['ids']))
+
+    def test_non_string_keys(self):
+        result = self._round_trip({'args': {1: 'a', None: [{2.5: True}],
+                                            False: ('b',)}})
+        self.assertEqual({u'args': {u'1': u'a', u'null': [{u'2.5': True}],
+                                    u'False': [u'b']}}, result)
+
+    def test_object_primitive(self):
+        instance = instance_obj.Instance()
+        instance.uuid = 'fake-uuid'
+        instance.launched_at = datetime.datetime(2013, 10, 29)
+        instance.system_metadata = {'foo': 'bar'}
+        primitive = instance.obj_to_primitive()
+        result = self._round_trip({'args': {'instance': primitive}})
+        instance = instance_obj.Instance.obj_from_primitive(
+                result['args']['instance'])
+        self.assertEqual('fake-uuid', instance.uuid)
+        self.assertEqual(2013, instance.launched_at.year)
+        self.assertEqual({'foo': 'bar'}, instance.system_metadata)
+
+    def test_reply_codec(self):
+        self.stubs.Set(rpc_amqp, 'ConnectionContext', FakeConnectionContext)
+        self.stubs.Set(FakeConnectionContext, 'sent', [])
+        msg = {'method': 'ping', '_msg_id': 'fake-msg-id',
+               '_reply_q': 'fake-reply-q'}
+        if self.codec != 'json':
+            msg['_reply_codec'] = self.codec
+        rpc_amqp.pack_context(msg, self.context)
+        ctxt = rpc_amqp.unpack_context(test.CONF, msg)
+        self.assertNotIn('_reply_codec', msg)
+        self.assertEqual(self.codec, ctxt.reply_codec)
+
+        ctxt.deepcopy().reply({1: 'pong'}, connection_pool='fake-pool')
+        [(reply_q, reply)] = FakeConnectionContext.sent
+        self.assertEqual('fake-reply-q', reply_q)
+        self.assertEqual(self.codec, reply.get('oslo.codec', 'json'))
+        self.assertEqual({u'1': u'pong'},
+                         rpc_common.deserialize_msg(reply)['result'])
+
+
+@testtools.skipIf(rpc_common.msgpack is None, 'msgpack is not installed')
+class MsgpackCodecTestCase(CodecTestCase):
+    codec = 'msgpack'
+
+    def test_same_payload_as_json(self):
+        raw_msg = {'method': 'fake', 'args': {
+            1: datetime.datetime(2013, 10, 29), 'ids': ('a', u'\xe9'),
+            'nested': {True: {None: 1.5}}}}
+        msg = rpc_common.serialize_msg(raw_msg, 'json')
+        self.assertEqual(rpc_common.deserialize_msg(msg),
+                         self._round_trip(raw_msg))
+
+    def test_unsupported_codec(self):
+        msg = rpc_common.serialize_msg({'method': 'ping'}, self.codec)
+        msg['oslo.codec'] = 'fake'
+        self.assertRaises(rpc_common.UnsupportedRpcCodec,
+                          rpc_common.deserialize_msg, msg)
+        self.assertRaises(rpc_common.UnsupportedRpcCodec,
+                          rpc_common.serialize_msg, {}, 'fake')
+
+    def _cast(self, topic):
+        self.stubs.Set(FakeConnectionContext, 'sent', [])
+        rpc_amqp.cast(test.CONF, self.context, topic, {'method': 'ping'},
+                      'fake-pool')
+        [(sent_topic, msg)] = FakeConnectionContext.sent
+        self.assertEqual(topic, sent_topic)
+        return msg.get('oslo.codec', 'json')
+
+    def _reply(self, topic, reply):
+        waiter = rpc_amqp.MulticallProxyWaiter(test.CONF, 'fake-msg-id',
+                                               None, FakeConnectionPool(),
+                                               topic=topic, method='ping')
+        reply = dict(reply, result='pong', failure=None,
+                     _unique_id='fake-%s' % id(reply))
+        self.assertEqual('pong', waiter._process_data(reply))
+        self.assertNotIn('_codec', reply)
+
+    def test_negotiation(self):
+        self.flags(rpc_codec=self.codec)
+        self.stubs.Set(rpc_amqp, 'ConnectionContext', FakeConnectionContext)
+        self.stubs.Set(rpc_amqp, '_TOPIC_CODECS', {})
+        self.assertEqual('json', self._cast('compute.host1'))
+
+        self._reply('compute.host1', {'_codec': self.codec})
+        self.assertEqual(self.codec, self._cast('compute.host1'))
+        self.assertEqual('json', self._cast('compute.host2'))
+
+        # A server which doesn't reply in the codec anymore.
+        self._reply('compute.host1', {})
+        self.assertEqual('json', self._cast('compute.host1'))
+
+    def test_no_negotiation_with_shared_topics(self):
+        self.flags(rpc_codec=self.codec)
+        self.stubs.Set(rpc_amqp, 'ConnectionContext', FakeConnectionContext)
+        self.stubs.Set(rpc_amqp, '_TOPIC_CODECS', {})
+        # Other conductors may not be able to decode it.
+        self._reply('conductor', {'_codec': self.codec})
+        self.assertEqual('json', self._cast('conductor'))
@@ -0,0 +1,206 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Test the latency histograms of rpc messages.
+"""
+
+from nova import context
+from nova.openstack.common.rpc import amqp as rpc_amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common.rpc import stats as rpc_stats
+from nova import test
+
+
+class FakeTime(object):
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class FakeConnectionContext(object):
+    sent = []
+
+    def __init__(self, conf, connection_pool):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+    def direct_send(self, msg_id, msg):
+        self.sent.append((msg_id, msg))
+
+    def topic_send(self, topic, msg, timeout=None):
+        self.sent.append((topic, msg))
+
+
+class FakeReplyProxy(object):
+    def get_reply_q(self):
+        return 'fake-reply-q'
+
+    def add_call_waiter(self, waiter, msg_id):
+        pass
+
+    def del_call_waiter(self, msg_id):
+        pass
+
+
+class FakeConnectionPool(object):
+    reply_proxy = FakeReplyProxy()
+
+
+class FakeProxy(object):
+    """Answers every method with pong, taking dispatch_time seconds."""
+
+    def __init__(self, fake_time, dispatch_time):
+        self.fake_time = fake_time
+        self.dispatch_time = dispatch_time
+        self.dispatched = []
+
+    def dispatch(self, ctxt, version, method, namespace, **kwargs):
+        self.dispatched.append((method, kwargs))
+        self.fake_time.now += self.dispatch_time
+        return 'pong'
+
+
+class HistogramTestCase(test.NoDBTestCase):
+    def _histogram(self, *msecs):
+        histogram = rpc_stats.Histogram()
+        for value in msecs:
+            histogram.add(value / 1000.0)
+        return histogram
+
+    def test_empty(self):
+        histogram = rpc_stats.Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertEqual({'count': 0, 'mean_ms': None, 'max_ms': 0.0,
+                          'p50_ms': None, 'p90_ms': None, 'p99_ms': None,
+                          'buckets': {}}, histogram.to_dict())
+
+    def test_bucket_edges(self):
+        # A bound belongs to the bucket it ends.
+        histogram = self._histogram(1, 1.5, 2, 60000)
+        self.assertEqual({'<=1ms': 1, '<=2ms': 2, '<=60000ms': 1},
+                         histogram.to_dict()['buckets'])
+
+    def test_slower_than_last_bucket(self):
+        histogram = self._histogram(60001)
+        self.assertEqual({'>60000ms': 1}, histogram.to_dict()['buckets'])
+        self.assertEqual(60001, histogram.percentile(50))
+
+    def test_negative(self):
+        # Clock skew between the sender and the receiver.
+        histogram = self._histogram(-3)
+        self.assertEqual({'<=1ms': 1}, histogram.to_dict()['buckets'])
+        self.assertEqual(0.0, histogram.max)
+
+    def test_percentile(self):
+        histogram = self._histogram(*([0.5] * 50 + [3] * 40 + [15] * 9 +
+                                      [40]))
+        self.assertEqual(1, histogram.percentile(50))
+        self.assertEqual(5, histogram.percentile(51))
+        self.assertEqual(5, histogram.percentile(90))
+        self.assertEqual(20, histogram.percentile(99))
+        self.assertEqual(40, histogram.percentile(100))
+
+    def test_percentile_bounded_by_max(self):
+        histogram = self._histogram(1.5, 1.5)
+        self.assertEqual(1.5, histogram.percentile(50))
+        self.assertEqual(1.5, histogram.to_dict()['p99_ms'])
+
+
+class RecordTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(RecordTestCase, self).setUp()
+        rpc_stats.reset()
+        self.addCleanup(rpc_stats.reset)
+        self.flags(rpc_latency_stats=True)
+        self.stubs.Set(rpc_amqp, 'ConnectionContext', FakeConnectionContext)
+        self.stubs.Set(FakeConnectionContext, 'sent', [])
+        self.fake_time = FakeTime(1000.0)
+        self.stubs.Set(rpc_amqp, 'time', self.fake_time)
+        self.context = context.RequestContext('fake', 'fake')
+        self.pool = FakeConnectionPool()
+        self.proxy = FakeProxy(self.fake_time, 0.004)
+
+    def _receive(self, sent):
+        callback = rpc_amqp.ProxyCallback(test.CONF, self.proxy, self.pool,
+                                          topic='compute.host1')
+        msg = rpc_common.deserialize_msg(sent)
+        callback(msg)
+        callback.wait()
+        return msg
+
+    def test_call(self):
+        waiter = rpc_amqp.multicall(test.CONF, self.context,
+                                    'compute.host1',
+                                    {'method': 'ping', 'args': {'arg': 1}},
+                                    None, self.pool)
+        [(topic, sent)] = FakeConnectionContext.sent
+        self.assertEqual('compute.host1', topic)
+        del FakeConnectionContext.sent[:]
+
+        self.fake_time.now += 0.03
+        msg = self._receive(sent)
+        self.assertNotIn(rpc_amqp.SEND_TIME, msg)
+        self.assertEqual([('ping', {'arg': 1})], self.proxy.dispatched)
+
+        for reply_q, reply in FakeConnectionContext.sent:
+            waiter.put(rpc_common.deserialize_msg(reply))
+        self.fake_time.now += 0.1
+        self.assertEqual(['pong'], list(waiter))
+
+        stats = rpc_stats.get_stats()
+        self.assertEqual({'<=50ms': 1},
+                         stats['queue']['compute']['ping']['buckets'])
+        self.assertEqual({'<=5ms': 1},
+                         stats['dispatch']['compute']['ping']['buckets'])
+        self.assertEqual({'<=200ms': 1},
+                         stats['client']['compute']['ping']['buckets'])
+
+    def test_cast(self):
+        rpc_amqp.cast(test.CONF, self.context, 'compute.host1',
+                      {'method': 'ping', 'args': {'arg': 1}}, self.pool)
+        [(topic, sent)] = FakeConnectionContext.sent
+
+        self.fake_time.now += 0.3
+        msg = self._receive(sent)
+        self.assertNotIn(rpc_amqp.SEND_TIME, msg)
+        self.assertEqual([('ping', {'arg': 1})], self.proxy.dispatched)
+
+        stats = rpc_stats.get_stats()
+        self.assertEqual({}, stats['client'])
+        self.assertEqual({'<=500ms': 1},
+                         stats['queue']['compute']['ping']['buckets'])
+        self.assertEqual({'<=5ms': 1},
+                         stats['dispatch']['compute']['ping']['buckets'])
+
+    def test_disabled(self):
+        self.flags(rpc_latency_stats=False)
+        waiter = rpc_amqp.multicall(test.CONF, self.context,
+                                    'compute.host1', {'method': 'ping'},
+                                    None, self.pool)
+        [(topic, sent)] = FakeConnectionContext.sent
+        del FakeConnectionContext.sent[:]
+        self.assertNotIn(rpc_amqp.SEND_TIME, rpc_common.deserialize_msg(sent))
+
+        self._receive(sent)
+        for reply_q, reply in FakeConnectionContext.sent:
+            waiter.put(rpc_common.deserialize_msg(reply))
+        self.assertEqual(['pong'], list(waiter))
+        self.assertEqual({'client': {}, 'queue': {}, 'dispatch': {}},
+                         rpc_stats.get_stats())
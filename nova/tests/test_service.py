@@ -22,7 +22,9 @@ Unit Tests for remote procedure calls using queue
 
 import sys
 import testtools
+import time
 
+import eventlet
 import mox
 from oslo.config import cfg
 
@@ -30,6 +32,7 @@ from nova import context
 from nova import db
 from nova import exception
 from nova import manager
+from nova.openstack.common.rpc import amqp as rpc_amqp
 from nova import service
 from nova import test
 from nova.tests import utils
@@ -51,6 +54,22 @@ CONF = cfg.CONF
 CONF.register_opts(test_service_opts)
 
 
+class FakeAMQPConnection(object):
+    """Consumes like the connections of the amqp rpc drivers."""
+
+    def __init__(self, conf, server_params=None):
+        self.conf = conf
+        self.proxy_callbacks = []
+
+    def create_consumer(self, topic, proxy, fanout=False):
+        self.proxy_callbacks.append(rpc_amqp.ProxyCallback(
+            self.conf, proxy, None, topic=topic))
+
+    def close(self):
+        for proxy_cb in self.proxy_callbacks:
+            proxy_cb.wait()
+
+
 class FakeManager(manager.Manager):
     """Fake manager for tests."""
     def test_method(self):
@@ -173,6 +192,66 @@ class ServiceTestCase(test.TestCase):
                                'nova.tests.test_service.FakeManager')
         serv.start()
 
+    def test_start_with_service_created_by_other_worker(self):
+        service_create = {'host': self.host,
+                          'binary': self.binary,
+                          'topic': self.topic,
+                          'report_count': 0}
+        service_ref = dict(service_create, id=1)
+
+        db.service_get_by_args(mox.IgnoreArg(),
+                self.host, self.binary).AndRaise(exception.NotFound())
+        db.service_create(mox.IgnoreArg(), service_create).AndRaise(
+                exception.ServiceBinaryExists(host=self.host,
+                                              binary=self.binary))
+        db.service_get_by_args(mox.IgnoreArg(),
+                self.host, self.binary).AndReturn(service_ref)
+        self.mox.ReplayAll()
+
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.start()
+        self.assertEqual(1, serv.service_id)
+        serv.stop()
+
+    def _service_with_request(self, seconds, done):
+        """Return a service whose connection is dispatching a request
+        that takes seconds to run.
+        """
+        serv = service.Service(self.host, self.binary, self.topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.conn = rpc_amqp.ConnectionContext(CONF,
+                rpc_amqp.Pool(CONF, FakeAMQPConnection), pooled=False)
+        serv.conn.create_consumer(self.topic, serv.manager)
+
+        def request():
+            eventlet.sleep(seconds)
+            done.append(True)
+        [proxy_cb] = serv.conn.proxy_callbacks
+        proxy_cb.pool.spawn_n(request)
+        return serv
+
+    def test_stop_waits_for_requests(self):
+        done = []
+        serv = self._service_with_request(0.1, done)
+        serv.stop()
+        self.assertEqual([True], done)
+
+    def test_stop_drain_timeout(self):
+        self.flags(service_drain_timeout=1)
+        self.mox.StubOutWithMock(service.LOG, 'warn')
+        service.LOG.warn(mox.IgnoreArg(), {'topic': self.topic,
+                                           'timeout': 1})
+        self.mox.ReplayAll()
+        done = []
+        serv = self._service_with_request(60, done)
+        began = time.time()
+        serv.stop()
+        self.assertTrue(time.time() - began < 10)
+        self.assertEqual([], done)
+
 
 class TestWSGIService(test.TestCase):
 
@@ -19,6 +19,7 @@ import datetime
 import functools
 import hashlib
 import importlib
+import multiprocessing
 import os
 import os.path
 import StringIO
@@ -466,6 +467,15 @@ class GenericUtilsTestCase(test.NoDBTestCase):
                           utils.get_shortened_ipv6_cidr,
                           "failure")
 
+    def test_cpu_count(self):
+        self.mox.StubOutWithMock(multiprocessing, 'cpu_count')
+        multiprocessing.cpu_count().AndReturn(8)
+        multiprocessing.cpu_count().AndRaise(NotImplementedError)
+        self.mox.ReplayAll()
+
+        self.assertEqual(8, utils.cpu_count())
+        self.assertEqual(1, utils.cpu_count())
+
 
 class MonkeyPatchTestCase(test.NoDBTestCase):
     """Unit test for utils.monkey_patch()."""
@@ -899,6 +899,9 @@ class Connection(object):
     def listDefinedDomains(self):
         return []
 
+    def listAllDomains(self, flags):
+        return self._vms.values()
+
     def listDevices(self, cap, flags):
         return []
 
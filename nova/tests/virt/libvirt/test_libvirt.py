@@ -1495,6 +1495,48 @@ class LibvirtConnTestCase(test.TestCase):
         # Only one should be listed, since domain with ID 0 must be skipped
         self.assertEquals(len(instances), 1)
 
+    def test_get_all_power_states(self):
+        domains = {1: FakeVirtDomain(uuidstr='fake-uuid-1'),
+                   'stopped': FakeVirtDomain(uuidstr='fake-uuid-2')}
+        self.stubs.Set(domains['stopped'], 'info',
+                       lambda: [libvirt_driver.VIR_DOMAIN_SHUTOFF, None,
+                                None, None, None])
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.lookupByID = domains.get
+        libvirt_driver.LibvirtDriver._conn.lookupByName = domains.get
+        libvirt_driver.LibvirtDriver._conn.numOfDomains = lambda: 2
+        libvirt_driver.LibvirtDriver._conn.listDomainsID = lambda: [0, 1]
+        libvirt_driver.LibvirtDriver._conn.listDefinedDomains = (
+            lambda: ['stopped'])
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.stubs.Set(conn, 'has_min_version', lambda version: False)
+        self.assertEqual({'fake-uuid-1': power_state.RUNNING,
+                          'fake-uuid-2': power_state.SHUTDOWN},
+                         conn.get_all_power_states())
+
+    def test_get_all_power_states_list_all_domains(self):
+        def fake_info():
+            raise libvirt.libvirtError("we deleted an instance!")
+
+        dom0 = FakeVirtDomain(uuidstr='dom0')
+        dom0.ID = lambda: 0
+        running = FakeVirtDomain(uuidstr='fake-uuid-1')
+        running.ID = lambda: 1
+        deleted = FakeVirtDomain(uuidstr='fake-uuid-2')
+        deleted.ID = lambda: -1
+        self.stubs.Set(deleted, 'info', fake_info)
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.listAllDomains(0).AndReturn(
+            [dom0, running, deleted])
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.stubs.Set(conn, 'has_min_version', lambda version: True)
+        self.assertEqual({'fake-uuid-1': power_state.RUNNING},
+                         conn.get_all_power_states())
+
     def test_list_defined_instances(self):
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByID = self.fake_lookup
@@ -3699,7 +3741,8 @@ class LibvirtConnTestCase(test.TestCase):
         self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
         db.instance_get_by_uuid(mox.IgnoreArg(), mox.IgnoreArg(),
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(instance)
         self.mox.StubOutWithMock(shutil, "rmtree")
         shutil.rmtree(os.path.join(CONF.instances_path,
@@ -3787,7 +3830,8 @@ class LibvirtConnTestCase(test.TestCase):
 
         db.instance_get_by_uuid(mox.IgnoreArg(), mox.IgnoreArg(),
                                 columns_to_join=['info_cache',
-                                                 'security_groups']
+                                                 'security_groups'],
+                                use_slave=False
                                 ).AndReturn(instance)
         os.path.exists(mox.IgnoreArg()).AndReturn(False)
         os.path.exists(mox.IgnoreArg()).AndReturn(True)
@@ -21,6 +21,7 @@ import sys
 import traceback
 
 from nova.compute import manager
+from nova.compute import power_state
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -233,6 +234,12 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
         num_instances = self.connection.get_num_instances()
         self.assertEqual(1, num_instances)
 
+    @catch_notimplementederror
+    def test_get_all_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        states = self.connection.get_all_power_states()
+        self.assertEqual({instance_ref['uuid']: power_state.RUNNING}, states)
+
     @catch_notimplementederror
     def test_snapshot_not_running(self):
         instance_ref = test_utils.get_test_instance()
@@ -24,6 +24,7 @@ import datetime
 import functools
 import hashlib
 import inspect
+import multiprocessing
 import os
 import pyclbr
 import random
@@ -801,6 +802,14 @@ def total_seconds(td):
                 td.microseconds) / 10.0 ** 6
 
 
+def cpu_count():
+    """Return the number of CPUs on this host, or 1 if it is unknown."""
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
 def sanitize_hostname(hostname):
     """Return a hostname which conforms to RFC-952 and RFC-1123 specs."""
     if isinstance(hostname, unicode):
@@ -155,6 +155,18 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_all_power_states(self):
+        """Return the power state of every instance on the host.
+
+        This lets the periodic power state sync check all the instances
+        of the host with a single call to the hypervisor, instead of one
+        get_info() call per instance.
+
+        :returns: a dict mapping the uuid of every instance known to the
+                  hypervisor to its power_state code
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
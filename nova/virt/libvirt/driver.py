@@ -287,6 +287,7 @@ MIN_LIBVIRT_VERSION = (0, 9, 6)
 MIN_LIBVIRT_HOST_CPU_VERSION = (0, 9, 10)
 MIN_LIBVIRT_CLOSE_CALLBACK_VERSION = (1, 0, 1)
 MIN_LIBVIRT_DEVICE_CALLBACK_VERSION = (1, 1, 1)
+MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION = (0, 9, 13)
 # Live snapshot requirements
 REQ_HYPERVISOR_LIVESNAPSHOT = "QEMU"
 MIN_LIBVIRT_LIVESNAPSHOT_VERSION = (1, 0, 0)
@@ -742,6 +743,41 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return list(uuids)
 
+    def _list_all_domains(self):
+        """Return the running and the defined domains, skipping dom0."""
+        if self.has_min_version(MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION):
+            # A single call returns all of them
+            return [domain for domain in self._conn.listAllDomains(0)
+                    if domain.ID() != 0]
+
+        domains = []
+        for domain_id in self.list_instance_ids():
+            try:
+                # We skip domains with ID 0 (hypervisors).
+                if domain_id != 0:
+                    domains.append(self._lookup_by_id(domain_id))
+            except exception.InstanceNotFound:
+                # Ignore deleted instance while listing
+                continue
+        for domain_name in self._conn.listDefinedDomains():
+            try:
+                domains.append(self._lookup_by_name(domain_name))
+            except exception.InstanceNotFound:
+                # Ignore deleted instance while listing
+                continue
+        return domains
+
+    def get_all_power_states(self):
+        states = {}
+        for domain in self._list_all_domains():
+            try:
+                state = LIBVIRT_POWER_STATE[domain.info()[0]]
+                states[domain.UUIDString()] = state
+            except libvirt.libvirtError:
+                # Ignore deleted instance while listing
+                continue
+        return states
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for vif in network_info:
@@ -17,6 +17,13 @@
 Pluggable Weighing support
 """
 
+import heapq
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nova import loadables
 
 
@@ -44,6 +51,19 @@ class BaseWeigher(object):
         """
         return 0.0
 
+    def _weigh_object_array(self, obj_list, weight_properties):
+        """Override in a subclass to weigh all objects at once.  Return a
+        numpy array holding the unscaled weight of each object of obj_list,
+        in order, or None if the weigher can only weigh objects one at a
+        time.  This is only called when numpy is available.
+        """
+        return None
+
+    def _object_attribute_array(self, obj_list, attr_name):
+        """Return a numpy array of an attribute of each object."""
+        return numpy.fromiter((getattr(obj, attr_name) for obj in obj_list),
+                              dtype=float, count=len(obj_list))
+
     def weigh_objects(self, weighed_obj_list, weight_properties):
         """Weigh multiple objects.  Override in a subclass if you need
         need access to all objects in order to manipulate weights.
@@ -56,16 +76,77 @@ class BaseWeigher(object):
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
+    def __init__(self, *args, **kwargs):
+        super(BaseWeightHandler, self).__init__(*args, **kwargs)
+        # { weigher class : weigher instance }
+        self._weighers = {}
+
+    def _get_weigher(self, weigher_cls):
+        """Return a long-lived instance of weigher_cls."""
+        weigher = self._weighers.get(weigher_cls)
+        if weigher is None:
+            weigher = weigher_cls()
+            self._weighers[weigher_cls] = weigher
+        return weigher
+
+    def _get_weights_array(self, weighers, obj_list, weighing_properties):
+        """Return a numpy array of the total weight of each object, or None
+        if numpy is missing or any of the weighers can't weigh arrays.
+        """
+        if numpy is None:
+            return None
+        weights = numpy.zeros(len(obj_list))
+        for weigher in weighers:
+            weigher_weights = weigher._weigh_object_array(obj_list,
+                                                          weighing_properties)
+            if weigher_weights is None:
+                return None
+            weights += weigher._weight_multiplier() * weigher_weights
+        return weights
+
     def get_weighed_objects(self, weigher_classes, obj_list,
-            weighing_properties):
-        """Return a sorted (highest score first) list of WeighedObjects."""
+            weighing_properties, limit=None):
+        """Return a sorted (highest score first) list of WeighedObjects.
+
+        If limit is set, only the 'limit' highest weighed objects are
+        returned.  When numpy is available and all the weighers can weigh
+        arrays of objects, weights are computed on arrays and the highest
+        weighed objects are found by partial selection.
+        """
 
         if not obj_list:
             return []
+        obj_list = list(obj_list)
+
+        weighers = [self._get_weigher(weigher_cls)
+                    for weigher_cls in weigher_classes]
+
+        weights = self._get_weights_array(weighers, obj_list,
+                                          weighing_properties)
+        if weights is not None:
+            # NOTE: Sort on the negated weights with a stable sort, so that
+            # objects of equal weight keep their order, like sorted() and
+            # heapq.nlargest() do.
+            neg_weights = -weights
+            if limit is not None and limit < len(obj_list):
+                # The partition picks arbitrarily among the objects tied
+                # with the last one kept, so keep all of them as candidates
+                # and break the ties on their index.
+                kth = numpy.partition(neg_weights, limit - 1)[limit - 1]
+                candidates = numpy.flatnonzero(neg_weights <= kth)
+                order = numpy.lexsort((candidates,
+                                       neg_weights[candidates]))[:limit]
+                indexes = candidates[order]
+            else:
+                indexes = numpy.argsort(neg_weights, kind='mergesort')
+            return [self.object_class(obj_list[i], float(weights[i]))
+                    for i in indexes]
 
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
-        for weigher_cls in weigher_classes:
-            weigher = weigher_cls()
+        for weigher in weighers:
             weigher.weigh_objects(weighed_objs, weighing_properties)
 
+        if limit is not None:
+            return heapq.nlargest(limit, weighed_objs,
+                                  key=lambda x: x.weight)
         return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Wire cost of saving an instance through nova-conductor.
+
+Builds an instance the way the compute manager holds one (info cache,
+security groups, metadata and system metadata loaded), changes one
+field and serializes the object_action() request, once in full and once
+in the compact form used with [conductor] compact_object_actions.  The
+conductor side of the save is emulated without a database, and the
+update map it would send back is serialized too.
+
+For each form the bytes of the request and of the reply are reported,
+with the time the client spends encoding the request and the time the
+conductor spends decoding it, saving and encoding the reply.
+
+Run like:
+
+    ./tools/conductor/object_save_bench.py --saves 1000
+"""
+import argparse
+import datetime
+import time
+import uuid
+
+from nova.conductor import manager
+from nova import context
+from nova.network import model as network_model
+from nova.objects import base
+from nova.objects import instance as instance_obj
+from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
+
+
+def fake_db_instance():
+    db_inst = {}
+    for field, typefn in instance_obj.Instance.fields.items():
+        if field in instance_obj.INSTANCE_OPTIONAL_ATTRS:
+            continue
+        try:
+            db_inst[field] = typefn(None)
+        except TypeError:
+            db_inst[field] = typefn()
+    db_inst.update(
+        id=1, uuid=str(uuid.uuid4()), deleted=0, cleaned=0,
+        user_id='bench-user', project_id='bench-project',
+        host='bench-host', node='bench-node', vm_state='active',
+        power_state=1, image_ref=str(uuid.uuid4()), hostname='bench',
+        display_name='bench', instance_type_id=1, memory_mb=2048,
+        vcpus=1, root_gb=20, created_at=datetime.datetime(2013, 10, 1),
+        launched_at=datetime.datetime(2013, 10, 1, 0, 1))
+    db_inst['metadata'] = [{'key': 'k%d' % i, 'value': 'v%d' % i}
+                           for i in range(5)]
+    sys_meta = dict(('instance_type_%s' % key, '1') for key in (
+        'memory_mb', 'root_gb', 'ephemeral_gb', 'name', 'id', 'flavorid',
+        'swap', 'rxtx_factor', 'vcpu_weight', 'vcpus'))
+    sys_meta.update(('image_%s' % key, 'value') for key in (
+        'base_image_ref', 'container_format', 'disk_format', 'min_disk',
+        'min_ram', 'kernel_id', 'ramdisk_id', 'os_type'))
+    db_inst['system_metadata'] = [{'key': k, 'value': v}
+                                  for k, v in sys_meta.items()]
+    vifs = network_model.NetworkInfo([network_model.VIF(
+        id=str(uuid.uuid4()), address='fa:16:3e:00:00:%02x' % i,
+        network=network_model.Network(
+            id=str(uuid.uuid4()), bridge='br100', label='net%d' % i,
+            subnets=[network_model.Subnet(
+                cidr='10.%d.0.0/24' % i,
+                ips=[network_model.FixedIP(address='10.%d.0.3' % i)],
+                gateway=network_model.IP(address='10.%d.0.1' % i))]))
+        for i in range(2)])
+    db_inst['info_cache'] = {'instance_uuid': db_inst['uuid'],
+                             'network_info': vifs.json(),
+                             'created_at': None, 'updated_at': None,
+                             'deleted_at': None, 'deleted': False}
+    db_inst['security_groups'] = [
+        {'id': i, 'name': 'secgroup-%d' % i, 'description': 'bench',
+         'user_id': 'bench-user', 'project_id': 'bench-project',
+         'created_at': None, 'updated_at': None, 'deleted_at': None,
+         'deleted': False}
+        for i in range(2)]
+    db_inst['pci_devices'] = []
+    return db_inst
+
+
+def fake_save(db_inst):
+    def save(self, context):
+        # What Instance.save() does, minus the database round trip.
+        expected_attrs = [attr for attr
+                          in instance_obj._INSTANCE_OPTIONAL_JOINED_FIELDS
+                          if self.obj_attr_is_set(attr)]
+        updated = dict(db_inst, updated_at=timeutils.utcnow())
+        for field, value in self.obj_get_changes().items():
+            if field not in expected_attrs:
+                updated[field] = value
+        self._from_db_object(context, self, updated, expected_attrs)
+    return save
+
+
+def run(serialize, saves, db_inst, ctxt, conductor):
+    inst = instance_obj.Instance._from_db_object(
+        ctxt, instance_obj.Instance(), db_inst,
+        instance_obj._INSTANCE_OPTIONAL_JOINED_FIELDS)
+    client_time = conductor_time = 0
+    for i in xrange(saves):
+        inst.task_state = 'bench-%d' % i
+        began = time.time()
+        request = jsonutils.dumps(serialize(inst))
+        client_time += time.time() - began
+        began = time.time()
+        objinst = base.NovaObject.obj_from_primitive(
+            jsonutils.loads(request), context=ctxt)
+        updates, result = conductor.object_action(ctxt, objinst, 'save',
+                                                  (), {})
+        reply = jsonutils.dumps(updates)
+        conductor_time += time.time() - began
+        inst.obj_reset_changes()
+    return (len(request), len(reply), client_time / saves,
+            conductor_time / saves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--saves', type=int, default=1000,
+                        help='number of saves per form')
+    args = parser.parse_args()
+
+    ctxt = context.get_admin_context()
+    db_inst = fake_db_instance()
+    instance_obj.Instance.save = fake_save(db_inst)
+    conductor = manager.ConductorManager()
+
+    for name, serialize in (('full', base.NovaObject.obj_to_primitive),
+                            ('compact',
+                             base.NovaObject.obj_to_compact_primitive)):
+        request, reply, client, server = run(serialize, args.saves, db_inst,
+                                             ctxt, conductor)
+        print ("%(name)-8s request=%(request)5d bytes  reply=%(reply)5d "
+               "bytes  client=%(client)6.1f usec/save  "
+               "conductor=%(server)6.1f usec/save" %
+               {'name': name, 'request': request, 'reply': reply,
+                'client': client * 1000000, 'server': server * 1000000})
+
+
+if __name__ == '__main__':
+    main()
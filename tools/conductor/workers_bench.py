@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Throughput of nova-conductor against its number of workers.
+
+Forks as many worker processes as [conductor] workers would, each one
+serving a conductor manager over the fake rpc driver, and has every
+worker take an equal share of instance saves through the conductor rpc
+API.  The saves are serialized, dispatched and applied as they would be
+by a real conductor; only the database round trip is left out (see
+object_save_bench.py).  The fake driver does not cross processes, so
+each worker drives its own conductor.
+
+The aggregate saves per second are reported for 1 up to --workers
+processes, which should scale with the number of CPUs.
+
+Run like:
+
+    ./tools/conductor/workers_bench.py --saves 4000 --workers 4
+"""
+import argparse
+import os
+import time
+
+from oslo.config import cfg
+
+from nova.conductor import manager
+from nova.conductor import rpcapi
+from nova import context
+from nova import objects
+from nova.objects import instance as instance_obj
+from nova.openstack.common import rpc
+from nova import utils
+
+import object_save_bench
+
+CONF = cfg.CONF
+CONF.import_opt('topic', 'nova.conductor.api', group='conductor')
+
+
+def worker(saves, db_inst):
+    ctxt = context.get_admin_context()
+    conn = rpc.create_connection(new=True)
+    conn.create_consumer(CONF.conductor.topic,
+                         manager.ConductorManager().create_rpc_dispatcher())
+    conductor = rpcapi.ConductorAPI()
+    inst = instance_obj.Instance._from_db_object(
+        ctxt, instance_obj.Instance(), db_inst,
+        instance_obj._INSTANCE_OPTIONAL_JOINED_FIELDS)
+    for i in xrange(saves):
+        inst.task_state = 'bench-%d' % i
+        updates, result = conductor.object_action(ctxt, inst, 'save', (),
+                                                  {})
+        inst.obj_reset_changes()
+    conn.close()
+
+
+def run(workers, saves, db_inst):
+    began = time.time()
+    pids = []
+    for i in xrange(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                worker(saves // workers, db_inst)
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+        pids.append(pid)
+    failed = 0
+    for pid in pids:
+        failed += os.waitpid(pid, 0)[1] != 0
+    elapsed = time.time() - began
+
+    print ("workers=%(workers)-3d %(rate)8.1f saves/s%(failed)s" %
+           {'workers': workers,
+            'rate': (saves // workers) * workers / elapsed,
+            'failed': ' (%d workers failed)' % failed if failed else ''})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--saves', type=int, default=4000,
+                        help='number of saves per run')
+    parser.add_argument('--workers', type=int, default=utils.cpu_count(),
+                        help='largest number of workers '
+                             '(default: number of CPUs)')
+    args = parser.parse_args()
+
+    objects.register_all()
+    CONF([], project='nova')
+    CONF.set_override('rpc_backend', 'nova.openstack.common.rpc.impl_fake')
+    db_inst = object_save_bench.fake_db_instance()
+    instance_obj.Instance.save = object_save_bench.fake_save(db_inst)
+
+    for workers in xrange(1, args.workers + 1):
+        run(workers, args.saves, db_inst)
+
+
+if __name__ == '__main__':
+    main()
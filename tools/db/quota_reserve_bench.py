@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Concurrency benchmark for the quota reservation engines.
+
+Simulates a burst of parallel boots in a single project: every boot
+reserves instances, cores and ram quota and then commits the
+reservation, as the API and the compute manager do.  The burst is run
+once per reservation engine and the reservations per second are
+reported.
+
+Point the script at a scratch database that has been synced with
+`nova-manage db sync`.  MySQL or PostgreSQL give meaningful numbers;
+SQLite serializes every writer.  The connection pool should be at least
+as large as the number of boots (see max_pool_size and max_overflow).
+
+Run like:
+
+    ./tools/db/quota_reserve_bench.py --config-file bench.conf --boots 100
+"""
+import argparse
+import sys
+import threading
+import time
+import uuid
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova import db
+from nova import exception
+from nova import quota
+
+CONF = cfg.CONF
+
+RAM_PER_BOOT = 512
+
+
+def boot(ctxt, start, latencies, refused):
+    start.wait()
+    began = time.time()
+    try:
+        reservations = quota.QUOTAS.reserve(ctxt, instances=1, cores=1,
+                                            ram=RAM_PER_BOOT)
+        quota.QUOTAS.commit(ctxt, reservations)
+    except exception.OverQuota:
+        refused.append(1)
+    latencies.append(time.time() - began)
+
+
+def run(engine, boots, shards):
+    CONF.set_override('quota_reservation_engine', engine)
+    CONF.set_override('quota_usage_shards', shards)
+
+    # Use a fresh project so that every run starts from empty usages,
+    # with quotas that fit the whole burst exactly.
+    project_id = 'quota-bench-%s' % uuid.uuid4().hex
+    admin = context.get_admin_context()
+    for resource, limit in (('instances', boots), ('cores', boots),
+                            ('ram', boots * RAM_PER_BOOT)):
+        db.quota_create(admin, project_id, resource, limit)
+    ctxt = context.RequestContext('quota-bench', project_id, is_admin=False)
+
+    # An established project already has its usage rows; create them
+    # up front so the burst measures reservations rather than refreshes.
+    quota.QUOTAS.rollback(ctxt, quota.QUOTAS.reserve(ctxt, instances=1,
+                                                     cores=1,
+                                                     ram=RAM_PER_BOOT))
+
+    start = threading.Event()
+    latencies = []
+    refused = []
+    threads = [threading.Thread(target=boot,
+                                args=(ctxt, start, latencies, refused))
+               for i in xrange(boots)]
+    for thread in threads:
+        thread.start()
+    began = time.time()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - began
+
+    usages = db.quota_usage_get_all_by_project(admin, project_id)
+    db.quota_destroy_all_by_project(admin, project_id)
+
+    latencies.sort()
+    print ("%(engine)-10s shards=%(shards)-3d boots=%(boots)-4d "
+           "%(rate)8.1f reservations/s  p50=%(p50).3fs p99=%(p99).3fs "
+           "refused=%(refused)d instances in_use=%(in_use)d" %
+           {'engine': engine, 'shards': shards, 'boots': boots,
+            'rate': boots / elapsed,
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1,
+                                 int(len(latencies) * 0.99))],
+            'refused': len(refused),
+            'in_use': usages['instances']['in_use']})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--boots', type=int, default=100,
+                        help='number of parallel boots per run')
+    parser.add_argument('--shards', type=int, default=4,
+                        help='usage shards for the optimistic engine')
+    parser.add_argument('--engine', choices=('locking', 'optimistic'),
+                        action='append',
+                        help='engine to benchmark, may be repeated '
+                             '(default: both)')
+    args, remaining = parser.parse_known_args()
+    config.parse_args([sys.argv[0]] + remaining)
+
+    for engine in args.engine or ('locking', 'optimistic'):
+        run(engine, args.boots, 1)
+        if engine == 'optimistic' and args.shards > 1:
+            run(engine, args.boots, args.shards)
+
+
+if __name__ == '__main__':
+    main()
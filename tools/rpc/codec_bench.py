@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Throughput of the rpc payload codecs.
+
+Builds the call a compute manager makes when it saves an instance
+through nova-conductor (an instance object with its info cache, security
+groups and metadata loaded) and runs it through serialize_msg() and
+deserialize_msg() with every codec this endpoint supports (see the
+rpc_codec option).  The envelope is also encoded to JSON, as the
+messaging libraries do before handing it to the broker.
+
+For each codec the bytes on the wire and the time spent encoding and
+decoding a message are reported.
+
+Run like:
+
+    ./tools/rpc/codec_bench.py --messages 1000
+"""
+import argparse
+import datetime
+import time
+import uuid
+
+from nova import context
+from nova.objects import instance as instance_obj
+from nova.openstack.common import jsonutils
+from nova.openstack.common.rpc import common as rpc_common
+
+
+def fake_instance():
+    db_inst = {}
+    for field, typefn in instance_obj.Instance.fields.items():
+        if field in instance_obj.INSTANCE_OPTIONAL_ATTRS:
+            continue
+        try:
+            db_inst[field] = typefn(None)
+        except TypeError:
+            db_inst[field] = typefn()
+    db_inst.update(
+        id=1, uuid=str(uuid.uuid4()), deleted=0, cleaned=0,
+        user_id='bench-user', project_id='bench-project',
+        host='bench-host', node='bench-node', vm_state='active',
+        power_state=1, image_ref=str(uuid.uuid4()), hostname='bench',
+        display_name='bench', instance_type_id=1, memory_mb=2048,
+        vcpus=1, root_gb=20, created_at=datetime.datetime(2013, 10, 1),
+        launched_at=datetime.datetime(2013, 10, 1, 0, 1))
+    db_inst['metadata'] = [{'key': 'k%d' % i, 'value': 'v%d' % i}
+                           for i in range(5)]
+    db_inst['system_metadata'] = [
+        {'key': 'instance_type_%s' % key, 'value': '1'} for key in (
+            'memory_mb', 'root_gb', 'ephemeral_gb', 'name', 'id',
+            'flavorid', 'swap', 'rxtx_factor', 'vcpu_weight', 'vcpus')]
+    db_inst['info_cache'] = {'instance_uuid': db_inst['uuid'],
+                             'network_info': '[]', 'created_at': None,
+                             'updated_at': None, 'deleted_at': None,
+                             'deleted': False}
+    db_inst['security_groups'] = [
+        {'id': i, 'name': 'secgroup-%d' % i, 'description': 'bench',
+         'user_id': 'bench-user', 'project_id': 'bench-project',
+         'created_at': None, 'updated_at': None, 'deleted_at': None,
+         'deleted': False}
+        for i in range(2)]
+    db_inst['pci_devices'] = []
+    return instance_obj.Instance._from_db_object(
+        context.get_admin_context(), instance_obj.Instance(), db_inst,
+        instance_obj._INSTANCE_OPTIONAL_JOINED_FIELDS)
+
+
+def run(codec, messages, raw_msg):
+    encode_time = decode_time = 0
+    for i in xrange(messages):
+        began = time.time()
+        data = jsonutils.dumps(rpc_common.serialize_msg(raw_msg, codec))
+        encode_time += time.time() - began
+        began = time.time()
+        rpc_common.deserialize_msg(jsonutils.loads(data))
+        decode_time += time.time() - began
+    return len(data), encode_time / messages, decode_time / messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--messages', type=int, default=1000,
+                        help='number of messages per codec')
+    args = parser.parse_args()
+
+    ctxt = context.get_admin_context()
+    raw_msg = {'method': 'object_action', 'namespace': None,
+               'version': '1.50',
+               'args': {'objinst': fake_instance().obj_to_primitive(),
+                        'objmethod': 'save', 'args': [], 'kwargs': {}},
+               '_msg_id': uuid.uuid4().hex, '_reply_q': 'reply_bench',
+               '_unique_id': uuid.uuid4().hex}
+    raw_msg.update(('_context_%s' % key, value)
+                   for key, value in ctxt.to_dict().items())
+
+    for codec in sorted(rpc_common._CODECS):
+        size, encode, decode = run(codec, args.messages, raw_msg)
+        print ("%(codec)-8s %(size)6d bytes  encode=%(encode)6.1f usec  "
+               "decode=%(decode)6.1f usec" %
+               {'codec': codec, 'size': size, 'encode': encode * 1000000,
+                'decode': decode * 1000000})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Show the rpc latency histograms of a running nova service.
+
+Asks the service on the given host (see the rpc_latency_stats option)
+for its histograms through the base rpc API and prints one line per
+kind, topic and method, the methods taking the most time in total first.
+Client lines are the calls the service made, queue and dispatch lines
+the messages it received.
+
+Run like:
+
+    ./tools/rpc/rpc_stats.py --config-file /etc/nova/nova.conf \\
+        --topic conductor --host controller1 --kind dispatch
+"""
+import argparse
+import sys
+
+from nova import baserpc
+from nova import config
+from nova import context
+from nova.openstack.common.rpc import stats as rpc_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--topic', required=True,
+                        help='topic of the service, for example conductor')
+    parser.add_argument('--host', required=True,
+                        help='host the service runs on')
+    parser.add_argument('--kind', choices=rpc_stats.KINDS, action='append',
+                        help='latency to show, may be repeated '
+                             '(default: all)')
+    args, remaining = parser.parse_known_args()
+    config.parse_args([sys.argv[0]] + remaining)
+
+    stats = baserpc.BaseAPI(args.topic).get_rpc_stats(
+        context.get_admin_context(), args.host)
+
+    rows = []
+    for kind in args.kind or rpc_stats.KINDS:
+        for topic, methods in stats.get(kind, {}).iteritems():
+            for method, histogram in methods.iteritems():
+                rows.append((histogram['count'] * histogram['mean_ms'],
+                             kind, topic, method, histogram))
+    rows.sort(reverse=True)
+
+    print ('%-8s %-12s %-40s %8s %9s %9s %9s %9s %9s' %
+           ('kind', 'topic', 'method', 'count', 'mean_ms', 'p50_ms',
+            'p90_ms', 'p99_ms', 'max_ms'))
+    for total, kind, topic, method, histogram in rows:
+        print ('%-8s %-12s %-40s %8d %9.1f %9.1f %9.1f %9.1f %9.1f' %
+               (kind, topic, method, histogram['count'],
+                histogram['mean_ms'], histogram['p50_ms'],
+                histogram['p90_ms'], histogram['p99_ms'],
+                histogram['max_ms']))
+
+
+if __name__ == '__main__':
+    main()
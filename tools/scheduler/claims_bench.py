@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Throughput of the filter scheduler against its number of workers.
+
+Creates --hosts compute nodes, then forks as many scheduler processes as
+scheduler_workers would, each one with its own filter scheduler and host
+manager, and has every worker take an equal share of single instance
+scheduling decisions.  scheduler_optimistic_claims is enabled, so every
+decision claims the chosen compute node in the database and the workers
+race for the same nodes as separate nova-scheduler processes would.
+
+The aggregate decisions per second and the claim conflicts, i.e. the
+claims that lost the race and had to choose another host, are reported
+for 1 up to --workers processes.  Fewer hosts make conflicts more likely.
+
+Point the script at a scratch database that has been synced with
+`nova-manage db sync` and holds no other compute nodes.  MySQL or
+PostgreSQL give meaningful numbers; SQLite serializes every writer.
+
+Run like:
+
+    ./tools/scheduler/claims_bench.py --config-file bench.conf \\
+        --decisions 1000 --workers 4 --hosts 10
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova import db
+from nova.scheduler import filter_scheduler
+from nova import utils
+
+CONF = cfg.CONF
+CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
+
+# Enough for every decision of a run to fit on any single host.
+HOST_VCPUS = 100000
+HOST_MEMORY_MB = HOST_VCPUS * 512
+HOST_DISK_GB = HOST_VCPUS * 10
+
+INSTANCE_TYPE = {'memory_mb': 512, 'root_gb': 10, 'ephemeral_gb': 0,
+                 'vcpus': 1, 'swap': 0, 'extra_specs': {}}
+
+
+def create_hosts(ctxt, hosts):
+    prefix = 'claims-bench-%s' % uuid.uuid4().hex[:8]
+    created = []
+    for i in xrange(hosts):
+        service = db.service_create(ctxt, {'host': '%s-%d' % (prefix, i),
+                                           'binary': 'nova-compute',
+                                           'topic': CONF.compute_topic,
+                                           'report_count': 0,
+                                           'disabled': False})
+        node = db.compute_node_create(ctxt, {
+            'service_id': service['id'],
+            'vcpus': HOST_VCPUS, 'memory_mb': HOST_MEMORY_MB,
+            'local_gb': HOST_DISK_GB, 'vcpus_used': 0,
+            'memory_mb_used': 0, 'local_gb_used': 0,
+            'free_ram_mb': HOST_MEMORY_MB, 'free_disk_gb': HOST_DISK_GB,
+            'disk_available_least': HOST_DISK_GB,
+            'hypervisor_type': 'fake', 'hypervisor_version': 1,
+            'hypervisor_hostname': service['host'], 'cpu_info': '',
+            'running_vms': 0, 'current_workload': 0,
+            'host_ip': '127.0.0.1', 'supported_instances': '',
+            'pci_stats': ''})
+        created.append((service, node))
+    return created
+
+
+def destroy_hosts(ctxt, created):
+    for service, node in created:
+        db.compute_node_delete(ctxt, node['id'])
+        db.service_destroy(ctxt, service['id'])
+
+
+def worker(decisions, output):
+    ctxt = context.get_admin_context()
+    sched = filter_scheduler.FilterScheduler()
+    for i in xrange(decisions):
+        instance_uuid = str(uuid.uuid4())
+        instance_properties = dict(INSTANCE_TYPE, project_id='claims-bench',
+                                   os_type='linux')
+        request_spec = {'instance_properties': instance_properties,
+                        'instance_type': INSTANCE_TYPE,
+                        'image': {}, 'num_instances': 1,
+                        'instance_uuids': [instance_uuid]}
+        sched._schedule(ctxt, request_spec, {}, [instance_uuid])
+    stats = sched.get_stats()
+    os.write(output, '%d %d\n' % (stats['failed_decisions'],
+                                  stats['claim_conflicts']))
+
+
+def run(workers, decisions):
+    began = time.time()
+    children = []
+    for i in xrange(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                os.close(read_fd)
+                worker(decisions // workers, write_fd)
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+    failed_workers = failed = conflicts = 0
+    for pid, read_fd in children:
+        result = os.fdopen(read_fd).read()
+        failed_workers += os.waitpid(pid, 0)[1] != 0
+        if result:
+            worker_failed, worker_conflicts = map(int, result.split())
+            failed += worker_failed
+            conflicts += worker_conflicts
+    elapsed = time.time() - began
+
+    done = (decisions // workers) * (workers - failed_workers)
+    print ("workers=%(workers)-3d %(rate)8.1f decisions/s  "
+           "claim_conflicts=%(conflicts)d (%(per_decision).2f per decision) "
+           "failed=%(failed)d%(failed_workers)s" %
+           {'workers': workers, 'rate': done / elapsed,
+            'conflicts': conflicts,
+            'per_decision': float(conflicts) / done if done else 0.0,
+            'failed': failed,
+            'failed_workers': (' (%d workers failed)' % failed_workers
+                               if failed_workers else '')})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--decisions', type=int, default=1000,
+                        help='number of scheduling decisions per run')
+    parser.add_argument('--workers', type=int, default=utils.cpu_count(),
+                        help='largest number of workers '
+                             '(default: number of CPUs)')
+    parser.add_argument('--hosts', type=int, default=10,
+                        help='number of compute nodes to schedule on')
+    args, remaining = parser.parse_known_args()
+    config.parse_args([sys.argv[0]] + remaining)
+    CONF.set_override('scheduler_optimistic_claims', True)
+
+    ctxt = context.get_admin_context()
+    created = create_hosts(ctxt, args.hosts)
+    try:
+        for workers in xrange(1, args.workers + 1):
+            run(workers, args.decisions)
+    finally:
+        destroy_hosts(ctxt, created)
+
+
+if __name__ == '__main__':
+    main()